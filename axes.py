@@ -1,7 +1,39 @@
-from zaber_motion import Units, wait_all
-from zaber_motion.ascii import Axis, Connection, Device, Lockstep
+from zaber_motion import Measurement, Units, wait_all
+from zaber_motion.ascii import Axis, Connection, Device, Lockstep, TriggerAction, TriggerCondition
+from zaber_motion.ascii import StreamAxisDefinition, StreamAxisType
 from typing import List
 import asyncio
+import threading
+import time
+from contextlib import contextmanager
+from lux4600.tracing import TRACER
+
+STREAM = 1 # stream number used for layer paths
+TRAVEL_VELOCITY = 10 # mm/s, velocity of path segments without one, e.g. the lateral increments
+
+
+def serpentine_path(distance:float, velocity:float, lateral_increment:float, strips:int=2,
+                    return_velocity:float=None, return_to_start:bool=True) -> list[tuple[float, float, float]]:
+    '''
+    Plan the motion of a layer: scroll each strip forward and back, stepping X between strips.
+    Units are in mm, or mm/s.
+
+    Returns:
+        list: Relative moves (x, y, velocity). velocity is None for travel moves, see TRAVEL_VELOCITY.
+    '''
+    path = []
+
+    for strip in range(strips):
+        if strip:
+            path.append((lateral_increment, 0, None))
+        path.append((0, distance, velocity))
+        path.append((0, -distance, return_velocity or velocity))
+
+    if return_to_start and strips > 1:
+        path.append((-lateral_increment * (strips - 1), 0, None))
+
+    return path
+
 
 class ZaberAxes():
     """
@@ -107,6 +139,7 @@ class ZaberAxes():
 
         return axis.get_position(Units.LENGTH_MILLIMETRES)
 
+    @TRACER.traced("axes.home", category="axes")
     def home(self):
         """
         Home all axes.
@@ -124,16 +157,92 @@ class ZaberAxes():
 
         return
     
-    def scroll(self, distance:int, velocity:int):
+    @TRACER.traced("axes.scroll", category="axes")
+    def scroll(self, distance:int, velocity:int, wait:bool=True):
         '''
         Scroll the axes by a given distance at a given velocity.
         Units are in mm, or mm/s.
+        With wait=False the move is started and the call returns, see wait_scroll.
         '''
-        self.YAxis.move_relative(distance, Units.LENGTH_MILLIMETRES, True,
+        self.YAxis.move_relative(distance, Units.LENGTH_MILLIMETRES, wait,
                                 velocity, Units.VELOCITY_MILLIMETRES_PER_SECOND)
 
         return
+
+    @TRACER.traced("axes.wait_scroll", category="axes")
+    def wait_scroll(self):
+        '''
+        Wait until a scroll started with wait=False has finished.
+        '''
+        self.YAxis.wait_until_idle()
+        return
+
+    def arm_start_trigger(self, output:int=1, trigger:int=1):
+        '''
+        Raise a digital output of the Y axis controller as soon as the Y axis starts moving.
+        Wire the output to the electrical sync input of the projector to start the sequencer
+        with the scroll (see lux4600.coordinator).
+        '''
+        device = self.YAxis.device
+        axis = self.YAxis.get_axis_numbers()[0]
+        position = device.get_axis(axis).get_position() # native units
+
+        device.generic_command(f"io set do {output} 0")
+
+        start = device.triggers.get_trigger(trigger)
+        start.fire_when_setting(axis, "pos", TriggerCondition.NE, position)
+        start.on_fire(TriggerAction.A, 0, f"io set do {output} 1")
+        start.enable(1) # Fire once
+
+        return
+
+    def disarm_start_trigger(self, output:int=1, trigger:int=1):
+        '''
+        Disable the start trigger and lower its digital output.
+        '''
+        device = self.YAxis.device
+        device.triggers.get_trigger(trigger).disable()
+        device.generic_command(f"io set do {output} 0")
+
+        return
     
+    @TRACER.traced("axes.stream_path", category="axes")
+    def stream_path(self, path:list[tuple[float, float, float]], travel_velocity:float=TRAVEL_VELOCITY, wait:bool=True):
+        '''
+        Run a path of relative X/Y moves (see serpentine_path) as one stream on the controller.
+        The moves are queued at once, so the controller runs them back to back without a host round trip
+        between segments. Y is streamed as its lockstep group.
+        Units are in mm, or mm/s.
+        With wait=False the call returns once the path is queued, see wait_path.
+        '''
+        device = self.YAxis.device
+
+        self.stream = device.streams.get_stream(STREAM)
+        self.stream.setup_live_composite(
+            StreamAxisDefinition(self.YAxis.lockstep_group_id, StreamAxisType.LOCKSTEP),
+            StreamAxisDefinition(self.XAxis.axis_number, StreamAxisType.PHYSICAL),
+        )
+
+        self.stream.cork() # Send the whole path before the controller starts it
+        for x, y, velocity in path:
+            self.stream.set_max_speed(velocity or travel_velocity, Units.VELOCITY_MILLIMETRES_PER_SECOND)
+            self.stream.line_relative(Measurement(y, Units.LENGTH_MILLIMETRES), Measurement(x, Units.LENGTH_MILLIMETRES))
+        self.stream.uncork()
+
+        if wait:
+            self.wait_path()
+
+        return
+
+    def wait_path(self):
+        '''
+        Wait until a path started with stream_path has finished and release the stream.
+        '''
+        self.stream.wait_until_idle()
+        self.stream.disable()
+        return
+
+    @TRACER.traced("axes.increment_layer", category="axes")
     def increment_layer(self, layer_height:int):
         ''''
         Increment the Z axis by a given layer height.
@@ -144,6 +253,7 @@ class ZaberAxes():
         self.ZAxis.move_relative(-layer_height, Units.LENGTH_MILLIMETRES, True, 0.5, Units.VELOCITY_MILLIMETRES_PER_SECOND)
         return
     
+    @TRACER.traced("axes.increment_lateral", category="axes")
     def increment_lateral(self, distance:int):
         '''
         Increment the X axis by a given distance.
@@ -152,6 +262,7 @@ class ZaberAxes():
         self.XAxis.move_relative(distance, Units.LENGTH_MILLIMETRES)
         return
     
+    @TRACER.traced("axes.to_point", category="axes")
     def to_point(self, x:int, y:int, z:int):
         '''
         Move the axes to a given point asynchronously.
@@ -165,6 +276,7 @@ class ZaberAxes():
 
         return
     
+    @TRACER.traced("axes.park", category="axes")
     def park(self):
         '''
         Park all axes in preperation for powering off.
@@ -176,9 +288,444 @@ class ZaberAxes():
         )
         
         return
-    
-    
 
-    
 
-    
\ No newline at end of file
+class MockAxes():
+    """
+    Stand-in for ZaberAxes without hardware, for testing print scripts.
+
+    Moves complete instantly. Positions are tracked per axis, and every command that would be a
+    host round trip to the controller is logged.
+
+    Attributes:
+        positions (dict): The position of each axis ('X', 'Y', 'Z', 'M') in millimetres.
+        commands (list): The commands sent, e.g. ("scroll", 23.2, 1.8) or ("stream_path", 5).
+        connectionStatus (bool): Always True.
+    """
+
+    def __init__(self, COMPort:str=None, positions:dict=None):
+
+        self.COMPort = COMPort
+        self.connectionStatus = True
+        self.positions = {"X": 0.0, "Y": 0.0, "Z": 0.0, "M": 0.0}
+        self.positions.update(positions or {})
+        self.commands = []
+        self.trigger_armed = False
+
+    def getPositions(self):
+        return dict(self.positions)
+
+    def get_position(self, axis_name:str) -> float:
+        return self.positions[axis_name]
+
+    def home(self):
+        self.commands.append(("home",))
+        self.positions.update(X=0.0, Y=0.0, Z=0.0)
+
+    def scroll(self, distance:float, velocity:float, wait:bool=True):
+        self.commands.append(("scroll", distance, velocity))
+        self.positions["Y"] += distance
+
+    def wait_scroll(self):
+        return
+
+    def stream_path(self, path:list[tuple[float, float, float]], travel_velocity:float=TRAVEL_VELOCITY, wait:bool=True):
+        self.commands.append(("stream_path", len(path)))
+        for x, y, _ in path:
+            self.positions["X"] += x
+            self.positions["Y"] += y
+
+    def wait_path(self):
+        return
+
+    def increment_layer(self, layer_height:float):
+        self.commands.append(("increment_layer", layer_height))
+        self.positions["Z"] -= layer_height
+
+    def increment_lateral(self, distance:float):
+        self.commands.append(("increment_lateral", distance))
+        self.positions["X"] += distance
+
+    def to_point(self, x:float, y:float, z:float):
+        self.commands.append(("to_point", x, y, z))
+        self.positions.update(X=x, Y=y, Z=z)
+
+    def park(self):
+        self.commands.append(("park",))
+
+    def arm_start_trigger(self, output:int=1, trigger:int=1):
+        self.commands.append(("arm_start_trigger",))
+        self.trigger_armed = True
+
+    def disarm_start_trigger(self, output:int=1, trigger:int=1):
+        self.commands.append(("disarm_start_trigger",))
+        self.trigger_armed = False
+
+
+class Kinematics():
+    """
+    Trapezoidal velocity profile of an axis: a move accelerates to its velocity, cruises and decelerates to a stop.
+    Moves too short to reach their velocity have a triangular profile.
+
+    Attributes:
+        max_velocity (float): The velocity limit in mm/s, also the velocity of moves without one.
+        acceleration (float): The acceleration and deceleration in mm/s².
+    """
+
+    def __init__(self, max_velocity:float, acceleration:float):
+
+        self.max_velocity = max_velocity
+        self.acceleration = acceleration
+
+    @staticmethod
+    def lockstep(*kinematics:"Kinematics") -> "Kinematics":
+        '''
+        The profile of axes in lockstep, limited by the slowest of them.
+        '''
+        return Kinematics(min(k.max_velocity for k in kinematics), min(k.acceleration for k in kinematics))
+
+    def _profile(self, distance:float, velocity:float=None) -> tuple[float, float, float]:
+        # The peak velocity, the time to reach it and the duration of a move of a positive distance
+        velocity = min(velocity or self.max_velocity, self.max_velocity)
+        peak = min(velocity, (distance * self.acceleration) ** 0.5)
+        ramp = peak / self.acceleration
+
+        return peak, ramp, 2 * ramp + (distance - peak * ramp) / peak
+
+    def duration(self, distance:float, velocity:float=None) -> float:
+        '''
+        The duration of a move in seconds.
+        Units are in mm, or mm/s.
+        '''
+        if not distance:
+            return 0.0
+        return self._profile(abs(distance), velocity)[2]
+
+    def travelled(self, distance:float, velocity:float, t:float) -> float:
+        '''
+        The distance covered t seconds into a move of a positive distance.
+        '''
+        if not distance or t <= 0:
+            return 0.0
+
+        peak, ramp, duration = self._profile(distance, velocity)
+        a = self.acceleration
+
+        if t >= duration:
+            return distance
+        if t < ramp:
+            return a * t * t / 2
+        if t < duration - ramp:
+            return a * ramp * ramp / 2 + peak * (t - ramp)
+        return distance - a * (duration - t) ** 2 / 2
+
+
+# Kinematics of the stages. Estimates, measure the settings of the controllers (maxspeed, accel) to refine them.
+KINEMATICS = {
+    "X": Kinematics(40, 200),
+    "Y": Kinematics.lockstep(Kinematics(40, 200), Kinematics(40, 200)),
+    "Z": Kinematics(10, 50),
+    "M": Kinematics(100, 500),
+}
+
+
+class VirtualClock():
+    """
+    The time of a simulated print: the real time since it started plus the time skipped by moves.
+
+    Moves wait on the clock instead of the hardware. Time is skipped discrete-event style: only while every
+    participant is blocked on the clock, up to the earliest time one of them waits for. With speed 0 it is
+    skipped at once, otherwise it passes speed times faster than real time, e.g. 1 runs at the speed of the
+    real print. Time spent on the host, e.g. preprocessing or uploads to a simulated projector, counts at its
+    real duration, and moves waited for meanwhile overlap with it.
+
+    Threads doing host work next to moves of other threads count as participants while they run, see participant.
+    scheduler.LayerScheduler counts its stages. A single script needs none: its waits always skip time.
+    """
+
+    GRACE = 0.002 # seconds every participant must stay blocked before time is skipped, covers hand-offs between them
+
+    def __init__(self, speed:float=0.0):
+
+        self.speed = speed
+        self.start = time.perf_counter()
+        self.skipped = 0.0
+        self.running = 0 # participants not blocked on the clock
+        self.waiters = {} # simulated time waited for, by waiter
+        self.changed = 0.0 # real time a participant last started or finished
+        self.advancing = False
+        self.condition = threading.Condition()
+
+    def _now(self) -> float:
+        return time.perf_counter() - self.start + self.skipped
+
+    def now(self) -> float:
+        '''
+        Seconds since the start of the simulated print.
+        '''
+        with self.condition:
+            return self._now()
+
+    @contextmanager
+    def participant(self):
+        '''
+        Count the caller as a participant for the block: time is not skipped while it runs outside wait_until.
+        '''
+        with self.condition:
+            self.running += 1
+            self.changed = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.running -= 1
+                self.changed = time.perf_counter()
+                self.condition.notify_all()
+
+    def _release(self, now:float):
+        # Waiters whose time has come run again, before any other waiter can skip further
+        for waiter, t in list(self.waiters.items()):
+            if t <= now:
+                del self.waiters[waiter]
+                self.running += 1
+        self.condition.notify_all()
+
+    def _advance(self, now:float):
+        # Every participant is blocked: pass the time up to the earliest waiter
+        step = min(self.waiters.values()) - now
+
+        if not self.speed:
+            self.skipped += step
+            return
+
+        self.advancing = True
+        before = time.perf_counter()
+        self.condition.wait(step / self.speed) # Woken early by a participant starting
+        after = min(time.perf_counter(), self.changed) if self.changed > before else time.perf_counter()
+        self.skipped += min((after - before) * self.speed, step) - (after - before)
+        self.advancing = False
+
+    def wait_until(self, t:float):
+        '''
+        Wait until the simulated time t.
+        '''
+        with self.condition:
+            if self._now() >= t:
+                return
+
+            waiter = object()
+            self.waiters[waiter] = t
+            self.running -= 1
+
+            while waiter in self.waiters:
+                now = self._now()
+                quiet = time.perf_counter() - self.changed
+
+                if now >= t:
+                    self._release(now)
+                elif self.running > 0 or self.advancing:
+                    self.condition.wait(t - now) # Host work runs in real time
+                elif quiet < self.GRACE:
+                    self.condition.wait(self.GRACE - quiet)
+                else:
+                    self._advance(now)
+                    self._release(self._now())
+
+
+class _Move():
+    # A straight move, possibly one axis of a composite move: the axis covers distance while the path covers length
+
+    def __init__(self, start:float, position:float, distance:float, kinematics:Kinematics,
+                 length:float=None, velocity:float=None):
+
+        self.start = start
+        self.position = position
+        self.distance = distance
+        self.kinematics = kinematics
+        self.length = abs(distance) if length is None else length
+        self.velocity = velocity
+        self.end = start + kinematics.duration(self.length, velocity)
+
+    def position_at(self, t:float) -> float:
+        if not self.length:
+            return self.position
+        return self.position + self.distance * self.kinematics.travelled(self.length, self.velocity, t - self.start) / self.length
+
+
+class VirtualAxis():
+    """
+    Simulated axis with the part of the zaber_motion Axis interface used by the print scripts.
+    Units arguments are accepted for compatibility and taken to be mm, mm/s and mm/s².
+
+    Moves sent while the axis is busy start when the queued ones have finished.
+    """
+
+    def __init__(self, name:str, kinematics:Kinematics, clock:VirtualClock, position:float=0.0):
+
+        self.name = name
+        self.kinematics = kinematics
+        self.clock = clock
+        self.moves:list[_Move] = []
+        self.position = position # at the end of the last move
+        self.lock = threading.Lock()
+
+    @property
+    def end(self) -> float:
+        '''
+        The simulated time the queued moves finish.
+        '''
+        with self.lock:
+            return self.moves[-1].end if self.moves else 0.0
+
+    def queue(self, distance:float, velocity:float=None, start:float=None, length:float=None,
+              kinematics:Kinematics=None) -> _Move:
+        '''
+        Queue a relative move without waiting. A composite move passes the start, path length and profile shared
+        by its axes.
+        '''
+        with self.lock:
+            now = self.clock.now()
+            self.moves = [move for move in self.moves if move.end > now]
+            start = max(now if start is None else start, self.moves[-1].end if self.moves else now)
+
+            move = _Move(start, self.position, distance, kinematics or self.kinematics, length, velocity)
+            self.moves.append(move)
+            self.position += distance
+
+            return move
+
+    def get_position(self, unit=None) -> float:
+        now = self.clock.now()
+
+        with self.lock:
+            for move in self.moves:
+                if now < move.end:
+                    return move.position_at(now)
+            return self.position
+
+    def is_busy(self) -> bool:
+        return self.end > self.clock.now()
+
+    def wait_until_idle(self, throw_error_on_fault:bool=True):
+        self.clock.wait_until(self.end)
+
+    def move_relative(self, position:float, unit=None, wait_until_idle:bool=True, velocity:float=0,
+                      velocity_unit=None, acceleration:float=0, acceleration_unit=None):
+        kinematics = Kinematics(self.kinematics.max_velocity, acceleration) if acceleration else None
+        self.queue(position, velocity or None, kinematics=kinematics)
+
+        if wait_until_idle:
+            self.wait_until_idle()
+
+    def move_absolute(self, position:float, unit=None, wait_until_idle:bool=True, velocity:float=0,
+                      velocity_unit=None, acceleration:float=0, acceleration_unit=None):
+        with self.lock:
+            target = position - self.position
+        self.move_relative(target, unit, wait_until_idle, velocity, velocity_unit, acceleration, acceleration_unit)
+
+    def home(self, wait_until_idle:bool=True):
+        self.move_absolute(0, wait_until_idle=wait_until_idle)
+
+    def park(self):
+        return
+
+
+class VirtualAxes():
+    """
+    Drop-in replacement for ZaberAxes without hardware, timing every move with a kinematic model.
+
+    Moves take the time of their trapezoidal velocity profile (see Kinematics) on a VirtualClock, so a print
+    script runs in simulated or accelerated time and clock.now() predicts its duration. Combined with
+    lux4600.simulator.ProjectorSimulator, whose uploads count at their real duration, it predicts a whole job.
+    Positions follow the profile over time. Y is the lockstep group, limited by the slower of its drives.
+
+    Attributes:
+        XAxis, YAxis, ZAxis, MAxis (VirtualAxis): The axes, with move_absolute, move_relative and get_position.
+        clock (VirtualClock): The simulated time.
+        connectionStatus (bool): Always True.
+    """
+
+    def __init__(self, COMPort:str=None, positions:dict=None, kinematics:dict=None, speed:float=0.0,
+                 clock:VirtualClock=None):
+        """
+        Args:
+            COMPort (str): Unused, for compatibility with ZaberAxes.
+            positions (dict): Initial positions by axis name ('X', 'Y', 'Z', 'M') in mm.
+            kinematics (dict): Kinematics by axis name, replacing those of KINEMATICS.
+            speed (float): Speed of the clock, 0 to skip the time of moves, see VirtualClock.
+            clock (VirtualClock): A clock shared with other simulated devices, replaces speed.
+        """
+        self.COMPort = COMPort
+        self.connectionStatus = True
+        self.clock = clock or VirtualClock(speed)
+        self.trigger_armed = False
+
+        kinematics = dict(KINEMATICS, **(kinematics or {}))
+        positions = positions or {}
+
+        for name in ("X", "Y", "Z", "M"):
+            setattr(self, f"{name}Axis", VirtualAxis(name, kinematics[name], self.clock, positions.get(name, 0.0)))
+
+        self.axes:List[VirtualAxis] = [self.XAxis, self.YAxis, self.ZAxis] # excludes M Axis
+
+    def getPositions(self):
+        return {name: self.get_position(name) for name in ("X", "Y", "Z", "M")}
+
+    def get_position(self, axis_name:str) -> float:
+        return getattr(self, f"{axis_name}Axis").get_position()
+
+    def _wait(self, *axes:VirtualAxis):
+        self.clock.wait_until(max(axis.end for axis in axes))
+
+    def home(self):
+        for axis in self.axes:
+            axis.home(wait_until_idle=False)
+        self._wait(*self.axes)
+
+    def scroll(self, distance:float, velocity:float, wait:bool=True):
+        self.YAxis.move_relative(distance, wait_until_idle=wait, velocity=velocity)
+
+    def wait_scroll(self):
+        self.YAxis.wait_until_idle()
+
+    def stream_path(self, path:list[tuple[float, float, float]], travel_velocity:float=TRAVEL_VELOCITY, wait:bool=True):
+        '''
+        Run a path of relative X/Y moves like ZaberAxes.stream_path. Each segment is a straight line of both axes
+        from stop to stop, limited by the slower acceleration of the two.
+        '''
+        kinematics = Kinematics(max(self.XAxis.kinematics.max_velocity, self.YAxis.kinematics.max_velocity),
+                                min(self.XAxis.kinematics.acceleration, self.YAxis.kinematics.acceleration))
+        start = max(self.XAxis.end, self.YAxis.end, self.clock.now())
+
+        for x, y, velocity in path:
+            length = (x * x + y * y) ** 0.5
+            velocity = min(velocity or travel_velocity,
+                           *(axis.kinematics.max_velocity * length / abs(d) for axis, d in ((self.XAxis, x), (self.YAxis, y)) if d))
+            self.XAxis.queue(x, velocity, start, length, kinematics)
+            start = self.YAxis.queue(y, velocity, start, length, kinematics).end
+
+        if wait:
+            self.wait_path()
+
+    def wait_path(self):
+        self._wait(self.XAxis, self.YAxis)
+
+    def increment_layer(self, layer_height:float):
+        self.ZAxis.move_relative(-layer_height, velocity=0.5) # The speed of ZaberAxes.increment_layer
+
+    def increment_lateral(self, distance:float):
+        self.XAxis.move_relative(distance)
+
+    def to_point(self, x:float, y:float, z:float):
+        for axis, position in ((self.XAxis, x), (self.YAxis, y), (self.ZAxis, z)):
+            axis.move_absolute(position, wait_until_idle=False)
+        self._wait(*self.axes)
+
+    def park(self):
+        return
+
+    def arm_start_trigger(self, output:int=1, trigger:int=1):
+        self.trigger_armed = True
+
+    def disarm_start_trigger(self, output:int=1, trigger:int=1):
+        self.trigger_armed = False
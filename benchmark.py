@@ -0,0 +1,197 @@
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import numpy as np
+from PIL import Image
+from lux4600 import records
+from lux4600.img import Strip
+from lux4600.seq import Sequencer
+from lux4600.rle import encode_rle_image_type5
+from lux4600.grayscale import multiply_image, stitch_images, blend_overlap
+
+#
+# Benchmarks of the hot paths of an upload: grayscale preprocessing, packetizing, RLE encoding,
+# sequence file packets and control record encoding/decoding.
+# Results are saved as JSON and compared against a saved baseline, e.g.
+#
+#   python benchmark.py --save benchmark_baseline.json            (before a change)
+#   python benchmark.py --baseline benchmark_baseline.json        (after it, exits 1 on a regression)
+#
+
+ROWS = (1080, 3240, 4320, 20000) # Image heights: one DMD frame, the dogbone part, the full 4320 rows, a tall scroll
+FACTORS = (4, 6, 10) # Grayscale multiplication factors
+WIDTH = 1920
+OVERLAP = 960
+LINES_PER_PACKET = 6
+SEQUENCE_FILE_BYTES = 20 * 1440 # The largest sequence file: 20 packages
+RECORDS_PER_RUN = 10000
+
+
+def part_image(rows:int, width:int=WIDTH) -> Image.Image:
+    '''A grayscale test part: a radial gradient disk over the full height, black around it.'''
+
+    y, x = np.ogrid[:rows, :width]
+    radius = np.hypot((x - width / 2) / (width / 2), (y - rows / 2) / (rows / 2))
+    pixels = np.where(radius < 1, 255 * (1 - radius), 0).astype(np.uint8)
+    return Image.fromarray(pixels, 'L')
+
+
+def align(rows:int, multiple:int=LINES_PER_PACKET) -> int:
+    return -(-rows // multiple) * multiple
+
+
+def cases(rows:tuple=ROWS, factors:tuple=FACTORS):
+    '''
+    Yield the benchmarks as (name, setup, bytes). setup prepares the inputs outside the timing and
+    returns the function timed; bytes is the amount of data it processes, for the throughput.
+    '''
+
+    for height in rows:
+
+        yield (f"blend_overlap/{height}",
+               lambda height=height: (lambda img=part_image(height): blend_overlap(img, OVERLAP, 'L')),
+               height * WIDTH)
+
+        def rle(height=height):
+            binary = part_image(height).convert('1')
+            return lambda: encode_rle_image_type5(binary, WIDTH, height)
+
+        yield f"encode_rle_image_type5/{height}", rle, height * WIDTH // 8
+
+        for factor in factors:
+
+            yield (f"multiply_stitch/{height}x{factor}",
+                   lambda height=height, factor=factor: (
+                       lambda img=part_image(height): stitch_images(multiply_image(img, factor), height * factor)),
+                   height * factor * WIDTH)
+
+            def packets(height=height, factor=factor):
+                stitched = stitch_images(multiply_image(part_image(height), factor), align(height * factor))
+                strip = Strip(stitched, inum=0)
+                return lambda: sum(len(packet) for packet in strip.to_packets(LINES_PER_PACKET))
+
+            yield f"strip_to_packets/{height}x{factor}", packets, align(height * factor) * WIDTH // 8
+
+    data = bytes(range(256)) * (SEQUENCE_FILE_BYTES // 256)
+    yield "sequencer_to_packets", lambda: (lambda: Sequencer.to_packets(data)), len(data)
+
+    def encode():
+        def run():
+            for i in range(RECORDS_PER_RUN):
+                records.SetInumSize(i).bytes()
+                records.SetSequencerRegister(i % 12, i).bytes()
+                records.LoadImageData(i, 0, i, b'\x00' * 240).bytes()
+        return run
+
+    yield "records_encode", encode, RECORDS_PER_RUN * (6 + 10 + 252)
+
+    def decode():
+        def reply(request, *values):
+            return request.REPLY_STRUCT.pack(request.REPLY_STRUCT.size, request.REC_ID + records.REPLY_OFFSET, *values)
+
+        replies = [reply(records.RequestInumSize, 1080), reply(records.RequestSequencerRegister, 0, 1),
+                   next(iter(records.REPLY_ACK))]
+
+        def run():
+            for i in range(RECORDS_PER_RUN):
+                for reply in replies:
+                    records.decode(reply)
+        return run
+
+    yield "records_decode", decode, RECORDS_PER_RUN * (6 + 8 + 6)
+
+
+def measure(function, repeat:int, min_time:float) -> list[float]:
+    '''Time function at least repeat times and for at least min_time seconds in total.'''
+
+    times = []
+    start = time.perf_counter()
+
+    while len(times) < repeat or time.perf_counter() - start < min_time:
+        t = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - t)
+
+    return times
+
+
+def run(rows:tuple=ROWS, factors:tuple=FACTORS, repeat:int=3, min_time:float=0.0, select:str=None) -> dict:
+    '''Run the benchmarks and return the results by name, with the best and median time in seconds.'''
+
+    results = {}
+
+    for name, setup, size in cases(rows, factors):
+
+        if select and select not in name:
+            continue
+
+        times = measure(setup(), repeat, min_time)
+        best = min(times)
+
+        results[name] = {"best": best, "median": statistics.median(times), "runs": len(times),
+                         "bytes": size, "megabytes_per_second": size / best / 1e6}
+
+        print(f"{name:40} {best * 1e3:10.2f} ms {size / best / 1e6:10.1f} MB/s")
+
+    return results
+
+
+def compare(results:dict, baseline:dict, tolerance:float=0.1) -> list[str]:
+    '''Print the change of each benchmark against the baseline and return the names of the regressions.'''
+
+    regressions = []
+
+    for name, result in results.items():
+
+        if name not in baseline:
+            continue
+
+        ratio = result["best"] / baseline[name]["best"]
+        flag = ""
+
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+
+        print(f"{name:40} {baseline[name]['best'] * 1e3:10.2f} ms -> {result['best'] * 1e3:10.2f} ms {ratio:6.2f}x{flag}")
+
+    return regressions
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Benchmark the lux4600 upload path.")
+    parser.add_argument("--rows", type=int, nargs="+", default=ROWS, help="Image heights")
+    parser.add_argument("--factors", type=int, nargs="+", default=FACTORS, help="Grayscale multiplication factors")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark, the best is compared")
+    parser.add_argument("--min-time", type=float, default=0.0, help="Least seconds per benchmark")
+    parser.add_argument("--select", help="Only run benchmarks whose name contains this")
+    parser.add_argument("--quick", action="store_true", help="Only 1080 rows and factor 4")
+    parser.add_argument("--save", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against the results in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Slowdown counted as a regression, 0.1 = 10 %%")
+    args = parser.parse_args()
+
+    if args.quick:
+        args.rows, args.factors = (1080,), (4,)
+
+    results = run(tuple(args.rows), tuple(args.factors), args.repeat, args.min_time, args.select)
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump({"time": time.time(), "python": sys.version.split()[0], "platform": platform.platform(),
+                       "results": results}, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+
+        print()
+        regressions = compare(results, baseline, args.tolerance)
+
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
@@ -0,0 +1,12 @@
+"""
+Fixtures shared by the tests.
+"""
+
+import pytest
+from lux4600.simulator import ProjectorSimulator
+
+
+@pytest.fixture
+def simulator():
+    with ProjectorSimulator() as simulator:
+        yield simulator
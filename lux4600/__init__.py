@@ -7,4 +7,4 @@ IP = '192.168.0.10'
 DATA_PORT = 52985
 IMAGE_DATA_PORT = 52986
 
-import projector, records, img, seq, grayscale
\ No newline at end of file
+import projector, records, img, seq, grayscale, layout, memory, interpreter, dose, state, metrics, telemetry, simulator, netem, capture, tracing, coordinator, scheduler
\ No newline at end of file
@@ -0,0 +1,230 @@
+import logging
+import select
+import socket
+import struct
+import threading
+import time
+from collections import Counter
+
+#
+# Capture and replay of projector sessions.
+# Every datagram Projector sends and every reply it receives is written to a compact binary log with its
+# monotonic time since the start of the capture. A captured session can be sent again to a projector or
+# simulator.ProjectorSimulator at its original or accelerated timing, and the replies compared.
+#
+# Log format: MAGIC, then one entry per datagram: ENTRY header (time, kind, length) followed by the datagram.
+#
+
+logger = logging.getLogger("lux4600.capture")
+
+MAGIC = b"LUXCAP1\n"
+ENTRY = struct.Struct(">dBH") # seconds since the start of the capture, kind, length
+
+# Entry kinds
+CONTROL = 0 # record sent to the control port
+IMAGE_DATA = 1 # packet sent to the image data port
+REPLY = 2 # datagram received from the projector
+
+KIND_NAMES = {CONTROL: "control", IMAGE_DATA: "image_data", REPLY: "reply"}
+
+
+class Capture:
+    '''Writes datagrams to a capture log.'''
+
+    def __init__(self, path:str):
+        """
+        Args:
+            path (str): The log file, overwritten.
+
+        Attributes:
+            count (int): The number of datagrams written.
+        """
+        self.path = path
+        self.file = open(path, "wb")
+        self.file.write(MAGIC)
+        self.start = time.perf_counter()
+        self.count = 0
+        self.lock = threading.Lock() # The telemetry poller shares the projector socket
+
+    def write(self, kind:int, data:bytes):
+        '''Append a datagram. The log is flushed on every reply, so a crash loses at most the data sent since.'''
+
+        with self.lock:
+            self.file.write(ENTRY.pack(time.perf_counter() - self.start, kind, len(data)))
+            self.file.write(data)
+            self.count += 1
+
+            if kind == REPLY:
+                self.file.flush()
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read(path:str):
+    '''Yield the (time, kind, datagram) entries of a capture log.'''
+
+    with open(path, "rb") as file:
+        CaptureError.check_magic(file.read(len(MAGIC)), path)
+
+        while True:
+            header = file.read(ENTRY.size)
+            if len(header) < ENTRY.size:
+                return # A log cut short by a crash ends at the last complete entry
+
+            t, kind, length = ENTRY.unpack(header)
+            data = file.read(length)
+            if len(data) < length:
+                return
+
+            yield t, kind, data
+
+
+class CaptureSocket:
+    '''A socket that writes the datagrams sent and received to a Capture. Other calls go to the socket.'''
+
+    def __init__(self, sock:socket.socket, capture:Capture, image_data_port:int):
+        self.socket = sock
+        self.capture = capture
+        self.image_data_port = image_data_port
+
+    def sendto(self, data:bytes, address:tuple) -> int:
+        sent = self.socket.sendto(data, address)
+        self.capture.write(IMAGE_DATA if address[1] == self.image_data_port else CONTROL, data)
+        return sent
+
+    def recvfrom(self, size:int, *flags) -> tuple[bytes, tuple]:
+        data, address = self.socket.recvfrom(size, *flags)
+        self.capture.write(REPLY, data)
+        return data, address
+
+    def __getattr__(self, name):
+        return getattr(self.socket, name)
+
+
+def summary(path:str) -> dict:
+    '''Count the datagrams of a capture log by kind and by record name, with its duration.'''
+
+    import projector # Deferred: projector imports this module
+
+    kinds = Counter()
+    names = Counter()
+    duration = 0.0
+
+    for t, kind, data in read(path):
+        kinds[KIND_NAMES[kind]] += 1
+        if kind == CONTROL:
+            names[projector.record_name(projector.rec_id(data))] += 1
+        duration = t
+
+    return {"duration": duration, "kinds": dict(kinds), "records": dict(names)}
+
+
+def replay(path:str, host:str, port:int, image_data_port:int, speed:float=1.0, timeout:float=0.5) -> dict:
+    """
+    Send the datagrams of a capture log again and compare the replies with the captured ones.
+
+    A datagram sent after a reply in the capture is only sent again once that reply was received (or timeout
+    passed), like Projector waiting for replies, so accelerated replays keep the order the projector saw.
+
+    Args:
+        path (str): The capture log.
+        host, port, image_data_port: The projector endpoint.
+        speed (float): Timing relative to the capture, e.g. 10 = ten times faster. 0 sends as fast as possible.
+        timeout (float): Seconds to wait for a reply before going on without it.
+
+    Returns:
+        dict: "sent" and "replies" counts, "expected" the number of captured replies, "duration" the seconds
+            taken, and "mismatches", (index, captured, received) of every reply that differs, in order.
+    """
+    entries = list(read(path))
+    expected = [data for _, kind, data in entries if kind == REPLY]
+    received = []
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setblocking(False)
+
+    def receive(wait:float=0.0):
+        while select.select([sock], [], [], wait)[0]:
+            received.append(sock.recvfrom(65536)[0])
+            wait = 0.0
+
+    def await_replies(count:int):
+        deadline = time.perf_counter() + timeout
+        while len(received) < count and time.perf_counter() < deadline:
+            receive(deadline - time.perf_counter())
+
+    start = time.perf_counter()
+    sent = 0
+    replies = 0 # captured replies so far
+
+    try:
+        for t, kind, data in entries:
+            if kind == REPLY:
+                replies += 1
+                continue
+
+            await_replies(replies)
+
+            if speed:
+                ahead = start + t / speed - time.perf_counter()
+                if ahead > 0.001:
+                    receive(ahead)
+
+            sock.sendto(data, (host, image_data_port if kind == IMAGE_DATA else port))
+            sent += 1
+            receive()
+
+        await_replies(len(expected))
+    finally:
+        sock.close()
+
+    mismatches = [(i, want, got) for i, (want, got) in enumerate(zip(expected, received)) if want != got]
+    mismatches += [(i, want, None) for i, want in enumerate(expected[len(received):], len(received))]
+
+    return {"sent": sent, "replies": len(received), "expected": len(expected),
+            "duration": time.perf_counter() - start, "mismatches": mismatches}
+
+
+class CaptureError(ValueError):
+    """Exception raised for invalid capture logs."""
+
+    @staticmethod
+    def check_magic(magic:bytes, path:str):
+        if magic != MAGIC:
+            raise CaptureError(f"{path} is not a capture log.")
+
+
+if __name__ == '__main__':
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Show or replay a captured projector session.")
+    parser.add_argument("path")
+    parser.add_argument("--replay", metavar="HOST", help="Replay the session to this projector address")
+    parser.add_argument("--port", type=int, default=52985)
+    parser.add_argument("--image-data-port", type=int, default=52986)
+    parser.add_argument("--speed", type=float, default=1.0, help="Timing relative to the capture, 0 for none")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    info = summary(args.path)
+    logger.info(f"{args.path}: {info['duration']:.2f} s, {info['kinds']}")
+    for name, count in sorted(info["records"].items(), key=lambda item: -item[1]):
+        logger.info(f"  {name:32} {count}")
+
+    if args.replay:
+        result = replay(args.path, args.replay, args.port, args.image_data_port, args.speed)
+        logger.info(f"Sent {result['sent']} datagrams in {result['duration']:.2f} s, "
+                    f"{result['replies']}/{result['expected']} replies, {len(result['mismatches'])} mismatches")
+        for i, want, got in result["mismatches"][:20]:
+            logger.info(f"  reply {i}: captured {want.hex()}, received {got.hex() if got else None}")
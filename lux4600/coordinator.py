@@ -0,0 +1,198 @@
+import logging
+import time
+import records
+from metrics import REGISTRY
+from seq import Sequencer, TRIG_SOURCES
+from tracing import TRACER
+
+#
+# Synchronous start of the sequencer and the scroll motion.
+# Both devices are prepared first, so that starting them is a single command each, fired back to back.
+# In the sync modes the sequencer is already running and waits at a start «Trig» (see seq.add_start_trigger),
+# released by a software sync edge or by a pulse of the motion controller.
+#
+
+logger = logging.getLogger("lux4600.coordinator")
+
+SOFTWARE = "software" # the sequencer start and the move are sent back to back
+SOFTWARE_SYNC = "software_sync" # the sequencer waits for a software sync edge, sent right after the move
+HARDWARE = "hardware" # the sequencer waits for the electrical sync, raised by the motion controller as the move starts
+
+# The start trigger source of the sequence file in each mode, see Sequencer(start_trigger=...)
+START_TRIGGERS = {SOFTWARE: None, SOFTWARE_SYNC: TRIG_SOURCES["software"], HARDWARE: TRIG_SOURCES["electrical"]}
+
+
+class StartTiming:
+    '''Host timestamps (time.perf_counter) of a synchronous start.'''
+
+    def __init__(self, mode:str, motion:tuple, sequencer:tuple=None):
+        """
+        Args:
+            mode (str): The start mode.
+            motion (tuple): The times before and after the command starting the move.
+            sequencer (tuple): The times before and after the command starting the sequencer, None if the
+                motion controller starts it (HARDWARE).
+        """
+        self.mode = mode
+        self.motion = motion
+        self.sequencer = sequencer
+
+    @property
+    def skew(self) -> float | None:
+        '''
+        Seconds from the start of the move to the start of the sequencer, negative if the sequencer started first.
+        Each command is taken to act halfway through its call, i.e. after half a round trip. None in HARDWARE
+        mode, where the skew is the trigger latency of the motion controller.
+        '''
+        if self.sequencer is None:
+            return None
+        return sum(self.sequencer) / 2 - sum(self.motion) / 2
+
+    @property
+    def uncertainty(self) -> float | None:
+        '''Bound of the error of skew in seconds: half the duration of both calls.'''
+        if self.sequencer is None:
+            return None
+        return (self.sequencer[1] - self.sequencer[0] + self.motion[1] - self.motion[0]) / 2
+
+    def __repr__(self):
+        if self.skew is None:
+            return f"StartTiming({self.mode}, skew set by the motion controller)"
+        return f"StartTiming({self.mode}, skew={self.skew * 1e3:+.2f} ms ± {self.uncertainty * 1e3:.2f} ms)"
+
+
+class StartCoordinator:
+    '''Starts the sequencer of a projector and the scroll of a set of axes together.'''
+
+    def __init__(self, projector, axes, mode:str=SOFTWARE_SYNC, delay:float=0.0, metrics=REGISTRY):
+        """
+        Args:
+            projector (Projector): The projector.
+            axes: The axes, e.g. axes.ZaberAxes. Needs scroll(distance, velocity, wait) and wait_scroll(),
+                and arm_start_trigger() and disarm_start_trigger() in HARDWARE mode.
+            mode (str): SOFTWARE, SOFTWARE_SYNC or HARDWARE.
+            delay (float): Seconds the sequencer is started after the move, e.g. velocity / (2 * acceleration)
+                to make up for the acceleration ramp. Negative to start the sequencer first. Unused in HARDWARE mode.
+            metrics (Registry): Holds the start_skew_seconds histogram of each mode.
+        """
+        CoordinatorValueError.check_mode(mode)
+
+        self.projector = projector
+        self.axes = axes
+        self.mode = mode
+        self.delay = delay
+        self.metrics = metrics
+        self.armed = False
+
+    def prepare(self, sequencer:Sequencer=None, registers:dict=None):
+        """
+        Get the projector and axes ready to start. In the sync modes the sequencer is started and waits at its start Trig.
+
+        Args:
+            sequencer (Sequencer): Uploaded first if given. In the sync modes it needs the start trigger of the mode,
+                see START_TRIGGERS.
+            registers (dict): Register numbers (0-11) mapped to values, see Sequencer.register_values.
+                They are read back, see Projector.check_sequencer_registers.
+        """
+        source = START_TRIGGERS[self.mode]
+
+        if sequencer is not None:
+            CoordinatorValueError.check_start_trigger(sequencer, source)
+            self.projector.send_sequencer(sequencer)
+
+        if self.mode == SOFTWARE_SYNC:
+            self.projector.send_record(records.SetSoftwareSync(0), force=True) # The start is the rising edge
+
+        if self.mode == HARDWARE:
+            self.axes.arm_start_trigger()
+
+        if source is None:
+            # Stopped, reset and registers set, so the start is a single record
+            self.projector.send_batch([
+                records.SetSequencerState(1, False),
+                records.SetSequencerState(2, True),
+                records.SetSequencerState(2, False),
+                *(records.SetSequencerRegister(reg_no, value) for reg_no, value in (registers or {}).items()),
+            ])
+            self.projector.check_sequencer_registers(registers)
+        else:
+            self.projector.restart_sequencer(registers)
+
+        self.armed = True
+
+    def _start_sequencer(self):
+        if self.mode == SOFTWARE:
+            self.projector.send_record(records.SetSequencerState(1, True))
+        else:
+            self.projector.send_record(records.SetSoftwareSync(1), force=True)
+
+    def fire(self, distance:float, velocity:float) -> StartTiming:
+        """
+        Start the scroll and the sequencer prepared by prepare, without waiting for the move to finish.
+
+        Args:
+            distance (float): The scroll distance in mm.
+            velocity (float): The scroll velocity in mm/s.
+
+        Returns:
+            StartTiming: The timestamps of both starts, with the skew.
+        """
+        CoordinatorValueError.check_armed(self.armed)
+        self.armed = False
+
+        def timed(start, wait:float=0.0):
+            until = time.perf_counter() + wait
+            while time.perf_counter() < until: # Sleeping is too coarse for sub-millisecond delays
+                pass
+            before = time.perf_counter()
+            start()
+            return before, time.perf_counter()
+
+        with TRACER.span("sync_start", mode=self.mode):
+            if self.mode == HARDWARE:
+                motion, sequencer = timed(lambda: self.axes.scroll(distance, velocity, wait=False)), None
+            elif self.delay >= 0:
+                motion = timed(lambda: self.axes.scroll(distance, velocity, wait=False))
+                sequencer = timed(self._start_sequencer, self.delay - (time.perf_counter() - motion[1]))
+            else:
+                sequencer = timed(self._start_sequencer)
+                motion = timed(lambda: self.axes.scroll(distance, velocity, wait=False), -self.delay - (time.perf_counter() - sequencer[1]))
+
+        timing = StartTiming(self.mode, motion, sequencer)
+
+        if timing.skew is not None:
+            self.metrics.histogram("start_skew_seconds", mode=self.mode).observe(abs(timing.skew - self.delay))
+
+        logger.info(timing)
+        return timing
+
+    def scroll(self, distance:float, velocity:float) -> StartTiming:
+        '''Start the scroll and the sequencer together and wait for the move to finish, see fire.'''
+
+        timing = self.fire(distance, velocity)
+        self.axes.wait_scroll()
+
+        if self.mode == HARDWARE:
+            self.axes.disarm_start_trigger()
+
+        return timing
+
+
+class CoordinatorValueError(ValueError):
+    """Exception raised for parameter value errors in the StartCoordinator class."""
+
+    @staticmethod
+    def check_mode(mode:str):
+        if mode not in START_TRIGGERS:
+            raise CoordinatorValueError(f"Invalid start mode {mode}. Use one of {', '.join(START_TRIGGERS)}.")
+
+    @staticmethod
+    def check_start_trigger(sequencer:Sequencer, source:int | None):
+        if source is not None and getattr(sequencer, "start_trigger", None) != source:
+            raise CoordinatorValueError(
+                f"The sequencer must wait for start trigger source {source}, see Sequencer(start_trigger={source}).")
+
+    @staticmethod
+    def check_armed(armed:bool):
+        if not armed:
+            raise CoordinatorValueError("Call prepare before every start.")
@@ -0,0 +1,185 @@
+import numpy as np
+from PIL import Image
+from img import Strip
+from interpreter import Result, simulate
+from seq import Program, TICK_NS
+
+#
+# Exposure dose simulator.
+# Accumulates the light dose each substrate pixel receives from the light pulses of a
+# (simulated) sequence program, while the stage moves under the projector.
+#
+
+
+class DoseMap:
+    '''Accumulated dose per substrate pixel.'''
+
+    def __init__(self, dose:np.ndarray, origin:int):
+        """
+        Args:
+            dose (np.ndarray): Dose per pixel, in light pulses. Shape (rows, width).
+            origin (int): The substrate row of dose[0], in DMD rows from the stage position at t = 0.
+        """
+        self.dose = dose
+        self.origin = origin
+
+    def levels(self) -> dict:
+        '''The distinct dose values (rounded to 1e-6 pulses) and the number of pixels receiving each.'''
+
+        values, counts = np.unique(np.round(self.dose, 6), return_counts=True)
+        return dict(zip(values.tolist(), counts.tolist()))
+
+    def image(self, maximum:float=None) -> Image.Image:
+        '''Return the dose as an 8-bit grayscale image, scaled so maximum (default: the highest dose) is white.'''
+
+        maximum = maximum or self.dose.max() or 1
+        return Image.fromarray((np.clip(self.dose / maximum, 0, 1) * 255).round().astype(np.uint8), mode='L')
+
+
+def memory_array(memory:Strip | Image.Image | np.ndarray, mirror:bool=False) -> np.ndarray:
+    """
+    Return the projector memory contents as a float32 array of 0 (black) and 1 (white) rows.
+
+    Args:
+        memory (Strip | Image.Image | np.ndarray): The strip, 1-bit (packed) bitmap or array uploaded to the projector.
+        mirror (bool): Flip the columns, as the optics mirror the DMD image left to right.
+    """
+    if hasattr(memory, "inum_size"): # Strip
+        memory = memory.image
+
+    if isinstance(memory, Image.Image):
+        memory = np.asarray(memory.convert("1"))
+
+    array = (np.asarray(memory) > 0).astype(np.float32)
+    return array[:, ::-1] if mirror else array
+
+
+def constant_velocity(velocity:float, pixel_pitch:float, start:float=0.0):
+    """
+    Return a stage profile moving at a constant velocity.
+
+    Args:
+        velocity (float): Stage velocity, e.g. SCROLLING_VELOCITY in mm/s. Positive moves along the scroll direction.
+        pixel_pitch (float): Stage distance per DMD row, e.g. SCROLLING_DIST / (rows - 1080).
+        start (float): Stage position at t = 0, in DMD rows.
+
+    Returns:
+        callable: position(t) in DMD rows for an array of times t in seconds.
+    """
+    return lambda t: start + np.asarray(t) * velocity / pixel_pitch
+
+
+def pulse_windows(result:Result, stage, inum:int=0, inum_size:int=None) -> tuple[np.ndarray, ...]:
+    """
+    Convert the pulses of a simulated program into memory row windows and substrate shifts.
+
+    Each segment of rows shown by a pulse becomes a window [start, start + rows) of memory rows that is
+    added to the substrate at memory row + shift. Fractional stage positions are split between the two
+    nearest substrate rows.
+
+    Args:
+        result (Result): The result of interpreter.simulate.
+        stage (callable): position(t) in DMD rows, see constant_velocity.
+        inum (int): The inum of memory row 0.
+        inum_size (int): The number of rows per inum, see Strip.inum_size.
+
+    Returns:
+        tuple: (shift, start, rows, weight) arrays, one entry per window.
+    """
+    entries = [(pulse.tick, dmd_row, (seg_inum - inum) * (inum_size or 0) + mem_row, rows)
+               for pulse in result.pulses for dmd_row, rows, seg_inum, mem_row in pulse.segments]
+
+    if not entries:
+        return tuple(np.zeros(0, dtype=dtype) for dtype in (np.int64, np.int64, np.int64, np.float64))
+
+    ticks, dmd_row, start, rows = (np.array(column) for column in zip(*entries))
+    offset = dmd_row - start
+    position = np.broadcast_to(np.asarray(stage(ticks * TICK_NS * 1e-9), dtype=np.float64), ticks.shape)
+
+    shift = np.floor(position).astype(np.int64)
+    fraction = position - shift
+
+    # Whole part to the nearest row below, fractional part to the row above
+    shift = np.concatenate([shift + offset, shift + offset + 1])
+    weight = np.concatenate([1 - fraction, fraction])
+    start, rows = np.tile(start, 2), np.tile(rows, 2)
+
+    keep = weight > 0
+    return shift[keep], start[keep], rows[keep], weight[keep]
+
+
+def accumulate(memory:np.ndarray, shift:np.ndarray, start:np.ndarray, rows:np.ndarray, weight:np.ndarray) -> DoseMap:
+    """
+    Accumulate the dose of a batch of memory windows.
+
+    Windows are grouped by shift. Within a group, the number of windows covering each memory row is
+    found with a difference array, so each group costs one weighted add of its memory rows.
+
+    Args:
+        memory (np.ndarray): The projector memory, see memory_array.
+        shift, start, rows, weight (np.ndarray): The windows, see pulse_windows.
+
+    Returns:
+        DoseMap: The accumulated dose.
+    """
+    height, width = memory.shape
+
+    # Clip windows to the memory
+    end = np.minimum(start + rows, height)
+    start = np.maximum(start, 0)
+    keep = end > start
+    shift, start, end, weight = shift[keep], start[keep], end[keep], weight[keep]
+
+    if not len(shift):
+        return DoseMap(np.zeros((0, width), dtype=np.float32), 0)
+
+    origin = int((start + shift).min())
+    dose = np.zeros((int((end + shift).max()) - origin, width), dtype=np.float32)
+
+    order = np.argsort(shift, kind="stable")
+    shift, start, end, weight = shift[order], start[order], end[order], weight[order]
+    groups = np.flatnonzero(np.diff(shift)) + 1
+
+    for first, last in zip(np.concatenate([[0], groups]), np.concatenate([groups, [len(shift)]])):
+        group_start, group_end = start[first:last], end[first:last]
+        low, high = int(group_start.min()), int(group_end.max())
+
+        counts = np.zeros(high - low + 1)
+        np.add.at(counts, group_start - low, weight[first:last])
+        np.add.at(counts, group_end - low, -weight[first:last])
+        counts = np.cumsum(counts[:-1]).astype(np.float32)
+
+        row = low + int(shift[first]) - origin
+        dose[row:row + high - low] += counts[:, None] * memory[low:high]
+
+    return DoseMap(dose, origin)
+
+
+def simulate_dose(memory:Strip | Image.Image | np.ndarray, program:Program | str, stage, frequency:float=None,
+                  frames:int=None, mirror:bool=False, inum:int=None, inum_size:int=None, **kwargs) -> DoseMap:
+    """
+    Simulate the dose a program exposes while the stage moves.
+
+    Args:
+        memory (Strip | Image.Image | np.ndarray): The projector memory contents, starting at row 0 of inum.
+        program (Program | str): The sequence program, or the contents of a sequence file.
+        stage (callable | float): position(t) in DMD rows, see constant_velocity, or a constant velocity in DMD rows/s.
+        frequency (float): Trigger frequency in Hz, None for a free-running sequencer.
+        frames (int): The number of frames to simulate.
+        mirror (bool): Flip the columns, see memory_array.
+        inum (int): The inum of memory row 0. Defaults to strip.inum for a Strip, else 0.
+        inum_size (int): The number of rows per inum. Defaults to strip.inum_size for a Strip.
+        kwargs: Passed to interpreter.Interpreter.
+
+    Returns:
+        DoseMap: The accumulated dose in light pulses.
+    """
+    if hasattr(memory, "inum_size"): # Strip
+        inum = memory.inum if inum is None else inum
+        inum_size = memory.inum_size if inum_size is None else inum_size
+
+    if not callable(stage):
+        stage = constant_velocity(stage, 1.0)
+
+    result = simulate(program, frequency, frames, inum_size=inum_size, **kwargs)
+    return accumulate(memory_array(memory, mirror), *pulse_windows(result, stage, inum or 0, inum_size))
@@ -1,12 +1,15 @@
+import numpy as np
 from PIL import Image
 from typing import Iterator
+from metrics import REGISTRY
+from tracing import TRACER
 
 def add_buffer(img:Image, strip_width) -> Image.Image:
     
     img_width, img_height = img.size
     
     # Calculate black-pixel buffer zones
-    total_buffer = strip_width - img_width % strip_width # total amount of black pixel buffer needed
+    total_buffer = -img_width % strip_width # total amount of black pixel buffer needed (none if already a multiple)
     buffer_left = total_buffer // 2 # left buffer
     buffer_right = total_buffer - buffer_left # right buffer... will have 1 more pixel if total_buffer is odd
 
@@ -15,6 +18,116 @@ def add_buffer(img:Image, strip_width) -> Image.Image:
     new_img.paste(img, (buffer_left, 0))
     return new_img
 
+def get_content_bbox(img:Image.Image, threshold:int=0) -> tuple[int, int, int, int] | None:
+    """
+    Calculate the bounding box of the occupied (non-black) pixels of an image.
+
+    Args:
+        img (Image.Image): The image to be measured. The image is converted to 8-bit grayscale.
+        threshold (int): Pixels with a value at or below the threshold are treated as empty.
+
+    Returns:
+        tuple: (left, top, right, bottom) of the occupied region. right and bottom are exclusive.
+            None if the image has no occupied pixels.
+    """
+    gray = img.convert('L')
+
+    if threshold > 0:
+        gray = gray.point(lambda p: 255 if p > threshold else 0)
+
+    return gray.getbbox()
+
+def get_content_rows(img:Image.Image, min_rows:int=1080, threshold:int=0) -> tuple[int, int]:
+    """
+    Calculate the range of rows occupied by an image, extended to at least min_rows.
+
+    The sequencer always loads a full DMD height (1080 rows) per frame, so the row
+    range is grown downwards (or upwards at the bottom edge) until it covers min_rows.
+
+    Args:
+        img (Image.Image): The image to be measured.
+        min_rows (int): The minimum number of rows in the returned range.
+        threshold (int): Pixels with a value at or below the threshold are treated as empty.
+
+    Returns:
+        tuple: (top, bottom) row range of the occupied region, bottom exclusive.
+    """
+    height = img.height
+    bbox = get_content_bbox(img, threshold)
+
+    if bbox is None:
+        return 0, min(min_rows, height)
+
+    _, top, _, bottom = bbox
+
+    if bottom - top < min_rows:
+        bottom = min(top + min_rows, height)
+        top = max(bottom - min_rows, 0)
+
+    return top, bottom
+
+@REGISTRY.timed("crop_to_content")
+@TRACER.traced("crop_to_content")
+def crop_to_content(img:Image.Image, min_rows:int=1080, threshold:int=0, columns:bool=True) -> tuple[Image.Image, tuple[int, int, int, int]]:
+    """
+    Crop an image to the bounding box of its occupied pixels.
+
+    Args:
+        img (Image.Image): The image to be cropped.
+        min_rows (int): The minimum number of rows kept, see get_content_rows.
+        threshold (int): Pixels with a value at or below the threshold are treated as empty.
+        columns (bool): Crop columns as well as rows. If False the full width is kept.
+
+    Returns:
+        Image.Image: The cropped image.
+        tuple: (left, top, right, bottom) of the cropped region in the original image.
+    """
+    top, bottom = get_content_rows(img, min_rows, threshold)
+    left, right = 0, img.width
+
+    bbox = get_content_bbox(img, threshold)
+
+    if columns and bbox is not None:
+        left, _, right, _ = bbox
+
+    box = (left, top, right, bottom)
+
+    return img.crop(box), box
+
+def get_scroll_parameters(rows:int, mem_start_row:int=0) -> dict:
+    """
+    Sequencer variables matching an uploaded (cropped) image.
+
+    The keys match the variable names used by the sequence files in test/test-seq,
+    so the result can be passed straight to Sequencer(..., variables=...).
+
+    Args:
+        rows (int): The number of rows of the uploaded image (per grayscale level).
+        mem_start_row (int): The row in projector memory where the image starts.
+
+    Returns:
+        dict: {"TotalRows": rows, "MemStartRow": mem_start_row}
+    """
+    return {"TotalRows": rows, "MemStartRow": mem_start_row}
+
+def scale_scroll_distance(distance:float, full_rows:int, rows:int, dmd_rows:int=1080) -> float:
+    """
+    Scale a calibrated scroll distance to a cropped image.
+
+    A scroll pass moves the image by (rows - dmd_rows) rows, so the stage travel is
+    scaled by the ratio of scrolled rows.
+
+    Args:
+        distance (float): The calibrated scroll distance (mm) for an image of full_rows rows.
+        full_rows (int): The number of rows the distance was calibrated for.
+        rows (int): The number of rows of the cropped image.
+        dmd_rows (int): The number of rows on the DMD.
+
+    Returns:
+        float: The scroll distance (mm) for the cropped image.
+    """
+    return distance * max(rows - dmd_rows, 0) / (full_rows - dmd_rows)
+
 def split_image(img:Image.Image, strip_width) -> Iterator[Image.Image]:
     
     width, height = img.size
@@ -44,20 +157,63 @@ def multiply_image(img:Image, factor:int) -> Iterator[Image.Image]:
 
         yield img.point(lambda p: 255 if p > threshold else 0)
 
-def stitch_images(images:Iterator[Image.Image], stitched_height) -> Image.Image:
+@REGISTRY.timed("blend_overlap")
+@TRACER.traced("blend_overlap")
+def blend_overlap(img:Image.Image, overlap:int, side:str) -> Image.Image:
+    """
+    Scale the grayscale of a strip linearly to 0 over the columns it shares with its neighbour,
+    so the doses of two overlapping strips add up to the dose of the original image.
+
+    Args:
+        img (Image.Image): The 8-bit grayscale strip.
+        overlap (int): The number of overlapping columns.
+        side (str): 'L' if the strip is the left one (its last overlap columns fade out),
+            'R' if it is the right one (its first overlap columns fade in).
+
+    Returns:
+        Image.Image: The blended strip.
+    """
+
+    if side not in ('L', 'R'):
+        raise ValueError("Invalid side. Use 'L' or 'R'.")
+
+    pixels = np.array(img.convert('L'))
+    x = np.arange(overlap)
+
+    if side == 'L':
+        columns = slice(pixels.shape[1] - overlap, pixels.shape[1])
+        weights = overlap - x
+    else:
+        columns = slice(0, overlap)
+        weights = x
+
+    # Same arithmetic as int((value / overlap) * weight) per pixel
+    pixels[:, columns] = (pixels[:, columns] / overlap * weights).astype(np.uint8)
+
+    return Image.fromarray(pixels, 'L')
+
+@REGISTRY.timed("stitch_images")
+@TRACER.traced("stitch_images")
+def stitch_images(images:Iterator[Image.Image], stitched_height, width:int=None) -> Image.Image:
     """
     Stitch a list of images together vertically.
 
     Args:
         images (Iterator[Image.Image]): The images to be stitched together.
         stitched_height (int): The height of the stitched image.
+        width (int): The width of the stitched image. Defaults to the width of the first image.
 
 
     Returns:
         Image.Image: The stitched image.
     """
 
-    new_img = Image.new('L', (1920, stitched_height))
+    images = list(images)
+
+    if width is None:
+        width = images[0].width if images else 1920
+
+    new_img = Image.new('L', (width, stitched_height))
 
     y_offset = 0
     for img in images:
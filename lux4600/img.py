@@ -1,12 +1,22 @@
+import logging
 from PIL import Image
 from typing import Iterator
 import grayscale
+from metrics import REGISTRY
+
+logger = logging.getLogger("lux4600.img")
+
+
+MAX_INUM_ROWS = 65535 # SetInumSize encodes the number of rows in 2 bytes
+SPAN_INUM_ROWS = 32760 # inum size for images spanning several inums. Keeps row arithmetic in the
+                       # (signed 16-bit) sequencer below 32768 and is a multiple of 1 to 8 lines per packet
+MAX_PACKET_SIZE = 1500 # bytes, largest image data packet by default. Larger packets need jumbo frames on the link
 
 
 class Strip:
     '''A class representing a 1-bit strip of an image to be sent to the projector.'''
 
-    def __init__(self, image:Image.Image, inum:int):
+    def __init__(self, image:Image.Image, inum:int, inum_size:int=None):
         """
         Constructor for Strip class.
 
@@ -16,13 +26,17 @@ class Strip:
                 - The image should generally be 1920 pixels wide
             inum (int): The inum of the strip to be sent to the projector.
                 - The inum should be less than 65536 and greater than or equal to 0
+            inum_size (int): The number of rows stored per inum.
+                - Defaults to the height of the image, or SPAN_INUM_ROWS if the image is taller than MAX_INUM_ROWS
+                - Images taller than inum_size are stored in consecutive inums, starting at inum
 
         Attributes:
             image (Image.Image): A PIL Image object representing the strip to be sent to the projector.
             width (int): The width of the strip in pixels.
             height (int): The height of the strip in pixels.
             inum (int): The inum of the strip to be sent to the projector.
-            packets (Iterator[bytes]): A generator that yields the packets of the strip to be sent to the projector.
+            inum_size (int): The number of rows stored per inum.
+            num_inums (int): The number of consecutive inums the strip is stored in.
         """
         self.image = image
 
@@ -31,28 +45,54 @@ class Strip:
         self.width, self.height = self.image.size
         self.inum = inum
 
-    def to_packets(self, lines_per_packet:int) -> Iterator[bytes]:
+        if inum_size is None:
+            inum_size = self.height if self.height <= MAX_INUM_ROWS else SPAN_INUM_ROWS
+
+        self.inum_size = inum_size
+
+    @property
+    def num_inums(self) -> int:
+        return -(-self.height // self.inum_size)
+
+    def to_packets(self, lines_per_packet:int, max_packet_size:int=MAX_PACKET_SIZE) -> Iterator[bytes]:
         '''
         Return a generator that yields the packets of the strip to be sent to the projector.
+
+        Packets never cross an inum boundary. Rows past inum_size continue at row 0 of the next inum.
+        Packets may be at most max_packet_size bytes, header included.
         '''
         
+        data = self.image.tobytes()
+        bytes_per_line = self.width // 8
+
         # Check inum and lines per packet
-        StripValueError.check_inum_size(self.inum)
-        StripValueError.check_packet_size(lines_per_packet, self.image.tobytes(), self.width)
+        StripValueError.check_inum_size(self.inum + self.num_inums - 1)
+        StripValueError.check_rows_per_inum(self.inum_size)
 
-        
-        # Calculate the number of lines in the image and the number of packets
-        num_packets = self.height // lines_per_packet
-        print(num_packets)
+        # Calculate the number of packets
+        num_packets = sum(-(-min(self.inum_size, self.height - i * self.inum_size) // lines_per_packet) for i in range(self.num_inums))
+        logger.debug(f"{num_packets} packets")
+        REGISTRY.counter("strip_packets_total").inc(num_packets)
+
+        packet_idx = 0
+
+        for inum_idx in range(self.num_inums):
+
+            first_row = inum_idx * self.inum_size
+            rows = min(self.inum_size, self.height - first_row)
 
-        # Split the image into packets
-        for packet_idx in range(num_packets):
+            StripValueError.check_packet_size(lines_per_packet, data[first_row * bytes_per_line:(first_row + rows) * bytes_per_line], self.width, max_packet_size)
 
-            # Calculate range of bytes to send
-            start, end, offset = self.get_packet_range(packet_idx, lines_per_packet)
+            # Split the rows of this inum into packets
+            for offset in range(0, rows, lines_per_packet):
 
-            # Yield the packet
-            yield self.get_packet(packet_idx, start, end, offset)
+                # Calculate range of bytes to send
+                start = (first_row + offset) * bytes_per_line
+                end = start + lines_per_packet * bytes_per_line
+
+                # Yield the packet. The 2 byte sequence number wraps around for very tall strips.
+                yield self.get_packet(packet_idx % 65536, start, end, offset, self.inum + inum_idx, data)
+                packet_idx += 1
 
 
     def get_packet_range(self, packet_idx:int, lines_per_packet:int) -> bytes:
@@ -78,24 +118,33 @@ class Strip:
 
         return start, end, offset
     
-    def get_packet(self, packet_idx:int, start:int, end:int, offset:int) -> bytes:
+    def get_packet(self, packet_idx:int, start:int, end:int, offset:int, inum:int=None, data:bytes=None) -> bytes:
         """
         Constructs a packet of image data.
         Args:
             packet_idx (int): The index of the packet.
-            lines_per_packet (int): The number of lines per packet.
             start (int): The starting byte index of the image data to include in the packet.
             end (int): The ending byte index of the image data to include in the packet.
             offset (int): The offset value to include in the packet.
+            inum (int): The inum the data is stored in. Defaults to the inum of the strip.
+            data (bytes): The image bytes of the strip, to avoid converting the image for every packet.
         Returns:
             bytes: The constructed packet containing the specified image data.
         """
 
-        return (b'\x05\xAE\x00\x68' + 
+        if inum is None:
+            inum = self.inum
+
+        if data is None:
+            data = self.image.tobytes()
+
+        payload = data[start:end] # Pull bytes from this strip
+
+        return ((14 + len(payload)).to_bytes(2, byteorder='big') + b'\x00\x68' +
                 packet_idx.to_bytes(2, byteorder='big') + 
-                self.inum.to_bytes(2, byteorder='big') + 
+                inum.to_bytes(2, byteorder='big') + 
                 offset.to_bytes(6, byteorder='big') + 
-                self.image.tobytes()[start:end] # Pull bytes from this strip
+                payload
                 )
     
     def get_bin_image_data(self, skip_header:int=130) -> bytes:
@@ -128,7 +177,7 @@ class StripValueError(ValueError):
     """Exception raised for parameter value errors in the Strip class."""
 
     @staticmethod
-    def check_packet_size(lines_per_packet: int, img: bytes, width:int=1920):
+    def check_packet_size(lines_per_packet: int, img: bytes, width:int=1920, max_size:int=MAX_PACKET_SIZE):
         
         # Check expected packet size
         payload_size = lines_per_packet * (width//8)
@@ -147,10 +196,19 @@ class StripValueError(ValueError):
                 {len(img)} bytes, {payload_size} bytes per packet."""
                 )
         
-        if (14 + payload_size) > 1500:
+        if (14 + payload_size) > max_size:
+            raise StripValueError(
+                f"""Expected packet size exceed {max_size}.
+                {14 + payload_size} bytes, {max_size} bytes max."""
+                )
+
+    @staticmethod
+    def check_rows_per_inum(inum_size: int):
+
+        if inum_size > 65535 or inum_size < 1:
             raise StripValueError(
-                f"""Expected packet size exceed 1500.
-                {14 + payload_size} bytes, 1500 bytes max."""
+                f"""inum size must be between 1 and 65535 rows.
+                {inum_size} rows, 65535 max."""
                 )
 
     @staticmethod  
@@ -165,18 +223,39 @@ class StripValueError(ValueError):
 
 class Grayscale:
 
-    def __init__(self, file_path:str, strip_width:int=1920, level=255):
+    def __init__(self, file_path:str, strip_width:int=1920, level=255, crop:bool=False):
+        """
+        Constructor for Grayscale class.
+
+        Args:
+            file_path (str): The path to the grayscale image.
+            strip_width (int): The width of each strip in pixels.
+            level (int): The number of grayscale levels each strip is split into.
+            crop (bool): Crop the image to the bounding box of its content before splitting,
+                so only the occupied rows and strips are uploaded and scrolled.
+
+        Attributes:
+            box (tuple): (left, top, right, bottom) of the image region kept from the original image.
+            scroll_parameters (dict): TotalRows and MemStartRow sequencer variables for the strips.
+        """
 
         GrayscaleValueError.check_level(level)
 
         self.strip_width = strip_width
 
+        image = Image.open(file_path)
+        self.box = (0, 0) + image.size
+
+        if crop:
+            image, self.box = grayscale.crop_to_content(image)
+
         # Initialize correctly sized, buffered, and grayscaled image
-        self.image = grayscale.add_buffer(Image.open(file_path), strip_width)
+        self.image = grayscale.add_buffer(image, strip_width)
 
         self.width, self.height = self.image.size
         self.level = level
         self.num_strips = self.width // self.strip_width
+        self.scroll_parameters = grayscale.get_scroll_parameters(self.height)
 
         self.strips = self.get_strips()
 
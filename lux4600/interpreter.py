@@ -0,0 +1,428 @@
+import math
+from seq import Program, parse_number, TICK_NS, ROW_LOAD_NS, MASK_ROW_LOAD_NS, RESET_TICKS
+
+#
+# Offline interpreter for sequence programs.
+# Executes a program against a trigger model to predict frame timing, scroll speed and
+# timing constraint violations without the projector (LAMA Standard, chapter 6).
+#
+MAX_STEPS = 50_000_000 # guard against programs looping without a Trig
+
+
+class Trigger:
+	'''A periodic trigger source, e.g. the internal sync.'''
+
+	def __init__(self, frequency:float=None, phase:float=0.0):
+		"""
+		Args:
+		    frequency (float): Trigger frequency in Hz. None for a free-running sequencer,
+		        where every Trig is released immediately.
+		    phase (float): Time of the first trigger edge in seconds.
+		"""
+		self.frequency = frequency
+		self.period = None if frequency is None else 1e9 / (frequency * TICK_NS) # ticks
+		self.phase = phase * 1e9 / TICK_NS # ticks
+
+	def next_edge(self, tick:float) -> float:
+		'''The first trigger edge at or after tick.'''
+
+		if self.period is None:
+			return tick
+
+		return self.phase + max(0, math.ceil((tick - self.phase) / self.period - 1e-9)) * self.period
+
+	def edges_between(self, start:float, end:float) -> int:
+		'''The number of trigger edges in the open interval (start, end).'''
+
+		if self.period is None:
+			return 0
+
+		return max(0, round((end - start) / self.period) - 1)
+
+
+class Frame:
+	'''One trigger period: the loads executed after a Trig, until the next Trig.'''
+
+	def __init__(self, index:int, trigger:float, wait:float, missed:int, position:int):
+		"""
+		Args:
+		    index (int): The number of the frame, starting at 0.
+		    trigger (float): The tick the Trig was released.
+		    wait (float): The number of ticks the Trig waited for the trigger.
+		    missed (int): The number of trigger edges missed before this Trig.
+		    position (int): The scroll position when the Trig was released, see scroll_position.
+		"""
+		self.index = index
+		self.trigger = trigger
+		self.wait = wait
+		self.missed = missed
+		self.position = position
+		self.loads:list[tuple[int, int, int, int]] = [] # (DmdStartRow, rows, Inum, MemStartRow)
+		self.resets = 0
+		self.ticks = None # set when the next frame starts
+
+	@property
+	def rows(self) -> int:
+		return sum(load[1] for load in self.loads)
+
+
+class Violation:
+	'''A broken timing constraint or an invalid value at run time.'''
+
+	def __init__(self, tick:float, line:int, text:str, message:str):
+		self.tick = tick
+		self.line = line
+		self.text = text
+		self.message = message
+
+	def __repr__(self) -> str:
+		return f"Violation(tick={self.tick:g}, line={self.line}, {self.message!r})"
+
+
+class Pulse:
+	'''A «LightPulseWord»: the light is pulsed while the DMD shows the rows loaded before the last reset.'''
+
+	def __init__(self, tick:float, segments:tuple, value:int):
+		"""
+		Args:
+		    tick (float): The tick of the pulse.
+		    segments (tuple): The rows shown on the DMD, ((DmdStartRow, rows, Inum, MemStartRow), ...).
+		    value (int): The LightPulseWord value.
+		"""
+		self.tick = tick
+		self.segments = segments
+		self.value = value
+
+
+class Result:
+	'''The outcome of Interpreter.run.'''
+
+	def __init__(self, frames:list[Frame], ticks:float, violations:list[Violation], pulses:list[Pulse]=None):
+		self.frames = frames
+		self.ticks = ticks
+		self.violations = violations
+		self.pulses = pulses or []
+
+	@property
+	def duration(self) -> float:
+		'''Total run time in seconds.'''
+
+		return self.ticks * TICK_NS * 1e-9
+
+	@property
+	def missed_triggers(self) -> int:
+		return sum(frame.missed for frame in self.frames)
+
+	@property
+	def rows_loaded(self) -> int:
+		return sum(frame.rows for frame in self.frames)
+
+	@property
+	def scroll_rows(self) -> int:
+		'''The number of rows scrolled, summed over the changes of the scroll position between frames.'''
+
+		positions = [frame.position for frame in self.frames if frame.position is not None]
+		return sum(abs(b - a) for a, b in zip(positions, positions[1:]))
+
+	@property
+	def frame_rate(self) -> float:
+		return len(self.frames) / self.duration if self.ticks else 0.0
+
+	@property
+	def rows_per_second(self) -> float:
+		'''Rows loaded to the DMD per second.'''
+
+		return self.rows_loaded / self.duration if self.ticks else 0.0
+
+	@property
+	def scroll_rows_per_second(self) -> float:
+		'''Rows the image scrolls over the DMD per second.'''
+
+		return self.scroll_rows / self.duration if self.ticks else 0.0
+
+	def frame_ticks(self) -> tuple[float, float]:
+		'''The shortest and longest frame in ticks.'''
+
+		ticks = [frame.ticks for frame in self.frames if frame.ticks is not None]
+		return (min(ticks), max(ticks)) if ticks else (0, 0)
+
+	def summary(self) -> str:
+		shortest, longest = self.frame_ticks()
+		lines = [
+			f"Frames: {len(self.frames)} in {self.duration * 1e3:.3f} ms ({self.frame_rate:.1f} Hz)",
+			f"Frame length: {shortest:g}-{longest:g} ticks ({shortest * TICK_NS / 1e3:g}-{longest * TICK_NS / 1e3:g} us)",
+			f"Rows loaded: {self.rows_loaded} ({self.rows_per_second:.0f} rows/s)",
+			f"Rows scrolled: {self.scroll_rows} ({self.scroll_rows_per_second:.1f} rows/s)",
+			f"Missed triggers: {self.missed_triggers}",
+			f"Violations: {len(self.violations)}",
+		]
+		lines += [f"  line {v.line} at tick {v.tick:g}: {v.message}" for v in self.violations[:10]]
+		return "\n".join(lines)
+
+
+def scroll_position(variables:dict, inum_size:int=None) -> int:
+	'''The scroll position of the generated and hand-written scroll programs.'''
+
+	if "ScrollRow" in variables:
+		return variables["ScrollRow"]
+
+	if inum_size is not None and "Inum" in variables and "MemStartRow" in variables:
+		return variables["Inum"] * inum_size + variables["MemStartRow"] # spanning_scroll_program
+
+	return None
+
+
+def _overwrite(segments:list, dmd_row:int, rows:int, inum:int, mem_row:int) -> list:
+	'''Replace the DMD rows dmd_row to dmd_row + rows of segments with a new load.'''
+
+	end = dmd_row + rows
+	result = []
+
+	for start, count, seg_inum, seg_row in segments:
+		if start < dmd_row:
+			result.append((start, min(count, dmd_row - start), seg_inum, seg_row))
+		if start + count > end:
+			first = max(start, end)
+			result.append((first, start + count - first, seg_inum, seg_row + first - start))
+
+	result.append((dmd_row, rows, inum, mem_row))
+	return sorted(result)
+
+
+def _wrap(value:int) -> int:
+	'''Wrap to the signed 16-bit range of the sequencer CPU.'''
+
+	return (value + 0x8000) % 0x10000 - 0x8000
+
+
+class Interpreter:
+	'''Executes a sequence program tick by tick.'''
+
+	def __init__(self, program:Program | str, trigger:Trigger=None, registers:dict=None, mask:bool=None,
+				 dmd_rows:int=1080, inum_size:int=None, rows_minus_one:bool=True, position=None):
+		"""
+		Args:
+		    program (Program | str): The program, or the contents of a sequence file.
+		    trigger (Trigger): The trigger source. Defaults to a free-running sequencer.
+		    registers (dict): Sequencer register values, {register number: value}, read by «AssignVarReg».
+		    mask (bool): A mask image is enabled. Defaults to program.mask.
+		    dmd_rows (int): The number of rows on the DMD.
+		    inum_size (int): Rows per inum, to check that loads stay inside their inum.
+		    rows_minus_one (bool): The NO_OF_ROWS parameter of «LoadRow» is the number of rows minus one,
+		        like «LoadRows 1079» in the files in test/test-seq.
+		    position (callable): Returns the scroll position from the variables, defaults to scroll_position.
+		"""
+		if isinstance(program, str):
+			program = Program.from_text(program)
+		elif any(command.line is None for command in program.commands):
+			program = Program.from_text(program.text(), program.mask) # number the lines of a generated program
+
+		self.program = program
+		self.trigger = trigger or Trigger()
+		self.registers = registers or {}
+		self.mask = program.mask if mask is None else mask
+		self.dmd_rows = dmd_rows
+		self.inum_size = inum_size
+		self.rows_minus_one = rows_minus_one
+		self.position = position or (lambda variables: scroll_position(variables, inum_size))
+
+		self.commands = program.commands
+		self.labels = {c.params[0]: i for i, c in enumerate(self.commands) if c.name == "Label"}
+
+	def _value(self, token:str, command) -> int:
+		if token in self.variables:
+			return self.variables[token]
+
+		if token in self.aliases:
+			return self.aliases[token]
+
+		if token[:1].isalpha():
+			raise InterpreterValueError(f"Line {command.line}: {token!r} is not defined.")
+
+		return parse_number(token, command.line)
+
+	def _set(self, name:str, value:int, command):
+		wrapped = _wrap(value)
+		if wrapped != value:
+			self._violation(command, f"{name} = {value} overflows the 16-bit variables (wraps to {wrapped})")
+		self.variables[name] = wrapped
+
+	def _violation(self, command, message:str):
+		self.violations.append(Violation(self.tick, command.line, command.text(), message))
+
+	def _jump(self, label:str, command) -> int:
+		if label not in self.labels:
+			raise InterpreterValueError(f"Line {command.line}: label {label!r} is not defined.")
+		return self.labels[label]
+
+	def _check_timing(self, command):
+		if self.tick < self.load_done:
+			self._violation(command, f"{command.name} {self.load_done - self.tick:g} ticks before the previous load completes")
+		if self.tick < self.settled:
+			self._violation(command, f"{command.name} {self.settled - self.tick:g} ticks before the DMD has settled after a reset")
+
+	def _load(self, command, dmd_row:int, rows:int, inum:int, mem_row:int):
+		self._check_timing(command)
+
+		if rows < 1 or dmd_row < 0 or dmd_row + rows > self.dmd_rows:
+			self._violation(command, f"Loading {rows} rows to DMD row {dmd_row} is outside the DMD")
+		if mem_row < 0 or (self.inum_size is not None and mem_row + rows > self.inum_size):
+			self._violation(command, f"Loading rows {mem_row}-{mem_row + rows - 1} is outside inum {inum}")
+
+		row_ns = MASK_ROW_LOAD_NS if self.mask else ROW_LOAD_NS
+		self.load_done = self.tick + rows * row_ns / TICK_NS
+
+		if self.frame is not None:
+			self.frame.loads.append((dmd_row, rows, inum, mem_row))
+
+		self.dmd = _overwrite(self.dmd, dmd_row, rows, inum, mem_row)
+
+	def _trig(self, command) -> float:
+		'''Wait for the trigger and start a new frame. Returns the tick the Trig is released.'''
+
+		timeout = command.waitfor or 0
+		edge = self.trigger.next_edge(self.tick)
+		missed = 0 if self.last_edge is None else self.trigger.edges_between(self.last_edge, edge)
+
+		if timeout and edge - self.tick > timeout:
+			release = self.tick + timeout # timed out, continue without a trigger
+		else:
+			release = edge
+			self.last_edge = edge
+
+		if self.frame is not None:
+			self.frame.ticks = release - self.frame.trigger
+
+		self.frame = Frame(len(self.frames), release, release - self.tick, missed, self.position(self.variables))
+		self.frames.append(self.frame)
+		return max(release, self.tick + 1)
+
+	def run(self, frames:int=None, max_ticks:float=None) -> Result:
+		"""Run the program from the start.
+
+		Args:
+		    frames (int): Stop after this many complete frames, at the trigger starting the next frame.
+		    max_ticks (float): Stop after this many ticks.
+
+		Returns:
+		    Result: Frames, duration and constraint violations.
+		"""
+		if frames is None and max_ticks is None:
+			raise InterpreterValueError("Give the number of frames or ticks to run.")
+
+		self.variables, self.aliases = {}, {}
+		self.frames, self.violations = [], []
+		self.frame, self.last_edge = None, None
+		self.dmd, self.displayed, self.pulses = [], (), []
+		self.tick, self.load_done, self.settled = 0.0, 0.0, 0.0
+		pc = 0
+
+		for _ in range(MAX_STEPS):
+			if pc >= len(self.commands):
+				raise InterpreterValueError("The program ended without a Jump. The last line must be a Jump or JumpIf.")
+
+			command = self.commands[pc]
+			name, params = command.name, command.params
+			ticks = max(command.waitfor or 0, 1)
+			pc += 1
+
+			if name == "Trig":
+				if frames is not None and len(self.frames) == frames:
+					# The last frame lasts until the trigger that would start the next one
+					self.tick = max(self.trigger.next_edge(self.tick), self.tick)
+					self.frame.ticks = self.tick - self.frame.trigger
+					break
+				self.tick = self._trig(command)
+				continue
+
+			if max_ticks is not None and self.tick >= max_ticks:
+				break
+
+			if name in ("DeclareLabel", "Label"):
+				ticks = command.waitfor or 0 # labels are not executed, see test/test-seq/Frame_Display_8bit.seq
+			elif name == "Alias":
+				self.aliases[params[0]] = parse_number(params[1], command.line)
+				ticks = 0
+			elif name == "AssignVar":
+				self.variables[params[0]] = _wrap(self._value(params[1], command))
+			elif name == "AssignVarReg":
+				self.variables[params[0]] = _wrap(self.registers.get(parse_number(params[1], command.line), 0))
+			elif name == "Add":
+				self._set(params[0], self._value(params[0], command) + self._value(params[1], command), command)
+			elif name == "Mult":
+				self._set(params[0], self._value(params[1], command) * self._value(params[2], command), command)
+			elif name in ("And", "Or", "Xor"):
+				a, b = self._value(params[1], command), self._value(params[2], command)
+				self.variables[params[0]] = _wrap({"And": a & b, "Or": a | b, "Xor": a ^ b}[name])
+			elif name == "Not":
+				self.variables[params[0]] = _wrap(~self._value(params[1], command))
+			elif name in ("ShiftLeft", "ShiftRight"):
+				value, bits = self._value(params[0], command), parse_number(params[1], command.line)
+				self._set(params[0], value << bits if name == "ShiftLeft" else value >> bits, command)
+			elif name == "Jump":
+				pc = self._jump(params[0], command)
+			elif name == "JumpIf":
+				a, b = self._value(params[0], command), self._value(params[2], command)
+				if (a < b) if params[1] == "<" else (a > b):
+					pc = self._jump(params[3], command)
+			elif name == "LoadRow":
+				dmd_row, rows, inum, mem_row = (self._value(p, command) for p in params)
+				self._load(command, dmd_row, rows + 1 if self.rows_minus_one else rows, inum, mem_row)
+			elif name == "LoadGlobal":
+				self._load(command, 0, self.dmd_rows, self._value(params[0], command), 0)
+			elif name == "ResetGlobal":
+				self._check_timing(command)
+				self.settled = self.tick + RESET_TICKS
+				self.displayed = tuple(self.dmd)
+				if self.frame is not None:
+					self.frame.resets += 1
+			elif name == "Wait":
+				value = self._value(params[0], command)
+				base, wait = value >> 22, value & 0x3FFFFF
+				ticks = wait * (4000 if base else 1) # 1 ms = 4000 ticks
+			elif name == "LightPulseWord":
+				self.pulses.append(Pulse(self.tick, self.displayed, self._value(params[0], command)))
+			elif name not in ("LightSetWord", "OutputSetBit", "OutputClearBit", "OutputSetWord"):
+				raise InterpreterValueError(f"Line {command.line}: {name} is not supported by the interpreter.")
+
+			self.tick += ticks
+		else:
+			raise InterpreterValueError(f"No Trig within {MAX_STEPS} commands.")
+
+		return Result(self.frames, self.tick, self.violations, self.pulses)
+
+
+def simulate(program:Program | str, frequency:float=None, frames:int=None, max_ticks:float=None, **kwargs) -> Result:
+	"""Run a program against a periodic trigger.
+
+	Args:
+	    program (Program | str): The program, or the contents of a sequence file.
+	    frequency (float): Trigger frequency in Hz, None for a free-running sequencer.
+	    frames (int): The number of frames to run.
+	    max_ticks (float): The number of ticks to run.
+	    kwargs: Passed to Interpreter.
+
+	Returns:
+	    Result: Frames, duration and constraint violations.
+	"""
+	return Interpreter(program, Trigger(frequency), **kwargs).run(frames, max_ticks)
+
+
+def scroll_velocity(result:Result, distance:float, rows:int, dmd_rows:int=1080) -> float:
+	"""The stage velocity matching the scroll speed of a simulated program.
+
+	Args:
+	    result (Result): The result of simulate.
+	    distance (float): The stage distance of one scroll pass, e.g. SCROLLING_DIST in mm.
+	    rows (int): The number of rows of the strip. One pass scrolls rows - dmd_rows rows.
+	    dmd_rows (int): The number of rows on the DMD.
+
+	Returns:
+	    float: The velocity in units of distance per second, e.g. SCROLLING_VELOCITY in mm/s.
+	"""
+	return result.scroll_rows_per_second * distance / (rows - dmd_rows)
+
+
+class InterpreterValueError(ValueError):
+	'''Errors raised while interpreting a sequence program.'''
+	pass
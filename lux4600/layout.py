@@ -0,0 +1,205 @@
+from PIL import Image
+from typing import Iterator
+from img import Strip, MAX_INUM_ROWS
+from tracing import TRACER
+
+#
+# Memory layout planner for stitched inums.
+# Packs the grayscale planes of one or more strips into row ranges of projector memory,
+# replacing hand computed paste offsets such as FULL_HEIGHT * FACTOR.
+#
+
+
+class LayoutEntry:
+    '''The placement of one grayscale plane of a strip in projector memory.'''
+
+    def __init__(self, strip, plane:int, inum:int, row_offset:int, image:Image.Image):
+        """
+        Args:
+            strip: The name of the strip the plane belongs to.
+            plane (int): The index of the grayscale plane within the strip.
+            inum (int): The inum the plane is stored in.
+            row_offset (int): The first row of the plane within the inum.
+            image (Image.Image): The image data of the plane.
+        """
+        self.strip = strip
+        self.plane = plane
+        self.inum = inum
+        self.row_offset = row_offset
+        self.image = image
+        self.rows = image.height
+
+    def __repr__(self):
+        return f"LayoutEntry(strip={self.strip!r}, plane={self.plane}, inum={self.inum}, row_offset={self.row_offset}, rows={self.rows})"
+
+
+class Layout:
+    '''A manifest of (strip, plane) -> (inum, row offset) placements sharing a single inum size.'''
+
+    def __init__(self, inum_size:int, width:int, entries:list[LayoutEntry]):
+        self.inum_size = inum_size
+        self.width = width
+        self.entries = entries
+
+    def __getitem__(self, key) -> LayoutEntry:
+        '''Return the entry of a (strip, plane) pair.'''
+
+        for entry in self.entries:
+            if (entry.strip, entry.plane) == key:
+                return entry
+
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[LayoutEntry]:
+        return iter(self.entries)
+
+    @property
+    def manifest(self) -> dict:
+        '''Return the layout as {(strip, plane): (inum, row_offset)}.'''
+
+        return {(e.strip, e.plane): (e.inum, e.row_offset) for e in self.entries}
+
+    @property
+    def inums(self) -> list[int]:
+        '''Return the sorted list of inums used by the layout.'''
+
+        return sorted({e.inum for e in self.entries})
+
+    def strips(self) -> list:
+        '''Return the strip names in the order they were planned.'''
+
+        names = []
+        for entry in self.entries:
+            if entry.strip not in names:
+                names.append(entry.strip)
+        return names
+
+    def variables(self, strip) -> dict:
+        """
+        Sequencer variables for scrolling a strip of the layout.
+
+        Planes of a strip are stored contiguously, so plane i starts at MemStartRow + i * TotalRows.
+        The keys match the variable names used by the sequence files in test/test-seq.
+
+        Returns:
+            dict: {"Inum", "MemStartRow", "TotalRows", "Factor"}
+        """
+        planes = [e for e in self.entries if e.strip == strip]
+
+        if not planes:
+            raise KeyError(strip)
+
+        return {
+            "Inum": planes[0].inum,
+            "MemStartRow": planes[0].row_offset,
+            "TotalRows": planes[0].rows,
+            "Factor": len(planes)
+        }
+
+    def to_strips(self) -> Iterator[Strip]:
+        '''Yield one stitched Strip (inum_size rows tall) for each inum of the layout.'''
+
+        for inum in self.inums:
+            image = Image.new('L', (self.width, self.inum_size), 0)
+
+            for entry in self.entries:
+                if entry.inum == inum:
+                    image.paste(entry.image, (0, entry.row_offset))
+
+            yield Strip(image, inum)
+
+
+@TRACER.traced("plan_layout")
+def plan_layout(strips:dict, base_inum:int=0, max_inum_rows:int=MAX_INUM_ROWS, row_align:int=1) -> Layout:
+    """
+    Assign the grayscale planes of a set of strips to row ranges in projector memory.
+
+    The planes of each strip are kept together as one block (plane i at block offset + i * rows),
+    which is the addressing used by the grayscale sequence files. Blocks are packed first-fit,
+    largest first, into as few inums as possible. All inums share one size, since SetInumSize
+    is global.
+
+    Args:
+        strips (dict): Strip names mapped to a list of plane images, e.g. the output of multiply_image.
+            All planes must have the same width, and all planes of a strip the same height.
+        base_inum (int): The first inum to use.
+        max_inum_rows (int): The maximum number of rows per inum.
+        row_align (int): The inum size is rounded up to a multiple of this value,
+            e.g. the lines_per_packet used for the upload.
+
+    Returns:
+        Layout: The planned layout.
+
+    Raises:
+        LayoutValueError: If the planes do not fit the constraints above.
+    """
+    blocks = []
+    width = None
+
+    for name, planes in strips.items():
+        planes = list(planes)
+        LayoutValueError.check_planes(name, planes)
+
+        if width is None:
+            width = planes[0].width
+        LayoutValueError.check_width(name, planes[0].width, width)
+
+        rows = planes[0].height * len(planes)
+        LayoutValueError.check_block_size(name, rows, max_inum_rows)
+        blocks.append((name, planes, rows))
+
+    # First-fit decreasing. sorted() is stable, so equally sized strips keep their order.
+    bins = [] # [used rows, [blocks]]
+    for block in sorted(blocks, key=lambda b: -b[2]):
+        for inum_bin in bins:
+            if inum_bin[0] + block[2] <= max_inum_rows:
+                inum_bin[0] += block[2]
+                inum_bin[1].append(block)
+                break
+        else:
+            bins.append([block[2], [block]])
+
+    inum_size = max((inum_bin[0] for inum_bin in bins), default=0)
+    inum_size = -(-inum_size // row_align) * row_align
+    LayoutValueError.check_block_size("layout", inum_size, max_inum_rows)
+
+    entries = []
+    for i, (_, bin_blocks) in enumerate(bins):
+        row_offset = 0
+        for name, planes, _ in bin_blocks:
+            for plane, image in enumerate(planes):
+                entries.append(LayoutEntry(name, plane, base_inum + i, row_offset, image))
+                row_offset += image.height
+
+    return Layout(inum_size, width, entries)
+
+
+class LayoutValueError(ValueError):
+    """Exception raised for parameter value errors in the layout planner."""
+
+    @staticmethod
+    def check_planes(name, planes:list):
+
+        if len(planes) == 0:
+            raise LayoutValueError(f"Strip {name} has no planes.")
+
+        if any(p.size != planes[0].size for p in planes):
+            raise LayoutValueError(f"All planes of strip {name} must have the same size.")
+
+    @staticmethod
+    def check_width(name, width:int, expected:int):
+
+        if width != expected:
+            raise LayoutValueError(
+                f"""Strip {name} is {width} pixels wide.
+                All strips must be {expected} pixels wide."""
+                )
+
+    @staticmethod
+    def check_block_size(name, rows:int, max_inum_rows:int):
+
+        if rows > max_inum_rows:
+            raise LayoutValueError(
+                f"""{name} needs {rows} rows, more than fits in one inum.
+                {max_inum_rows} rows max."""
+                )
@@ -0,0 +1,194 @@
+import hashlib
+from collections import OrderedDict
+from PIL import Image
+
+#
+# Model of the projector image memory.
+# Tracks which named images are resident in which inums, so images that are still
+# in memory from a previous job are not uploaded again.
+#
+
+
+def content_hash(image:Image.Image) -> str:
+    '''Return a hash of the 1-bit pixel data of an image.'''
+
+    image = image.convert("1")
+    return hashlib.sha1(repr(image.size).encode() + image.tobytes()).hexdigest()
+
+
+class Residency:
+    '''An image resident in projector memory.'''
+
+    def __init__(self, name:str, inum:int, num_inums:int, rows:int, digest:str):
+        """
+        Args:
+            name (str): The name the image was stored under.
+            inum (int): The first inum of the region holding the image.
+            num_inums (int): The number of consecutive inums in the region.
+            rows (int): The number of rows of the image.
+            digest (str): The content hash of the image, see content_hash.
+        """
+        self.name = name
+        self.inum = inum
+        self.num_inums = num_inums
+        self.rows = rows
+        self.digest = digest
+
+    def variables(self) -> dict:
+        '''Sequencer variables addressing the image, see grayscale.get_scroll_parameters.'''
+
+        return {"Inum": self.inum, "MemStartRow": 0, "TotalRows": self.rows}
+
+    def __repr__(self):
+        return f"Residency(name={self.name!r}, inum={self.inum}, num_inums={self.num_inums}, rows={self.rows})"
+
+
+class ImageMemory:
+    '''Residency table of the projector image memory with least-recently-used eviction.'''
+
+    def __init__(self, capacity_rows:int, inum_size:int, base_inum:int=0):
+        """
+        Args:
+            capacity_rows (int): The number of (1920 pixel wide, 1-bit) rows the projector can store.
+            inum_size (int): The inum size used for every image, see records.SetInumSize.
+                Every upload through the memory manager uses this inum size. Images taller
+                than inum_size are stored in consecutive inums.
+            base_inum (int): The first inum managed. Inums below it are left to the caller.
+
+        Attributes:
+            num_inums (int): The number of inums that fit in the capacity.
+            residents (OrderedDict): Resident images by name, least recently used first.
+        """
+        MemoryValueError.check_inum_size(inum_size)
+
+        self.capacity_rows = capacity_rows
+        self.inum_size = inum_size
+        self.base_inum = base_inum
+        self.num_inums = capacity_rows // inum_size - base_inum
+
+        self.residents:OrderedDict[str, Residency] = OrderedDict()
+
+    def lookup(self, name:str, digest:str=None) -> Residency | None:
+        """
+        Return the residency of an image and mark it as recently used.
+
+        Args:
+            name (str): The name of the image.
+            digest (str): If given, the image only counts as resident if its content hash matches.
+
+        Returns:
+            Residency: The residency, or None if the image is not (or no longer) resident.
+        """
+        residency = self.residents.get(name)
+
+        if residency is None or (digest is not None and residency.digest != digest):
+            return None
+
+        self.residents.move_to_end(name)
+        return residency
+
+    def allocate(self, name:str, rows:int, digest:str) -> Residency:
+        """
+        Allocate a region for an image, evicting least recently used images until it fits.
+        A previous image with the same name is replaced.
+
+        Args:
+            name (str): The name of the image.
+            rows (int): The number of rows of the image.
+            digest (str): The content hash of the image.
+
+        Returns:
+            Residency: The allocated region.
+
+        Raises:
+            MemoryValueError: If the image can not fit in the projector memory.
+        """
+        num_inums = -(-rows // self.inum_size)
+        MemoryValueError.check_num_inums(num_inums, self.num_inums)
+
+        self.evict(name)
+
+        inum = self._find_free(num_inums)
+
+        while inum is None:
+            self.residents.popitem(last=False) # Evict the least recently used image
+            inum = self._find_free(num_inums)
+
+        residency = Residency(name, inum, num_inums, rows, digest)
+        self.residents[name] = residency
+
+        return residency
+
+    def ensure(self, name:str, image:Image.Image) -> tuple[Residency, bool]:
+        """
+        Look up an image, allocating a region for it if it is not resident.
+
+        Args:
+            name (str): The name of the image.
+            image (Image.Image): The image data.
+
+        Returns:
+            Residency: The region holding the image.
+            bool: True if the image must be uploaded to the region.
+        """
+        digest = content_hash(image)
+        residency = self.lookup(name, digest)
+
+        if residency is not None:
+            return residency, False
+
+        return self.allocate(name, image.height, digest), True
+
+    def evict(self, name:str):
+        '''Forget an image, freeing its region.'''
+
+        self.residents.pop(name, None)
+
+    def clear(self):
+        '''Forget all images, e.g. after the projector has been power cycled.'''
+
+        self.residents.clear()
+
+    @property
+    def free_inums(self) -> int:
+        '''Return the number of unallocated inums.'''
+
+        return self.num_inums - sum(r.num_inums for r in self.residents.values())
+
+    def _find_free(self, num_inums:int) -> int | None:
+        '''Return the first inum of the first run of num_inums free inums, or None.'''
+
+        used = sorted((r.inum, r.inum + r.num_inums) for r in self.residents.values())
+        start = self.base_inum
+
+        for first, end in used:
+            if first - start >= num_inums:
+                return start
+            start = max(start, end)
+
+        if self.base_inum + self.num_inums - start >= num_inums:
+            return start
+
+        return None
+
+
+class MemoryValueError(ValueError):
+    """Exception raised for parameter value errors in the ImageMemory class."""
+
+    @staticmethod
+    def check_inum_size(inum_size:int):
+
+        if inum_size < 1 or inum_size > 65535:
+            raise MemoryValueError(
+                f"""inum size must be between 1 and 65535 rows.
+                {inum_size} rows."""
+                )
+
+    @staticmethod
+    def check_num_inums(num_inums:int, capacity:int):
+
+        if num_inums > capacity:
+            raise MemoryValueError(
+                f"""Image does not fit in the projector memory.
+                {num_inums} inums, {capacity} inums max."""
+                )
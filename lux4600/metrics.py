@@ -0,0 +1,239 @@
+import bisect
+import functools
+import json
+import math
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+#
+# Metrics of uploads and prints.
+# Counters, gauges and latency histograms, exported as JSON lines or in the Prometheus text format.
+# Histograms have fixed log-spaced buckets, so recording a value is a bisect and an increment.
+#
+
+PREFIX = "lux4600_" # Prefix of the Prometheus metric names
+
+# Bucket upper bounds in seconds: 4 per decade from 10 µs to 10 s
+BUCKETS = tuple(10 ** (exponent / 4) for exponent in range(-20, 5))
+
+
+class Counter:
+    '''Monotonically increasing count, e.g. packets sent.'''
+
+    kind = "counter"
+
+    def __init__(self, name:str, labels:dict=None):
+        self.name = name
+        self.labels = labels or {}
+        self.value = 0
+
+    def inc(self, amount:float=1):
+        self.value += amount
+
+    def snapshot(self) -> dict:
+        return {"value": self.value}
+
+    def summary(self) -> str:
+        return f"{self.name}{format_labels(self.labels)}: {self.value:g}"
+
+
+class Gauge(Counter):
+    '''Value that can go up and down, e.g. the throughput of the last upload.'''
+
+    kind = "gauge"
+
+    def set(self, value:float):
+        self.value = value
+
+
+class Histogram:
+    '''Histogram of latencies in seconds.'''
+
+    kind = "histogram"
+
+    def __init__(self, name:str, labels:dict=None, buckets:tuple=BUCKETS):
+        """
+        Args:
+            name (str): The name of the histogram.
+            labels (dict): Labels distinguishing histograms of the same name, e.g. {"record": "SetInumSize"}.
+            buckets (tuple): Increasing bucket upper bounds. Values above the last bound are counted in an overflow bucket.
+        """
+        self.name = name
+        self.labels = labels or {}
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value:float):
+        '''Record a value.'''
+
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q:float) -> float:
+        '''Return the upper bound of the bucket holding quantile q (0-1), max for the overflow bucket.'''
+
+        if not self.count:
+            return math.nan
+
+        rank = q * self.count
+        total = 0
+
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= rank and total:
+                return min(bound, self.max)
+
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else math.nan
+
+    def snapshot(self) -> dict:
+        return {"count": self.count, "sum": self.sum, "max": self.max,
+                "p50": self.quantile(0.5), "p99": self.quantile(0.99)}
+
+    def summary(self) -> str:
+        return (f"{self.name}{format_labels(self.labels)}: n={self.count} mean={self.mean * 1e3:.2f} ms "
+                f"p50={self.quantile(0.5) * 1e3:.2f} ms p99={self.quantile(0.99) * 1e3:.2f} ms max={self.max * 1e3:.2f} ms")
+
+    def __repr__(self):
+        return f"Histogram({self.summary()})"
+
+
+def format_labels(labels:dict) -> str:
+    '''Return labels in the Prometheus format, e.g. {record="SetInumSize"}.'''
+
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+
+class Registry:
+    '''Metrics by name and labels.'''
+
+    def __init__(self):
+        self.metrics:dict[tuple, Counter | Gauge | Histogram] = {}
+
+    def _get(self, cls, name:str, labels:dict):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self.metrics.get(key)
+        if metric is None:
+            metric = self.metrics[key] = cls(name, labels)
+        return metric
+
+    def counter(self, name:str, **labels) -> Counter:
+        '''Return the counter called name with labels, created on first use.'''
+        return self._get(Counter, name, labels)
+
+    def gauge(self, name:str, **labels) -> Gauge:
+        '''Return the gauge called name with labels, created on first use.'''
+        return self._get(Gauge, name, labels)
+
+    def histogram(self, name:str, **labels) -> Histogram:
+        '''Return the histogram called name with labels, created on first use.'''
+        return self._get(Histogram, name, labels)
+
+    @contextmanager
+    def timer(self, stage:str):
+        '''Record the duration of a block in the stage_seconds histogram of the stage.'''
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.histogram("stage_seconds", stage=stage).observe(time.perf_counter() - start)
+
+    def timed(self, stage:str):
+        '''Decorator recording the duration of every call, see timer.'''
+
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.timer(stage):
+                    return function(*args, **kwargs)
+            return wrapper
+
+        return decorator
+
+    def report(self) -> str:
+        '''One summary line per metric.'''
+
+        return "\n".join(metric.summary() for metric in self.metrics.values())
+
+    def write_json_lines(self, path:str):
+        '''Append a snapshot of every metric to path, one JSON object per line.'''
+
+        t = time.time()
+
+        with open(path, "a") as file:
+            for metric in self.metrics.values():
+                line = {"time": t, "name": metric.name, "type": metric.kind, "labels": metric.labels}
+                line.update(metric.snapshot())
+                file.write(json.dumps(line) + "\n")
+
+    def prometheus(self) -> str:
+        '''Return every metric in the Prometheus text exposition format.'''
+
+        lines = []
+        typed = set()
+
+        for metric in sorted(self.metrics.values(), key=lambda metric: metric.name): # Series of a metric must be contiguous
+            name = PREFIX + metric.name
+
+            if name not in typed:
+                lines.append(f"# TYPE {name} {metric.kind}")
+                typed.add(name)
+
+            if metric.kind != "histogram":
+                lines.append(f"{name}{format_labels(metric.labels)} {metric.value:g}")
+                continue
+
+            total = 0
+            for bound, count in zip(metric.buckets + (math.inf,), metric.counts):
+                total += count
+                le = "+Inf" if bound == math.inf else f"{bound:g}"
+                lines.append(f"{name}_bucket{format_labels({**metric.labels, 'le': le})} {total}")
+
+            lines.append(f"{name}_sum{format_labels(metric.labels)} {metric.sum:g}")
+            lines.append(f"{name}_count{format_labels(metric.labels)} {metric.count}")
+
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path:str):
+        '''Write every metric to path, e.g. for the node exporter textfile collector. The file is replaced atomically.'''
+
+        with open(path + ".tmp", "w") as file:
+            file.write(self.prometheus())
+        os.replace(path + ".tmp", path)
+
+
+def shared_default(module_name:str, attr:str, factory):
+    """
+    Return the default object of a package module, e.g. its registry, created by factory for the first import.
+
+    The package modules import each other by module name (see __init__), so a module can be loaded both as
+    name and as lux4600.name. Both copies share the object created first.
+
+    Args:
+        module_name (str): __name__ of the module.
+        attr (str): The module attribute holding the object.
+        factory (callable): Creates the object.
+    """
+    name = module_name.removeprefix("lux4600.")
+
+    for loaded in (sys.modules.get(name), sys.modules.get(f"lux4600.{name}")):
+        if getattr(loaded, attr, None) is not None:
+            return getattr(loaded, attr)
+
+    return factory()
+
+
+REGISTRY = shared_default(__name__, "REGISTRY", Registry) # Default registry
@@ -0,0 +1,258 @@
+import heapq
+import logging
+import random
+import select
+import socket
+import threading
+import time
+
+#
+# Network impairment relay for upload stress tests.
+# Sits between Projector and a projector endpoint (the projector or simulator.ProjectorSimulator) on local
+# UDP ports and delays, drops, reorders and duplicates datagrams like a congested network.
+#
+
+logger = logging.getLogger("lux4600.netem")
+
+# Impairment profiles by name, see Impairment
+PRESETS = {
+    "clean": {},
+    "lan": {"latency": 0.0002, "jitter": 0.0001},
+    "lossy": {"latency": 0.0005, "jitter": 0.0002, "loss": 0.01},
+    "reordering": {"latency": 0.0005, "reorder": 0.05, "reorder_delay": 0.002},
+    "congested": {"latency": 0.002, "jitter": 0.001, "loss": 0.005, "reorder": 0.01, "duplicate": 0.005,
+                  "bandwidth": 100e6 / 8, "queue": 0.01},
+    "hostile": {"latency": 0.005, "jitter": 0.003, "loss": 0.05, "reorder": 0.05, "duplicate": 0.02,
+                "bandwidth": 10e6 / 8, "queue": 0.02},
+}
+
+
+class Impairment:
+    '''Impairments of one direction of a link.'''
+
+    def __init__(self, loss:float=0.0, reorder:float=0.0, reorder_delay:float=0.001, duplicate:float=0.0,
+                 latency:float=0.0, jitter:float=0.0, bandwidth:float=None, queue:float=None):
+        """
+        Args:
+            loss (float): Probability a datagram is dropped.
+            reorder (float): Probability a datagram is held back by reorder_delay, so later datagrams overtake it.
+            reorder_delay (float): Extra delay of reordered datagrams in seconds.
+            duplicate (float): Probability a datagram is delivered twice.
+            latency (float): One-way delay in seconds.
+            jitter (float): Uniform random extra delay, 0 to jitter seconds.
+            bandwidth (float): Link rate in bytes per second, None for unlimited.
+            queue (float): Longest queueing delay in seconds before datagrams are tail-dropped, None for unlimited.
+        """
+        self.loss = loss
+        self.reorder = reorder
+        self.reorder_delay = reorder_delay
+        self.duplicate = duplicate
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.queue = queue
+
+    @classmethod
+    def preset(cls, name:str, **overrides) -> 'Impairment':
+        '''Return the impairment of a preset in PRESETS, with some parameters overridden.'''
+        return cls(**{**PRESETS[name], **overrides})
+
+    def __repr__(self):
+        return f"Impairment({', '.join(f'{key}={value}' for key, value in vars(self).items())})"
+
+
+class Link:
+    '''One direction of the relay: schedules the delivery of datagrams through an Impairment.'''
+
+    def __init__(self, name:str, impairment:Impairment, rng:random.Random):
+        self.name = name
+        self.impairment = impairment
+        self.rng = rng
+        self.free_at = 0.0 # Time the link has sent the queued datagrams, for the bandwidth cap
+        self.stats = {"received": 0, "delivered": 0, "dropped": 0, "queue_dropped": 0, "reordered": 0, "duplicated": 0}
+
+    def schedule(self, size:int, now:float) -> list[float]:
+        '''Return the delivery times of a datagram of size bytes received at now, none if it is dropped.'''
+
+        impairment = self.impairment
+        rng = self.rng
+        self.stats["received"] += 1
+
+        if impairment.loss and rng.random() < impairment.loss:
+            self.stats["dropped"] += 1
+            return []
+
+        sent = now
+        if impairment.bandwidth:
+            start = max(now, self.free_at)
+            if impairment.queue is not None and start - now > impairment.queue:
+                self.stats["queue_dropped"] += 1
+                return []
+            self.free_at = start + size / impairment.bandwidth
+            sent = self.free_at
+
+        copies = 2 if impairment.duplicate and rng.random() < impairment.duplicate else 1
+        if copies == 2:
+            self.stats["duplicated"] += 1
+
+        times = []
+        for _ in range(copies):
+            delay = impairment.latency + (rng.uniform(0, impairment.jitter) if impairment.jitter else 0.0)
+
+            if impairment.reorder and rng.random() < impairment.reorder:
+                self.stats["reordered"] += 1
+                delay += impairment.reorder_delay
+
+            times.append(sent + delay)
+
+        return times
+
+
+class Relay:
+    '''UDP relay between a client (Projector) and a projector endpoint, impairing both ports in both directions.'''
+
+    def __init__(self, target_host:str, target_port:int, target_image_data_port:int,
+                 impairment:Impairment | str = "clean", reply_impairment:Impairment | str = None,
+                 image_data_impairment:Impairment | str = None, host:str="127.0.0.1", port:int=0, image_data_port:int=0, seed:int=0):
+        """
+        Args:
+            target_host, target_port, target_image_data_port: The projector endpoint.
+            impairment (Impairment | str): Impairment of the datagrams to the endpoint, or a preset name.
+            reply_impairment (Impairment | str): Impairment of the replies, defaults to impairment.
+            image_data_impairment (Impairment | str): Impairment of the image data, defaults to impairment.
+            host (str): The address the relay listens on.
+            port, image_data_port (int): The ports the relay listens on, 0 for free ports. Connect Projector to these.
+            seed (int): Seed of the random impairments, so runs are reproducible.
+
+        Attributes:
+            links (dict): The Link of each direction, "control", "image_data" and "reply".
+        """
+        self.target = target_host
+        self.target_ports = {"control": target_port, "image_data": target_image_data_port}
+
+        self.listen = {}
+        self.upstream = {}
+        for name, listen_port in (("control", port), ("image_data", image_data_port)):
+            self.listen[name] = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.listen[name].bind((host, listen_port))
+            self.upstream[name] = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.upstream[name].bind((host, 0))
+            for sock in (self.listen[name], self.upstream[name]):
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 << 20)
+
+        self.port = self.listen["control"].getsockname()[1]
+        self.image_data_port = self.listen["image_data"].getsockname()[1]
+
+        self.seed = seed
+        self.client = {} # The address of the client on each port, replies are relayed to it
+        self.queue = [] # (delivery time, order, link, socket, data, address)
+        self.order = 0
+        self.condition = threading.Condition()
+        self._stop = threading.Event()
+        self._threads = []
+
+        self.set_impairment(impairment, reply_impairment, image_data_impairment)
+
+    def set_impairment(self, impairment:Impairment | str, reply_impairment:Impairment | str = None,
+                       image_data_impairment:Impairment | str = None):
+        '''Change the impairments, e.g. between phases of a test. The random sequence restarts from the seed.'''
+
+        def resolve(value):
+            return Impairment.preset(value) if isinstance(value, str) else value
+
+        impairment = resolve(impairment)
+        reply_impairment = impairment if reply_impairment is None else resolve(reply_impairment)
+        image_data_impairment = impairment if image_data_impairment is None else resolve(image_data_impairment)
+
+        rng = random.Random(self.seed)
+        self.links = {
+            "control": Link("control", impairment, rng),
+            "image_data": Link("image_data", image_data_impairment, rng),
+            "reply": Link("reply", reply_impairment, rng),
+        }
+
+    def stats(self) -> dict:
+        '''Datagram counts of each direction.'''
+        return {name: dict(link.stats) for name, link in self.links.items()}
+
+    def enqueue(self, link:Link, sock:socket.socket, data:bytes, address:tuple):
+        now = time.perf_counter()
+
+        with self.condition:
+            for when in link.schedule(len(data), now):
+                heapq.heappush(self.queue, (when, self.order, link, sock, data, address))
+                self.order += 1
+            self.condition.notify()
+
+    def receive(self):
+        '''Receive datagrams from the client and the endpoint and queue them for delivery.'''
+
+        sockets = {sock: ("listen", name) for name, sock in self.listen.items()}
+        sockets.update({sock: ("upstream", name) for name, sock in self.upstream.items()})
+
+        while not self._stop.is_set():
+            readable, _, _ = select.select(list(sockets), [], [], 0.05)
+
+            for sock in readable:
+                side, name = sockets[sock]
+                try:
+                    data, address = sock.recvfrom(65536)
+                except OSError:
+                    continue
+
+                if side == "listen":
+                    self.client[name] = address
+                    self.enqueue(self.links[name], self.upstream[name], data, (self.target, self.target_ports[name]))
+                elif name in self.client:
+                    self.enqueue(self.links["reply"], self.listen[name], data, self.client[name])
+
+    def deliver(self):
+        '''Send the queued datagrams at their delivery times.'''
+
+        while not self._stop.is_set():
+            with self.condition:
+                if not self.queue:
+                    self.condition.wait(0.05)
+                    continue
+
+                when, _, link, sock, data, address = self.queue[0]
+                wait = when - time.perf_counter()
+
+                if wait > 0:
+                    self.condition.wait(wait)
+                    continue
+
+                heapq.heappop(self.queue)
+
+            try:
+                sock.sendto(data, address)
+                link.stats["delivered"] += 1
+            except OSError as e:
+                logger.debug(f"Relay send failed: {e}")
+
+    def start(self) -> 'Relay':
+        self._stop.clear()
+        self._threads = [threading.Thread(target=target, name=f"Relay-{target.__name__}", daemon=True)
+                         for target in (self.receive, self.deliver)]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        with self.condition:
+            self.condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def close(self):
+        self.stop()
+        for sock in list(self.listen.values()) + list(self.upstream.values()):
+            sock.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,39 +1,431 @@
+import logging
+import select
 import socket
 import struct
+import threading
 import records
-from img import Strip
+from img import Strip, MAX_PACKET_SIZE
+from layout import Layout
+from memory import ImageMemory, Residency
 from seq import Sequencer
+from state import ProjectorState, queries
+from metrics import REGISTRY
+from tracing import TRACER
 from rle import encode_rle_image_type5
+from capture import Capture, CaptureSocket
 import time
 
+logger = logging.getLogger("lux4600.projector")
 
-class Projector:
+BARRIER = None # In a batch, wait for the replies to all previous records before sending more, see send_batch
+
+DEFAULT_TIMEOUT = 0.05 # s, reply timeout of control records
+RETRIES = 3 # retries of idempotent records after a timeout, the timeout doubles on every retry
+LOAD_SEQUENCE_FILE = 105 # rec_id of the sequence file packets, see Sequencer.to_packets
+
+# Reply timeouts of records the projector takes longer to handle, by rec_id
+TIMEOUTS = {
+    LOAD_SEQUENCE_FILE: 0.5, # The sequence file is translated after the last package
+    records.RequestSeqNoError.REC_ID: 0.5, # Answered after the received image data is written
+    records.RequestSeqFileErrorLog.REC_ID: 0.5,
+    records.SetSequencerState.REC_ID: 0.2,
+}
+
+PACKET_NAMES = {LOAD_SEQUENCE_FILE: "LoadSequenceFile"}
+
+
+def rec_id(packet:bytes) -> int:
+    '''Return the rec_id of an encoded record.'''
+    return int.from_bytes(packet[2:4], byteorder='big')
+
+
+def record_name(rec_id:int) -> str:
+    record = records.RECORDS.get(rec_id)
+    return record.__name__ if record else PACKET_NAMES.get(rec_id, f"Record{rec_id}")
+
+
+def answers(packet:bytes, reply:bytes) -> bool:
+    '''Return True if reply can be the reply to the encoded record: its reply record or a ReplyAck.'''
+    return len(reply) >= 4 and rec_id(reply) in (rec_id(packet) + records.REPLY_OFFSET, records.REPLY_ACK_ID)
+
+
+def idempotent(packet:bytes) -> bool:
+    '''Return True if the encoded record can safely be sent again, see records.Record.IDEMPOTENT.'''
+    record = records.RECORDS.get(rec_id(packet))
+    return record is not None and record.IDEMPOTENT
+
+
+class InFlight:
+    '''Records of a batch sent since every reply was last received, see Projector.send_batch.'''
 
-    def __init__(self, server_ip, server_port, image_data_port, timeout=10):
+    def __init__(self):
+        self.sent = [] # (index, message, packet, time sent)
+        self.received = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self.sent) - self.received
+
+
+class Pacer:
+    '''Limits the rate image data is sent at, so a projector or switch with small buffers does not drop packets.'''
+
+    def __init__(self, rate:float=None, burst:float=0.001):
+        """
+        Args:
+            rate: Bytes per second, None for no limit.
+            burst: Seconds the sender may get ahead of the rate before it sleeps, to avoid a sleep per packet.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.start = time.perf_counter()
+        self.sent = 0
+
+    def wait(self, size:int):
+        '''Account for a packet of size bytes just sent, sleeping if the sender is ahead of the rate.'''
+
+        if not self.rate:
+            return
+
+        self.sent += size
+        ahead = self.start + self.sent / self.rate - time.perf_counter()
+
+        if ahead > self.burst:
+            time.sleep(ahead)
+
+
+class Projector:
 
+    def __init__(self, server_ip, server_port, image_data_port, timeout=None, retries=RETRIES, metrics=REGISTRY,
+                 pacing=None, max_packet_size=MAX_PACKET_SIZE, capture=None):
+        """
+        Args:
+            server_ip: The IP address of the projector.
+            server_port: The control port.
+            image_data_port: The image data port.
+            timeout: Reply timeout in seconds for every record. None uses TIMEOUTS, or DEFAULT_TIMEOUT.
+            retries: The number of times an idempotent record is sent again after a timeout.
+            metrics: The metrics.Registry holding the reply latency histogram of each record.
+            pacing: The rate image data is sent at in bytes per second, None to send as fast as possible.
+            max_packet_size: The largest image data packet in bytes, e.g. 8972 on a link with 9000 byte jumbo frames.
+            capture: A file to record every datagram sent and received to, see start_capture. None records nothing.
+        """
         self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.SERVER_IP = server_ip
         self.SERVER_PORT = server_port
         self.IMAGE_DATA_PORT = image_data_port
-        self.client_socket.settimeout(timeout)
-    
+        self.timeout = timeout
+        self.retries = retries
+        self.metrics = metrics
+        self.pacing = pacing
+        self.max_packet_size = max_packet_size
+
+        self.state = ProjectorState() # Mirror of the projector state, see send_record
+        self.stale = False # True after a lost reply, the mirror is resynchronised before the next setter
+        self.unanswered = 0 # Records that timed out, their replies may still arrive
+        self.lock = threading.RLock() # Held while a record or batch awaits its replies
+        self.capture = None
+
+        if capture is not None:
+            self.start_capture(capture)
+
+    def start_capture(self, path:str) -> Capture:
+        '''Record every datagram sent and received to a capture log at path, see capture.replay.'''
+
+        with self.lock:
+            self.stop_capture()
+            self.capture = Capture(path)
+            self.client_socket = CaptureSocket(self.client_socket, self.capture, self.IMAGE_DATA_PORT)
+            return self.capture
+
+    def stop_capture(self):
+        with self.lock:
+            if self.capture is None:
+                return
+            self.client_socket = self.client_socket.socket
+            self.capture.close()
+            self.capture = None
+
+    def reply_timeout(self, rec_id:int) -> float:
+        return self.timeout if self.timeout is not None else TIMEOUTS.get(rec_id, DEFAULT_TIMEOUT)
+
     def send(self, bytes):
-        '''Send a message to the projector and return the response.'''
-        try:
+        """
+        Send a message to the projector and return the response.
+
+        Idempotent records are sent again after a timeout, with the timeout doubled on every retry.
+
+        Raises:
+            ProjectorTimeout: If there is no reply after the retries.
+            ProjectorError: On a socket error.
+        """
+        with self.lock: # Shared with the telemetry poller
+            record_id = rec_id(bytes)
+            timeout = self.reply_timeout(record_id)
+            attempts = 1 + (self.retries if idempotent(bytes) else 0)
+
+            self.drain()
+
+            for attempt in range(attempts):
+                try:
+                    sent = time.perf_counter()
+                    self.client_socket.sendto(bytes, (self.SERVER_IP, self.SERVER_PORT))
+                    reply = self.receive(bytes, timeout * 2 ** attempt)
+
+                except socket.timeout:
+                    self.unanswered += 1
+                    self.metrics.counter("control_timeouts_total", record=record_name(record_id)).inc()
+                    if attempt + 1 < attempts:
+                        self.metrics.counter("retransmits_total", record=record_name(record_id)).inc()
+                    continue
 
-            self.client_socket.sendto(bytes, (self.SERVER_IP, self.SERVER_PORT))
+                except socket.error as e:
+                    raise ProjectorError(f"Socket error: {e}") from e
+
+                self.metrics.histogram("control_rtt_seconds", record=record_name(record_id)).observe(time.perf_counter() - sent)
+                return reply
+
+            self.state.invalidate() # The record may or may not have taken effect
+            self.stale = True
+            raise ProjectorTimeout(f"No reply to {record_name(record_id)} after {attempts} attempt(s)")
+
+    def receive(self, packet:bytes, timeout:float) -> tuple[bytes, tuple]:
+        """
+        Receive the reply to an encoded record, discarding replies to other records, e.g. late replies to
+        records that timed out.
+
+        Raises:
+            socket.timeout: If no reply to the record arrives within timeout seconds.
+        """
+        deadline = time.perf_counter() + timeout
+
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise socket.timeout("timed out")
+
+            self.client_socket.settimeout(remaining)
             reply = self.client_socket.recvfrom(1024)
 
-        except socket.timeout:
-            print("Timeout error.")
-            return None
-        
-        except socket.error as e:
-            print("Socket error: ", e)
-            return None
-        
-        return reply
+            if answers(packet, reply[0]):
+                return reply
+
+            answered = "ReplyAck" if rec_id(reply[0]) == records.REPLY_ACK_ID else record_name(rec_id(reply[0]) - records.REPLY_OFFSET)
+            self.metrics.counter("replies_discarded_total", record=answered).inc()
+            logger.debug(f"Discarded a reply to {answered} while waiting for the reply to {record_name(rec_id(packet))}")
+
+    def drain(self):
+        '''Discard late replies to records that timed out, so they are not taken for the reply to the next record.'''
+
+        if not self.unanswered:
+            return
+
+        self.discard()
+        self.unanswered = 0
+
+    def discard(self):
+        '''Discard the replies waiting on the socket.'''
+
+        # Polled, so the blocking mode and timeout of the socket, which the image data loops share, are unchanged
+        while select.select([self.client_socket], [], [], 0)[0]:
+            try:
+                self.client_socket.recvfrom(1024)
+            except socket.error:
+                break
+
+    def send_record(self, record:records.Record, force:bool=False) -> tuple[str, object]:
+        """
+        Send a control record unless the mirrored projector state shows it is already in effect.
+
+        Args:
+            record: The record to send.
+            force: Send the record even if its value is already in effect.
+
+        Returns:
+            tuple: (message, data) of the reply, see records.Record.reply.
+
+        Raises:
+            ProjectorTimeout: If there is no reply, see send.
+            ProjectorReplyError: If the projector replied with an error code.
+        """
+        if self.stale:
+            self.resync()
+
+        if not force and not self.state.needed(record):
+            self.metrics.counter("setters_skipped_total").inc()
+            return "Already in effect", -1
+
+        reply = self.send(record.bytes())[0]
+
+        ProjectorReplyError.check(record.bytes(), reply)
+        self.state.apply(record)
+
+        return record.reply(reply)
+
+    def send_batch(self, messages:list, window:int=16, check:bool=True) -> list:
+        """
+        Send control records back-to-back and collect their replies afterwards.
+
+        The projector handles the records of the control port in the order they arrive and
+        replies in the same order, so replies are matched to records in order. Up to window
+        records are awaiting a reply at once. A BARRIER waits for the replies to all previous
+        records, for records that must not be sent before the previous ones took effect.
+        The whole batch is complete when send_batch returns.
+
+        A lost datagram leaves the records without a reply unknown, so after a timeout every record
+        since all replies were last received is sent again, if they are all idempotent.
+
+        Args:
+            messages: Records, sent through the state mirror (see send_record), raw packets (bytes) or BARRIER.
+            window: The maximum number of records awaiting a reply.
+            check: Raise ProjectorReplyError if a record was answered with an error code.
+
+        Returns:
+            list: One entry per record or packet, in order: (message, data) of the reply for records,
+                or the reply bytes for packets.
+
+        Raises:
+            ProjectorTimeout: If replies are missing after the retries.
+            ProjectorReplyError: If check and the projector replied to a record with an error code,
+                raised after the whole batch is sent.
+        """
+        with self.lock: # Shared with the telemetry poller
+            if self.stale:
+                self.resync()
+
+            self.drain()
+
+            results = []
+            errors = []
+            inflight = InFlight()
+            pending_values = {} # Values set by earlier records of the batch, see ProjectorState.needed
+
+            for message in messages:
+
+                if message is BARRIER:
+                    self.collect(inflight, results, errors)
+                    continue
+
+                is_record = hasattr(message, "REC_ID")
+
+                if is_record and not self.state.needed(message, pending_values):
+                    self.metrics.counter("setters_skipped_total").inc()
+                    results.append(("Already in effect", -1))
+                    continue
+
+                if inflight.pending >= window:
+                    self.collect(inflight, results, errors)
+
+                packet = message.bytes() if is_record else message
+
+                try:
+                    self.client_socket.sendto(packet, (self.SERVER_IP, self.SERVER_PORT))
+                except socket.error as e:
+                    raise ProjectorError(f"Socket error: {e}") from e
+
+                inflight.sent.append((len(results), message, packet, time.perf_counter()))
+                results.append(None)
+
+            self.collect(inflight, results, errors)
+
+            if check and errors:
+                raise errors[0]
+
+            return results
+
+    def collect(self, inflight:InFlight, results:list, errors:list):
+        '''Receive the replies to every record in flight, see send_batch.'''
+
+        attempt = 0
+
+        while inflight.pending:
+            index, message, packet, sent = inflight.sent[inflight.received]
+
+            try:
+                reply = self.receive(packet, self.reply_timeout(rec_id(packet)) * 2 ** attempt)[0]
+
+            except socket.timeout:
+                attempt += 1
+                self.metrics.counter("control_timeouts_total", record=record_name(rec_id(packet))).inc()
+                self.resend(inflight, attempt)
+                continue
+
+            except socket.error as e:
+                raise ProjectorError(f"Socket error: {e}") from e
+
+            inflight.received += 1
+            self.metrics.histogram("control_rtt_seconds", record=record_name(rec_id(packet))).observe(time.perf_counter() - sent)
+
+            try:
+                ProjectorReplyError.check(packet, reply)
+            except ProjectorReplyError as e:
+                errors.append(e)
+            else:
+                if hasattr(message, "REC_ID"):
+                    self.state.apply(message)
+
+            results[index] = message.reply(reply) if hasattr(message, "REC_ID") else reply
 
+        inflight.sent.clear()
+        inflight.received = 0
+
+    def resend(self, inflight:InFlight, attempt:int):
+        '''Send the records in flight again after a timeout, see send_batch.'''
+
+        self.unanswered += 1
+
+        if attempt > self.retries or not all(idempotent(packet) for _, _, packet, _ in inflight.sent):
+            self.state.invalidate()
+            self.stale = True
+            raise ProjectorTimeout(f"{inflight.pending} of {len(inflight.sent)} replies missing in batch")
+
+        self.discard() # The late replies of the records sent again may still arrive, unanswered stays counted
+
+        for i, (index, message, packet, _) in enumerate(inflight.sent):
+            self.client_socket.sendto(packet, (self.SERVER_IP, self.SERVER_PORT))
+            self.metrics.counter("retransmits_total", record=record_name(rec_id(packet))).inc()
+            inflight.sent[i] = (index, message, packet, time.perf_counter())
+
+        inflight.received = 0
+
+    @TRACER.traced("projector.resync")
+    def resync(self) -> bool:
+        """
+        Read back the mirrored state from the projector.
+
+        Returns:
+            bool: False if the projector state differed from the mirror, e.g. after a power cycle.
+                Images and the sequence file in projector memory should then be sent again.
+
+        Raises:
+            ProjectorTimeout: If the projector does not reply. The mirror stays invalid.
+        """
+        self.stale = False
+        consistent = True
+
+        checks = queries()
+
+        try:
+            replies = self.send_batch([request for request, _ in checks], check=False)
+        except ProjectorTimeout:
+            self.state.invalidate()
+            self.stale = True
+            raise
+
+        for (request, convert), (message, data) in zip(checks, replies):
+
+            if data == -1: # ReplyAck error, or the request is not supported
+                continue
+
+            consistent &= self.state.observe(*convert(data))
+
+        if not consistent:
+            self.state.resyncs += 1
+            logger.warning("Projector state changed since the last command, the projector may have been power cycled.")
+
+        return consistent
+
+    @TRACER.traced("projector.check_connection")
     def check_connection(self):
 
         checks = [
@@ -44,36 +436,41 @@ class Projector:
         for check in checks:
             try:
                 msg = self.send(check.bytes())
-            except socket.error:
-                print(socket.error)
-                print("Connection unsuccessful.")
+            except ProjectorError as e:
+                logger.error(e)
+                logger.error("Connection unsuccessful.")
                 return False
             
-            if msg is None:
-                return False
-            else:
-                print(msg)
-                print(check.reply(msg[0]))
+            logger.debug(msg)
+            logger.info(check.reply(msg[0]))
 
-        print("Connection successful!")
+        logger.info("Connection successful!")
+        self.resync() # Prime the state mirror
         return True
     
-    def send_strip(self, strip:Strip, lines_per_packet:int=6):
+    @TRACER.traced("projector.send_strip")
+    def send_strip(self, strip:Strip, lines_per_packet:int=6, inum_size:int=None):
         """Sends an image to the projector to be stored at position inum.
 
         Args:
-            img: A PIL Image object to be sent to the projector.
-            inum: The inum of the image to be sent.
+            strip: The Strip to be sent to the projector, stored at strip.inum.
+            lines_per_packet: The number of lines per image data packet.
+            inum_size: The inum size to set. Defaults to strip.inum_size, the height of the strip unless
+                the strip spans several inums.
 
         Returns:
             None
         """
 
+        if inum_size is None:
+            inum_size = strip.inum_size
+        else:
+            strip.inum_size = inum_size
 
         # Set into reset mode and prime for image receiving
         init_messages = [
             records.SetImageType(4), # 4 = 1-bit grayscale
-            records.SetInumSize(strip.height), # Set the inum size to the height of the image, i.e. the number of rows in the image
+            records.SetInumSize(inum_size), # Set the inum size, by default the height of the image, i.e. the number of rows in the image
             records.ResetSeqNo(), # Reset the sequencer number
             records.SetSequencerState(1, False), # Halt the sequencer
             records.SetSequencerState(2, True) # Set the sequencer to reset mode
@@ -81,41 +478,109 @@ class Projector:
         
         time_elapsed = time.time() # timing the upload time
 
-        for msg in init_messages:
-            reply = self.send(msg.bytes())
-            print(msg.reply(reply[0]))
+        with self.metrics.timer("strip_init"), TRACER.span("strip_init"):
+            for reply in self.send_batch(init_messages):
+                logger.debug(reply)
 
         # Send image
-        packets = strip.to_packets(lines_per_packet) # TODO
+        packets = strip.to_packets(lines_per_packet, self.max_packet_size) # TODO
         
         count = 0 # TODO: get rid of this BS variable. Need something cleaner
+        data_bytes = 0
+        pacer = Pacer(self.pacing)
 
-        for _, packet in enumerate(packets):
-            
-            self.client_socket.sendto(packet, (self.SERVER_IP, self.IMAGE_DATA_PORT))
-            count += 1
+        with self.metrics.timer("strip_data"), TRACER.span("strip_data"):
+            for _, packet in enumerate(packets):
+                
+                self.client_socket.sendto(packet, (self.SERVER_IP, self.IMAGE_DATA_PORT))
+                count += 1
+                data_bytes += len(packet)
+                pacer.wait(len(packet))
 
-        print(f"Sent {count} packets, data length: {len(packet) - 14} per packet")
+        self.record_upload(count, data_bytes, time.time() - time_elapsed)
+
+        logger.info(f"Sent {count} packets, data length: {len(packet) - 14} per packet")
 
         # Request out-of-sequence packets
-        reply = self.send(records.RequestSeqNoError().bytes())
+        with self.metrics.timer("strip_verify"), TRACER.span("strip_verify"):
+            reply = self.send(records.RequestSeqNoError().bytes())
         
         out_of_seq_packet = int.from_bytes(reply[0][5:], byteorder='big') + 1
 
-        if out_of_seq_packet == count:
-            print("No out of sequence packets")
+        if out_of_seq_packet == count % 65536: # The sequence number wraps around for strips spanning several inums
+            logger.info("No out of sequence packets")
         else:
-            print(records.RequestSeqNoError().reply(reply[0]))
-            raise RuntimeError(f"Out of sequence packet: {out_of_seq_packet}")
+            logger.error(records.RequestSeqNoError().reply(reply[0]))
+            self.metrics.counter("sequence_errors_total").inc()
+            raise ProjectorSequenceError(f"Out of sequence packet: {out_of_seq_packet}", out_of_seq_packet, count)
         
-        self.send(records.SetSequencerState(2, False).bytes()) # Take sequencer out of reset mode
+        self.send_record(records.SetSequencerState(2, False)) # Take sequencer out of reset mode
         
         # Display timing information
         time_elapsed = time.time() - time_elapsed
-        print(f"Time elapsed to send strip: {time_elapsed:.2f} seconds")
+        self.metrics.histogram("stage_seconds", stage="send_strip").observe(time_elapsed)
+        logger.info(f"Time elapsed to send strip: {time_elapsed:.2f} seconds")
+
+        return
+
+    def record_upload(self, packets:int, data_bytes:int, seconds:float):
+        '''Record the packets and bytes sent to the image data port and the throughput of an upload.'''
+
+        self.metrics.counter("packets_sent_total", port="image").inc(packets)
+        self.metrics.counter("bytes_sent_total", port="image").inc(data_bytes)
+
+        if seconds > 0:
+            self.metrics.gauge("upload_packets_per_second").set(packets / seconds)
+            self.metrics.gauge("upload_megabytes_per_second").set(data_bytes / seconds / 1e6)
+
+    @TRACER.traced("projector.send_layout")
+    def send_layout(self, layout:Layout, lines_per_packet:int=6):
+        """Sends every inum of a planned layout to the projector.
+
+        Args:
+            layout: A Layout from layout.plan_layout. Its inum size must be a multiple of lines_per_packet.
+            lines_per_packet: The number of lines per image data packet.
+
+        Returns:
+            None
+        """
+        for strip in layout.to_strips():
+            self.send_strip(strip, lines_per_packet)
 
         return
 
+    @TRACER.traced("projector.send_resident")
+    def send_resident(self, memory:ImageMemory, name:str, strip:Strip, lines_per_packet:int=6) -> Residency:
+        """Sends a named image to the projector unless it is already resident.
+
+        The image is stored in the region allocated by the memory manager, and strip.inum
+        is updated to the allocated inum.
+
+        Args:
+            memory: The ImageMemory tracking the projector memory.
+            name: The name of the image, e.g. "calibration-grid".
+            strip: The Strip to be sent to the projector.
+            lines_per_packet: The number of lines per image data packet.
+
+        Returns:
+            Residency: The region holding the image.
+        """
+        residency, needs_upload = memory.ensure(name, strip.image)
+        strip.inum = residency.inum
+
+        if needs_upload:
+            try:
+                self.send_strip(strip, lines_per_packet, inum_size=memory.inum_size)
+            except Exception:
+                memory.evict(name) # The region content is unknown after a failed upload
+                raise
+        else:
+            self.metrics.counter("uploads_skipped_total").inc()
+            logger.info(f"{name} is resident at inum {residency.inum}, skipping upload")
+
+        return residency
+
+    @TRACER.traced("projector.send_image_rle")
     def send_image_rle(self, image, width: int, height: int, inum: int = 0, image_type: int = 5):
         """
         Send RLE-compressed binary image to the projector.
@@ -134,7 +599,7 @@ class Projector:
             None
 
         Raises:
-            RuntimeError: If out-of-sequence packets detected during transmission
+            ProjectorSequenceError: If out-of-sequence packets detected during transmission
             ValueError: If image dimensions don't match specified width/height
         """
         # Initialize projector and set RLE mode
@@ -148,12 +613,11 @@ class Projector:
 
         time_elapsed = time.time()
 
-        for msg in init_messages:
-            reply = self.send(msg.bytes())
-            print(f"Init: {msg.reply(reply[0])}")
+        for reply in self.send_batch(init_messages):
+            logger.debug(f"Init: {reply}")
 
         # Encode image with RLE Type 5 compression
-        print(f"Encoding image ({width}x{height}) with RLE Type 5...")
+        logger.info(f"Encoding image ({width}x{height}) with RLE Type 5...")
         encoded_rows = encode_rle_image_type5(image, width, height)
 
         # Calculate compression statistics
@@ -162,13 +626,16 @@ class Projector:
         compression_ratio = compressed_size / uncompressed_size
         savings_percent = (1 - compression_ratio) * 100
 
-        print(f"Compression: {uncompressed_size:,} → {compressed_size:,} bytes ({compression_ratio:.1%})")
-        print(f"Bandwidth savings: {savings_percent:.1f}%")
+        logger.info(f"Compression: {uncompressed_size:,} → {compressed_size:,} bytes ({compression_ratio:.1%})")
+        logger.info(f"Bandwidth savings: {savings_percent:.1f}%")
 
         # Fragment RLE data into packets and send
         seq_no = 1
         packets_sent = 0
         max_data_per_packet = 8956  # Maximum UDP payload per spec
+        data_bytes = 0
+        data_start = time.time()
+        pacer = Pacer(self.pacing)
 
         for row_offset, row_data in enumerate(encoded_rows):
             # Build LoadImageData packet
@@ -200,43 +667,47 @@ class Projector:
                 self.client_socket.sendto(packet, (self.SERVER_IP, self.IMAGE_DATA_PORT))
                 packets_sent += 1
                 seq_no += 1
+                data_bytes += len(packet)
+                pacer.wait(len(packet))
 
                 # Progress indicator every 100 packets
                 if packets_sent % 100 == 0:
-                    print(f"  Sent {packets_sent} packets ({packets_sent * 100 // len(encoded_rows)}%)")
+                    logger.debug(f"  Sent {packets_sent} packets ({packets_sent * 100 // len(encoded_rows)}%)")
 
             except socket.error as e:
-                print(f"Socket error sending packet {seq_no}: {e}")
+                logger.error(f"Socket error sending packet {seq_no}: {e}")
                 raise RuntimeError(f"Failed to send RLE packet {seq_no}") from e
 
-        print(f"Sent {packets_sent} RLE packets")
+        self.record_upload(packets_sent, data_bytes, time.time() - data_start)
+
+        logger.info(f"Sent {packets_sent} RLE packets")
 
         # Check for out-of-sequence packets
-        reply = self.send(records.RequestSeqNoError().bytes())
+        reply = self.send(records.RequestSeqNoError().bytes()) # Raises ProjectorTimeout without a reply
         
-        if reply is not None:
-            # Parse reply: [tot_size: 2] [rec_id: 2] [is_error: 1] [last_seq_no: 2]
-            is_error = reply[0][4]
-            
-            if is_error:
-                last_seq = int.from_bytes(reply[0][5:7], byteorder='big')
-                print(f"Out-of-sequence error detected at packet {last_seq + 1}")
-                raise RuntimeError(f"Out-of-sequence packet detected after seq_no {last_seq}")
-            else:
-                print("All packets received successfully")
+        # Parse reply: [tot_size: 2] [rec_id: 2] [is_error: 1] [last_seq_no: 2]
+        is_error = reply[0][4]
+        
+        if is_error:
+            last_seq = int.from_bytes(reply[0][5:7], byteorder='big')
+            logger.error(f"Out-of-sequence error detected at packet {last_seq + 1}")
+            self.metrics.counter("sequence_errors_total").inc()
+            raise ProjectorSequenceError(f"Out-of-sequence packet detected after seq_no {last_seq}", last_seq + 1, packets_sent)
         else:
-            print("Warning: Could not verify packet transmission")
+            logger.info("All packets received successfully")
 
         # Take sequencer out of reset
-        self.send(records.SetSequencerState(2, False).bytes())
+        self.send_record(records.SetSequencerState(2, False))
 
         # Display timing information
         time_elapsed = time.time() - time_elapsed
-        print(f"Time elapsed to send RLE image: {time_elapsed:.2f} seconds")
-        print(f"Effective throughput: {compressed_size / time_elapsed / 1e6:.2f} MB/s")
+        self.metrics.histogram("stage_seconds", stage="send_image_rle").observe(time_elapsed)
+        logger.info(f"Time elapsed to send RLE image: {time_elapsed:.2f} seconds")
+        logger.info(f"Effective throughput: {compressed_size / time_elapsed / 1e6:.2f} MB/s")
 
         return
 
+    @TRACER.traced("projector.send_sequencer")
     def send_sequencer(self, sequencer:Sequencer):
         """
         Sends sequence packets to the client socket.
@@ -252,14 +723,13 @@ class Projector:
             records.SetSequencerState(2, True), # Reset the sequencer number
         ]
 
-        for msg in init_messages:
-            reply = self.send(msg.bytes())
-
-        for packet in packets:
-            reply = self.send(packet)
-
-            
-        self.send(records.SetSequencerState(2, False).bytes())
+        # The sequence file packets follow the init records on the same port, so they can be sent in one batch
+        try:
+            with self.metrics.timer("send_sequencer"):
+                self.send_batch(init_messages + packets + [records.SetSequencerState(2, False)])
+        except ProjectorReplyError:
+            self.check_sequencer_error() # Print the translation errors
+            raise
 
         self.check_sequencer_error() # Check for errors
 
@@ -269,31 +739,149 @@ class Projector:
 
         reply = self.send(records.RequestSeqFileErrorLog().bytes())
         
-        for _ in reply: print(_)
+        for _ in reply: logger.info(_)
         
             
     
+    def set_sequencer_registers(self, registers:dict):
+        """
+        Sets sequencer registers read by «AssignVarReg» in the loaded sequence file.
+
+        Args:
+            registers: Register numbers (0-11) mapped to values, see Sequencer.register_values.
+        """
+        for reply in self.send_batch([records.SetSequencerRegister(reg_no, value) for reg_no, value in registers.items()]):
+            logger.debug(reply)
+
+        self.check_sequencer_registers(registers)
+
+    def check_sequencer_registers(self, registers:dict):
+        """
+        Reads sequencer registers back with RequestSequencerRegister.
+
+        The rec_ids of the register records are not in the record table (see records.SetSequencerRegister),
+        so a write is only trusted once the register reads back the value written.
+
+        Args:
+            registers: Register numbers (0-11) mapped to the values written.
+
+        Raises:
+            ProjectorRegisterError: If a register does not read back its value.
+            ProjectorReplyError: If the projector rejects RequestSequencerRegister.
+        """
+        if not registers:
+            return
+
+        replies = self.send_batch([records.RequestSequencerRegister(reg_no) for reg_no in registers])
+        ProjectorRegisterError.check(registers, replies)
+
+    @TRACER.traced("projector.restart_sequencer")
+    def restart_sequencer(self, registers:dict=None):
+        """
+        Restarts the loaded sequence file from the top, optionally with new register values.
+
+        This switches a parametric sequence file (e.g. to another strip) with a few control
+        records instead of uploading a different sequence file.
+
+        Args:
+            registers: Register numbers (0-11) mapped to values, see Sequencer.register_values.
+        """
+        # One batch, the projector handles the records in order
+        self.send_batch([
+            records.SetSequencerState(1, False), # Stop
+            records.SetSequencerState(2, True), # Reset
+            records.SetSequencerState(2, False),
+            *(records.SetSequencerRegister(reg_no, value) for reg_no, value in (registers or {}).items()), # Set after the reset, which clears the registers
+            records.SetSequencerState(1, True), # Start
+        ])
+
+        self.check_sequencer_registers(registers)
+
+    @TRACER.traced("projector.start_sequencer")
     def start_sequencer(self):
-        self.send(records.SetSequencerState(2, False).bytes())
-        self.send(records.SetSequencerState(1, True).bytes())
+        self.send_batch([records.SetSequencerState(2, False), records.SetSequencerState(1, True)])
         return
 
+    @TRACER.traced("projector.stop_sequencer")
     def stop_sequencer(self):
-        r = self.send(records.SetSequencerState(1, False).bytes())
+        r = self.send_record(records.SetSequencerState(1, False))
     
     def reset_projector(self):
-        r = self.send(records.SetSequencerState(2, True).bytes())
+        r = self.send_record(records.SetSequencerState(2, True))
 
     def enable_sequencer(self):
-        r = self.send(records.SetSequencerState(2, False).bytes())
-    
+        r = self.send_record(records.SetSequencerState(2, False))
 
-    
+    @TRACER.traced("projector.set_led_amplitude")
+    def set_led_amplitude(self, amplitude:int, led_no:int=0):
+        '''Set the LED driver amplitude (0-4095), skipped if it is already set.'''
+        return self.send_record(records.SetLedDriverAmplitude(led_no, amplitude))
 
 
+class ProjectorError(Exception):
+    """Exception raised for errors communicating with the projector."""
 
-        
-    
 
-    
+class ProjectorTimeout(ProjectorError):
+    """Exception raised when the projector does not reply to a record."""
+
+
+class ProjectorReplyError(ProjectorError):
+    """Exception raised when the projector replies to a record with an error code."""
+
+    def __init__(self, message:str, code:int):
+        super().__init__(message)
+        self.code = code
+
+    @staticmethod
+    def check(packet:bytes, reply:bytes):
+        """
+        Checks if a reply is a ReplyAck with an error code.
+
+        Args:
+            packet (bytes): The record sent.
+            reply (bytes): The reply received.
+
+        Raises:
+            ProjectorReplyError: If the reply is a ReplyAck with a non-zero code.
+        """
+        if rec_id(reply) != records.REPLY_ACK_ID:
+            return
+
+        message, code = records.decode(reply)
+
+        if code:
+            raise ProjectorReplyError(f"{record_name(rec_id(packet))}: {message} (0x{code:04X})", code)
 
+
+class ProjectorRegisterError(ProjectorError):
+    """Exception raised when a sequencer register does not read back the value written to it."""
+
+    @staticmethod
+    def check(registers:dict, replies:list):
+        """
+        Args:
+            registers (dict): Register numbers mapped to the values written.
+            replies (list): The (message, data) replies to RequestSequencerRegister of each register, in order.
+
+        Raises:
+            ProjectorRegisterError: If a reply is not the register number and value written.
+        """
+        for (reg_no, value), (message, data) in zip(registers.items(), replies):
+            if data != (reg_no, value):
+                raise ProjectorRegisterError(f"Sequencer register {reg_no} was set to {value} but reads back {message!r}")
+
+
+class ProjectorSequenceError(ProjectorError, RuntimeError):
+    """Exception raised when image data packets were lost or arrived out of sequence."""
+
+    def __init__(self, message:str, packet:int, packets:int):
+        """
+        Args:
+            message: The error message.
+            packet: The sequence number of the first packet missing or out of sequence.
+            packets: The number of packets sent.
+        """
+        super().__init__(message)
+        self.packet = packet
+        self.packets = packets
@@ -1,6 +1,145 @@
+import struct
+
+#
+# Record codec for the LUX4600 control port.
+# Every record is a 2-byte tot_size and 2-byte rec_id header followed by a fixed payload, all big-endian.
+# Records are registered by rec_id from their struct formats and replies are decoded through one
+# module-level table, so encoding or decoding a control record is a single struct call.
+#
+HEADER = struct.Struct(">HH")
+REPLY_ACK_ID = 501 # rec_id of ReplyAck
+REPLY_OFFSET = 200 # reply rec_id = request rec_id + 200
+
+ACK_MESSAGES = {
+    0x0000: "OK",
+    0x2710: "Invalid inum size",
+    0x2711: "Invalid image type",
+    0x2712: "Sequence file package out of order",
+    0x2713: "Error when parsing loaded sequence file. Log can be fetched with5.3.4 Sequencer File Error Log",
+    0x2714: "Too many sequence file packages (must be <= 20)",
+    0x2715: "Unknown record id (rec_id) received",
+    0x2716: "Invalid sequence command",
+    0x2717: "Mask file package out of order",
+    0x2718: "Too many mask file packages (must be <= 30)",
+    0x2719: "Accessing invalid FPGA register. [Internal]",
+    0x271A: "Translated sequence file is too large",
+    0x271B: "No contact with LED driver or accessing invalid LED driver register. [Internal]",
+    0x271C: "Trying to set an invalid sequence register. Ref 5.3.8 Sequencer Register.",
+    0x271D: "Focus motor number of steps out of range",
+    0x271E: "Focus motor is busy or in a mode where command cannot be performed.",
+    0x271F: "Focus motor measured distance out of range",
+    0x2720: "Focus motor CCD thickness out of range",
+    0x2721: "Focus motor absolute position out of range.",
+    0x2722: "Focus motor has not been set to mid position",
+    0x2723: "Focus motor measured distance never entered",
+    0x2724: "Mask file with invalifd format (not bmp, not 8-bit, etc)",
+    0x2725: "LED driver amplitude value out of range.",
+    0x2726: "Temperature regulation setvalue out of range.",
+    0x2727: "Focus motor step size conversion unit out of range",
+    0x2728: "Internal sync pulse period outside valid range",
+    0x2729: "AF trim value is outside valid range",
+    0x272A: "AF work range is outside valid range.",
+    0x272B: "AF time delay value is outside valid range.",
+    0x272C: "AF calibration set-position is outside valid range.",
+    0x272D: "AF pull-in range acceleration limit is outside valid range.",
+    0x272E: "AF speed high threshold is outside valid range",
+    0x272F: "Laser intensity level is outside valid range.",
+    0x2730: "Trig delay outside valid range",
+    0x2731: "Active Area Qualifier Keepout parameters are outside valid range.",
+    0x2732: "Active Area Qualifier Keepout parameters adds up to a larger number than the active number of pulses",
+    0x2733: "Trig divide factor outside valid range.",
+    0x2734: "<Currently unused>",
+    0x2735: "OCP limit is out of range",
+    0x2736: "Strip number out of range.",
+    0x2737: "Internal image number out of range or perrmanent storage error",
+    0x2738: "Not possible to load sequence file. No file has has been loaded previously.",
+    0x2739: "Invalid fan number",
+    0x273A: "Absolute Z position for AF is outside valid range",
+    0x273B: "Invalid morph record",
+    0x273C: "Led driver firmware package out of order",
+    0x273D: "Led driver firmware crc error",
+    0x273E: "Led driver firmware verification failed",
+    0x273F: "Led driver firmware upgrade ok",
+    0x2740: "Invalid address",
+    0x2741: "Invalid data",
+    0x2742: "Command not supported by old led driver fw",
+    0x2743: "<Reserved>",
+    0x2744: "Overlay text parameter out of range",
+    0x2745: "SSD Error: Ublaze can not start",
+    0x2746: "SSD Error: Physical state error",
+    0x2747: "SSD Error: Align count off",
+    0x2748: "SSD Error: Bad link",
+    0x2749: "SSD Error: Bad transport layer",
+    0x274A: "SSD Error: Loop counter stopped",
+}
+
+# ReplyAck records mapped to their messages, e.g. b'\x00\x06\x01\xF5\x00\x00' -> "OK"
+REPLY_ACK = {struct.pack(">HHH", 6, REPLY_ACK_ID, code): message for code, message in ACK_MESSAGES.items()}
+
+RECORDS = {} # rec_id -> Record class
+REPLIES = {} # reply rec_id -> Record class of the request
+
+
+def decode(response: bytes) -> tuple[str, object]:
+    """
+    Decode any reply from the projector by its rec_id.
+
+    Args:
+        response (bytes): The reply record.
+
+    Returns:
+        tuple: (message, data). For a ReplyAck data is the error code (0 = OK),
+            for the reply to a request it is the parsed value(s), see Record.reply.
+    """
+    if len(response) < HEADER.size:
+        return "Invalid Reply: " + response.hex(), -1
+
+    _, rec_id = HEADER.unpack_from(response)
+
+    if rec_id == REPLY_ACK_ID and len(response) >= 6:
+        code = int.from_bytes(response[4:6], byteorder='big')
+        return ACK_MESSAGES.get(code, "Unknown ReplyAck: " + response.hex()), code
+
+    request = REPLIES.get(rec_id)
+
+    if request is None:
+        return "Unknown record id (rec_id) in reply: " + response.hex(), -1
+
+    return request.parse(response)
+
 
 # class containing common code for all records
 class Record:
+    """
+    A control record. Subclasses register themselves by rec_id with the class attributes:
+
+        REC_ID (int): The rec_id of the record.
+        FORMAT (str): The struct format of the payload, without the header.
+        REPLY_FORMAT (str): The struct format of the reply payload, for requests answered by a reply record.
+        IDEMPOTENT (bool): Sending the record twice has the same effect as sending it once, so it can be retried.
+    """
+
+    __slots__ = ("_bytes",)
+
+    REC_ID = None
+    FORMAT = ""
+    REPLY_FORMAT = None
+    IDEMPOTENT = True
+    ReplyAck = REPLY_ACK # shared table, kept for code using record.ReplyAck
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        if cls.REC_ID is None:
+            return
+
+        cls.STRUCT = struct.Struct(">HH" + cls.FORMAT)
+        RECORDS[cls.REC_ID] = cls
+
+        if cls.REPLY_FORMAT is not None:
+            cls.REPLY_STRUCT = struct.Struct(">HH" + cls.REPLY_FORMAT)
+            REPLIES[cls.REC_ID + REPLY_OFFSET] = cls
+
     def __init__(self, tot_size: int, rec_id: int, payload: bytes=b''):
             """
             Initializes a Record object with the given total size, record ID, and payload.
@@ -10,82 +149,66 @@ class Record:
             - rec_id (int): The ID of the record.
             - payload (bytes, optional): The payload data of the record. Default is an empty byte string.
             """
-            self.ReplyAck = {
-                    b'\x00\x06\x01\xF5\x00\x00': "OK",
-                    b'\x00\x06\x01\xF5\x27\x10': "Invalid inum size",
-                    b'\x00\x06\x01\xF5\x27\x11': "Invalid image type",
-                    b'\x00\x06\x01\xF5\x27\x12': "Sequence file package out of order",
-                    b'\x00\x06\x01\xF5\x27\x13': "Error when parsing loaded sequence file. Log can be fetched with5.3.4 Sequencer File Error Log",
-                    b'\x00\x06\x01\xF5\x27\x14': "Too many sequence file packages (must be <= 20)",
-                    b'\x00\x06\x01\xF5\x27\x15': "Unknown record id (rec_id) received",
-                    b'\x00\x06\x01\xF5\x27\x16': "Invalid sequence command",
-                    b'\x00\x06\x01\xF5\x27\x17': "Mask file package out of order",
-                    b'\x00\x06\x01\xF5\x27\x18': "Too many mask file packages (must be <= 30)",
-                    b'\x00\x06\x01\xF5\x27\x19': "Accessing invalid FPGA register. [Internal]",
-                    b'\x00\x06\x01\xF5\x27\x1A': "Translated sequence file is too large",
-                    b'\x00\x06\x01\xF5\x27\x1B': "No contact with LED driver or accessing invalid LED driver register. [Internal]",
-                    b'\x00\x06\x01\xF5\x27\x1C': "Trying to set an invalid sequence register. Ref 5.3.8 Sequencer Register.",
-                    b'\x00\x06\x01\xF5\x27\x1D': "Focus motor number of steps out of range",
-                    b'\x00\x06\x01\xF5\x27\x1E': "Focus motor is busy or in a mode where command cannot be performed.",
-                    b'\x00\x06\x01\xF5\x27\x1F': "Focus motor measured distance out of range",
-                    b'\x00\x06\x01\xF5\x27\x20': "Focus motor CCD thickness out of range",
-                    b'\x00\x06\x01\xF5\x27\x21': "Focus motor absolute position out of range.",
-                    b'\x00\x06\x01\xF5\x27\x22': "Focus motor has not been set to mid position",
-                    b'\x00\x06\x01\xF5\x27\x23': "Focus motor measured distance never entered",
-                    b'\x00\x06\x01\xF5\x27\x24': "Mask file with invalifd format (not bmp, not 8-bit, etc)",
-                    b'\x00\x06\x01\xF5\x27\x25': "LED driver amplitude value out of range.",
-                    b'\x00\x06\x01\xF5\x27\x26': "Temperature regulation setvalue out of range.",
-                    b'\x00\x06\x01\xF5\x27\x27': "Focus motor step size conversion unit out of range",
-                    b'\x00\x06\x01\xF5\x27\x28': "Internal sync pulse period outside valid range",
-                    b'\x00\x06\x01\xF5\x27\x29': "AF trim value is outside valid range",
-                    b'\x00\x06\x01\xF5\x27\x2A': "AF work range is outside valid range.",
-                    b'\x00\x06\x01\xF5\x27\x2B': "AF time delay value is outside valid range.",
-                    b'\x00\x06\x01\xF5\x27\x2C': "AF calibration set-position is outside valid range.",
-                    b'\x00\x06\x01\xF5\x27\x2D': "AF pull-in range acceleration limit is outside valid range.",
-                    b'\x00\x06\x01\xF5\x27\x2E': "AF speed high threshold is outside valid range",
-                    b'\x00\x06\x01\xF5\x27\x2F': "Laser intensity level is outside valid range.",
-                    b'\x00\x06\x01\xF5\x27\x30': "Trig delay outside valid range",
-                    b'\x00\x06\x01\xF5\x27\x31': "Active Area Qualifier Keepout parameters are outside valid range.",
-                    b'\x00\x06\x01\xF5\x27\x32': "Active Area Qualifier Keepout parameters adds up to a larger number than the active number of pulses",
-                    b'\x00\x06\x01\xF5\x27\x33': "Trig divide factor outside valid range.",
-                    b'\x00\x06\x01\xF5\x27\x34': "<Currently unused>",
-                    b'\x00\x06\x01\xF5\x27\x35': "OCP limit is out of range",
-                    b'\x00\x06\x01\xF5\x27\x36': "Strip number out of range.",
-                    b'\x00\x06\x01\xF5\x27\x37': "Internal image number out of range or perrmanent storage error",
-                    b'\x00\x06\x01\xF5\x27\x38': "Not possible to load sequence file. No file has has been loaded previously.",
-                    b'\x00\x06\x01\xF5\x27\x39': "Invalid fan number",
-                    b'\x00\x06\x01\xF5\x27\x3A': "Absolute Z position for AF is outside valid range",
-                    b'\x00\x06\x01\xF5\x27\x3B': "Invalid morph record",
-                    b'\x00\x06\x01\xF5\x27\x3C': "Led driver firmware package out of order",
-                    b'\x00\x06\x01\xF5\x27\x3D': "Led driver firmware crc error",
-                    b'\x00\x06\x01\xF5\x27\x3E': "Led driver firmware verification failed",
-                    b'\x00\x06\x01\xF5\x27\x3F': "Led driver firmware upgrade ok",
-                    b'\x00\x06\x01\xF5\x27\x40': "Invalid address",
-                    b'\x00\x06\x01\xF5\x27\x41': "Invalid data",
-                    b'\x00\x06\x01\xF5\x27\x42': "Command not supported by old led driver fw",
-                    b'\x00\x06\x01\xF5\x27\x43': "<Reserved>",
-                    b'\x00\x06\x01\xF5\x27\x44': "Overlay text parameter out of range",
-                    b'\x00\x06\x01\xF5\x27\x45': "SSD Error: Ublaze can not start",
-                    b'\x00\x06\x01\xF5\x27\x46': "SSD Error: Physical state error",
-                    b'\x00\x06\x01\xF5\x27\x47': "SSD Error: Align count off",
-                    b'\x00\x06\x01\xF5\x27\x48': "SSD Error: Bad link",
-                    b'\x00\x06\x01\xF5\x27\x49': "SSD Error: Bad transport layer",
-                    b'\x00\x06\x01\xF5\x27\x4A': "SSD Error: Loop counter stopped"
-                }
-            self.payload = payload
-            self.tot_size = tot_size
-            self.rec_id = rec_id
-            pass
+            self._bytes = HEADER.pack(tot_size, rec_id) + payload
+
+    def _pack(self, *values):
+        '''Encode a fixed-size record from its payload values.'''
+        self._bytes = self.STRUCT.pack(self.STRUCT.size, self.REC_ID, *values)
+
+    def _pack_data(self, data: bytes, *values):
+        '''Encode a record with a fixed payload header followed by variable-length data.'''
+        size = self.STRUCT.size + len(data)
+        buffer = bytearray(size)
+        self.STRUCT.pack_into(buffer, 0, size, self.REC_ID, *values)
+        buffer[self.STRUCT.size:] = data
+        self._bytes = buffer
+
+    @property
+    def tot_size(self) -> int:
+        return len(self._bytes)
+
+    @property
+    def rec_id(self) -> int:
+        return HEADER.unpack_from(self._bytes)[1]
+
+    @property
+    def payload(self) -> bytes:
+        return bytes(self._bytes[HEADER.size:])
 
     def bytes(self) -> bytes:
         '''Returns the full record as bytes.'''
-        return self.tot_size.to_bytes(2, byteorder='big') + self.rec_id.to_bytes(2, byteorder='big') + self.payload
+        return self._bytes
+
+    def pack_into(self, buffer, offset: int=0) -> int:
+        '''Write the record into a preallocated buffer at offset and return its size.'''
+        size = len(self._bytes)
+        buffer[offset:offset + size] = self._bytes
+        return size
+
+    def reply(self, response: bytes) -> tuple[str, object]:
+        '''Decode the reply to this record. Returns (message, data), data is -1 for a ReplyAck.'''
+        message = REPLY_ACK.get(response)
+        if message is not None:
+            return message, -1
+        return self.parse(response)
+
+    @classmethod
+    def parse(cls, response: bytes) -> tuple[str, object]:
+        '''Decode the reply record of a request, see REPLY_FORMAT.'''
+        if cls.REPLY_FORMAT is None or len(response) < cls.REPLY_STRUCT.size:
+            return "Unknown ReplyAck or invalid Reply: " + response.hex(), -1
+
+        _, rec_id, *values = cls.REPLY_STRUCT.unpack_from(response)
 
-    def reply(self, response: bytes) -> tuple[str, int]:
-        try:
-            return self.ReplyAck[response], -1
-        except KeyError:
-            return "Unknown ReplyAck or invalid Reply: " + response.hex(), -1 
+        if rec_id != cls.REC_ID + REPLY_OFFSET:
+            return "Invalid Reply: " + response.hex(), -1
+
+        return cls.describe(*values)
+
+    @staticmethod
+    def describe(*values) -> tuple[str, object]:
+        '''Return (message, data) for the values of a reply record.'''
+        return "Reply: " + ", ".join(map(str, values)), values
 
 #
 # VISITECH RECORD LIBRARY
@@ -94,110 +217,132 @@ class Record:
 # status: incomplete
 #
 class SetInumSize(Record):
+    __slots__ = ()
+    REC_ID, FORMAT = 102, "H"
+
     def __init__(self, rows: int):
-        super().__init__(6, 102, rows.to_bytes(2, byteorder='big'))
+        self._pack(rows)
 
 class RequestInumSize(Record):
+    __slots__ = ()
+    REC_ID, REPLY_FORMAT = 302, "H"
+
     def __init__(self):
-        super().__init__(4, 302)
+        self._pack()
 
-    def reply(self, response: bytes) -> tuple[str, int]:
-        try:
-            return self.ReplyAck[response], -1
-        except KeyError:
-            inum_size = int.from_bytes(response[4:], byteorder='big')
-            return "Inum size: " + str(inum_size), inum_size
+    @staticmethod
+    def describe(inum_size):
+        return "Inum size: " + str(inum_size), inum_size
 
 class SetImageType(Record):
+    __slots__ = ()
+    REC_ID, FORMAT = 103, "H"
+
     def __init__(self, image_type: int):
-        super().__init__(6, 103, image_type.to_bytes(2, byteorder='big'))
+        self._pack(image_type)
 
 class RequestImageType(Record):
+    __slots__ = ()
+    REC_ID, REPLY_FORMAT = 303, "H"
+
     def __init__(self):
-        super().__init__(4, 303)
+        self._pack()
 
-    def reply(self, response: bytes) -> str:
-        try:
-            return self.ReplyAck[response]
-        except KeyError:
-            image_type = int.from_bytes(response[4:], byteorder='big')
-            return "Image type: " + str(image_type), image_type
+    @staticmethod
+    def describe(image_type):
+        return "Image type: " + str(image_type), image_type
 
 class LoadImageData(Record):
+    __slots__ = ()
+    REC_ID, FORMAT = 104, "HHH"
+    IDEMPOTENT = False # Sequence numbers must arrive in order
+
     def __init__(self, seq_no:int, inum:int, offset:int, data:bytes):
 
         if len(data) > 8956 or len(data) < 4:
             raise ValueError("Data length must be between 4 and 8956 bytes.")
 
-        payload = seq_no.to_bytes(2, byteorder='big') + inum.to_bytes(2, byteorder='big') + offset.to_bytes(2, byteorder='big') + data
-        super().__init__(len(payload) + 4, 104, payload)
+        self._pack_data(data, seq_no, inum, offset)
 
 class RequestSeqNoError(Record):
+    __slots__ = ()
+    REC_ID, REPLY_FORMAT = 311, "BH"
+
     def __init__(self):
-        super().__init__(4, 311)
-    
-    def reply(self, response: bytes) -> str:
-        if len(response) != 7 or response[:4] != b'\x00\x07\x01\xFF':
-            return "Invalid Reply: " + response.hex()
-        elif response[4] == 0:
-            return "No sequence number error since last request"
-        elif response[4] == 1:
-            return "Sequence number error since last request. Sequence number: " + str(int.from_bytes(response[5:], byteorder='big'))
+        self._pack()
+
+    @staticmethod
+    def describe(is_error, seq_no):
+        if is_error == 0:
+            return "No sequence number error since last request", None
+        elif is_error == 1:
+            return "Sequence number error since last request. Sequence number: " + str(seq_no), seq_no
         else:
-            return "Unknown SeqNoError Reply: " + response.hex()
+            return "Unknown SeqNoError Reply: " + str(is_error), -1
 
 class ResetSeqNo(Record):
+    __slots__ = ()
+    REC_ID = 112
+
     def __init__(self):
-        super().__init__(4, 112)
+        self._pack()
 
 class LoadFlatnessCorrectionMask(Record):
+    __slots__ = ()
+    REC_ID, FORMAT = 116, "HHH"
+    IDEMPOTENT = False # Packages must arrive in order
+
     def __init__(self, pkg_no: int, tot_pkg: int, data_size: int, data: bytes):
         if len(data) > 8956 or len(data) < 1:
             raise ValueError("Data length must be between 1 and 8956 bytes.")
-        
-        payload = pkg_no.to_bytes(2, byteorder='big') + tot_pkg.to_bytes(2, byteorder='big') + data_size.to_bytes(2, byteorder='big') + data
-        super().__init__(len(payload) + 4, 116, payload)
+
+        self._pack_data(data, pkg_no, tot_pkg, data_size)
 
 class SetFlatnessMaskOn(Record):
+    __slots__ = ()
+    REC_ID, FORMAT = 148, "B"
+
     def __init__(self, enable: bool):
-        super().__init__(5, 148, int(enable).to_bytes(1, byteorder='big'))
+        self._pack(int(enable))
 
 class RequestFlatnessMaskOn(Record):
+    __slots__ = ()
+    REC_ID, REPLY_FORMAT = 348, "B"
+
     def __init__(self):
-        super().__init__(4, 348)
-    
-    def reply(self, response: bytes) -> str:
-        if response[:4] != b'\x00\x04\x01\x5C':
-            return "Invalid Reply: " + response.hex(), -1
-        elif response[4] == 0:
+        self._pack()
+
+    @staticmethod
+    def describe(enable):
+        if enable == 0:
             return "Flatness mask is off", False
-        elif response[4] == 1:
+        elif enable == 1:
             return "Flatness mask is on", True
         else:
-            return "Unknown FlatnessMaskOn Reply: " + response.hex(), -1
+            return "Unknown FlatnessMaskOn Reply: " + str(enable), -1
 
 class SetLoadInternalImage(Record):
+    __slots__ = ()
+    REC_ID, FORMAT = 169, "B"
+
     def __init__(self, img_no: int):
-        super().__init__(5, 169, img_no.to_bytes(1, byteorder='big'))
+        self._pack(img_no)
 
 class RequestLoadInternalImage(Record):
+    __slots__ = ()
+    REC_ID, REPLY_FORMAT = 369, "B"
+
     def __init__(self):
-        super().__init__(4, 369)
-    
-    def reply(self, response: bytes) -> str:
-        try:
-            return self.ReplyAck[response]
-        except KeyError:
-            if response[:4] != b'\x00\x05\x02\x39':
-                return "Invalid Reply: " + response.hex(), -1
-            else:
-                img_no = response[-1]
-                return "Internal image number: " + str(img_no), img_no
-            
+        self._pack()
+
+    @staticmethod
+    def describe(img_no):
+        return "Internal image number: " + str(img_no), img_no
+
 class SetSequencerState(Record):
     """
     Represents a record for setting the sequencer state.
-    
+
     Args:
         seq_cmd (int): 1 = Run, 2 = Reset
         enable (bool): True = enable, False = disable
@@ -207,88 +352,125 @@ class SetSequencerState(Record):
             Set the sequencer in reset: SetSequencerState(2, True)
             Take the sequencer out of reset: SetSequencerState(2, False)
     """
+    __slots__ = ()
+    REC_ID, FORMAT = 106, "BB"
 
     def __init__(self, seq_cmd: int, enable: bool):
-        super().__init__(6, 106, seq_cmd.to_bytes(1, byteorder='big') + int(enable).to_bytes(1, byteorder='big'))
+        self._pack(seq_cmd, int(enable))
 
 class RequestSequencerState(Record):
+    __slots__ = ()
+    REC_ID, FORMAT, REPLY_FORMAT = 306, "B", "BBB"
+
     def __init__(self, seq_cmd: int):
-        super().__init__(5, 306, seq_cmd.to_bytes(1, byteorder='big'))
-    
-    def reply(self, response: bytes) -> str:
-        try:
-            return self.ReplyAck[response]
-        except KeyError:
-            if response[:4] != b'\x00\x07\x01\xFA':
-                return "Invalid Reply: " + response.hex(), -1
-            else:
-                seq_cmd = response[4]; enable = response[5]; valid_cmd = response[6] 
-                return "Sequencer command: " + str(seq_cmd) + ", enable: " + str(enable) + ", valid command: " + str(valid_cmd), (seq_cmd, enable, valid_cmd)
+        self._pack(seq_cmd)
+
+    @staticmethod
+    def describe(seq_cmd, enable, valid_cmd):
+        return "Sequencer command: " + str(seq_cmd) + ", enable: " + str(enable) + ", valid command: " + str(valid_cmd), (seq_cmd, enable, valid_cmd)
+
+class SetSequencerRegister(Record):
+    """
+    Represents a record for setting a sequencer register (Sequence/SetRegister, 9.2.6 of the LAMA standard).
+    A sequence file reads the register with «AssignVarReg VAR REGNO».
+
+    Args:
+        reg_no (int): The register number, 0-11
+        value (int): The register value, signed 16 bits (-32768 to 32767)
+    """
+    __slots__ = ()
+    # Unverified rec_id: inferred from the Set 1xx / Request 3xx numbering, the record table does not list it
+    REC_ID, FORMAT = 110, "Hh"
+
+    def __init__(self, reg_no: int, value: int):
+        if reg_no < 0 or reg_no > 11:
+            raise ValueError("Register number must be between 0 and 11.")
+        if value < -32768 or value > 32767:
+            raise ValueError("Register value must be a signed 16-bit value (-32768 to 32767).")
+        self._pack(reg_no, value)
+
+class RequestSequencerRegister(Record):
+    __slots__ = ()
+    # Unverified rec_id, see SetSequencerRegister
+    REC_ID, FORMAT, REPLY_FORMAT = 310, "H", "Hh"
+
+    def __init__(self, reg_no: int):
+        self._pack(reg_no)
+
+    @staticmethod
+    def describe(reg_no, value):
+        return "Sequencer register: " + str(reg_no) + ", value: " + str(value), (reg_no, value)
 
 class SetSoftwareSync(Record):
+    __slots__ = ()
+    REC_ID, FORMAT = 120, "B"
+
     def __init__(self, level: int):
         ''' level: 0 = low, 1 = high '''
-        super().__init__(5, 120, level.to_bytes(1, byteorder='big'))
-        
+        self._pack(level)
+
 class SetLedDriverAmplitude(Record):
+    __slots__ = ()
+    REC_ID, FORMAT = 133, "HH"
+
     def __init__(self, led_no: int, amplitude: int):
         if amplitude < 0 or amplitude > 4095:
             raise ValueError("Amplitude must be between 0 and 4095.")
-        super().__init__(8, 133, led_no.to_bytes(2, byteorder='big') + amplitude.to_bytes(2, byteorder='big'))
+        self._pack(led_no, amplitude)
 
 class RequestLedAmplitude(Record):
+    __slots__ = ()
+    REC_ID, FORMAT, REPLY_FORMAT = 333, "H", "HHB"
+
     def __init__(self, led_no: int):
-        super().__init__(6, 333, led_no.to_bytes(2, byteorder='big'))
-    
-    def reply(self, response: bytes) -> str:
-        try:
-            return self.ReplyAck[response]
-        except KeyError:
-            led_no = int.from_bytes(response[4:6], byteorder='big')
-            amplitude = int.from_bytes(response[6:8], byteorder='big')
-            read_ok = str(response[8])
-            return "LED number: " + str(led_no) + ", amplitude: " + str(amplitude) + ", read ok: " + read_ok, (led_no, amplitude, read_ok)
+        self._pack(led_no)
+
+    @staticmethod
+    def describe(led_no, amplitude, read_ok):
+        read_ok = str(read_ok)
+        return "LED number: " + str(led_no) + ", amplitude: " + str(amplitude) + ", read ok: " + read_ok, (led_no, amplitude, read_ok)
 
 class RequestLedStatus(Record):
+    __slots__ = ()
+    REC_ID, FORMAT, REPLY_FORMAT = 334, "H", "HHB"
+
     def __init__(self, led_no: int):
-        super().__init__(6, 334, led_no.to_bytes(2, byteorder='big'))
-    
-    def reply(self, response: bytes) -> str:
-        try:
-            return self.ReplyAck[response]
-        except KeyError:
-            led_no = int.from_bytes(response[4:6], byteorder='big')
-            led_status_word = ''.join(format(b, '08b') for b in response[6:8])
-            led_status_word = led_status_word[:8]
-            read_ok = str(response[8])
-        
-            #TODO: Add message for each bit in the status word
-
-            return "LED number: " + str(led_no) + ", status word: " + str(led_status_word) + ", read ok: " + read_ok, (led_no, led_status_word, read_ok)
-        
+        self._pack(led_no)
+
+    @staticmethod
+    def describe(led_no, status, read_ok):
+        led_status_word = format(status >> 8, '08b')
+        read_ok = str(read_ok)
+
+        #TODO: Add message for each bit in the status word
+
+        return "LED number: " + str(led_no) + ", status word: " + led_status_word + ", read ok: " + read_ok, (led_no, led_status_word, read_ok)
+
 class RequestLedTemperature(Record):
+    __slots__ = ()
+    REC_ID, FORMAT, REPLY_FORMAT = 335, "H", "HHHB"
+
     def __init__(self, led_no: int):
-        super().__init__(6, 335, led_no.to_bytes(2, byteorder='big'))
-    
-    def reply(self, response: bytes) -> str:
-        try:
-            return self.ReplyAck[response]
-        except KeyError:
-            led_no = int.from_bytes(response[4:6], byteorder='big')
-            led_temp = int.from_bytes(response[6:8], byteorder='big')/10 # degrees celsius
-            board_temp = int.from_bytes(response[8:10], byteorder='big')/2 # degrees celsius
-            read_ok = str(response[8])
-            message = "LED number: " + str(led_no) + ", led_temp: " + str(led_temp) + ", board_temp: " + str(board_temp) + ", read ok: " + read_ok
-            data = {"led_no": led_no, "led_temp": led_temp, "board_temp": board_temp, "read_ok": read_ok}
-            return message, data
-        
+        self._pack(led_no)
+
+    @staticmethod
+    def describe(led_no, led_temp, board_temp, read_ok):
+        led_temp = led_temp / 10 # degrees celsius
+        board_temp = board_temp / 2 # degrees celsius
+        read_ok = str(read_ok)
+        message = "LED number: " + str(led_no) + ", led_temp: " + str(led_temp) + ", board_temp: " + str(board_temp) + ", read ok: " + read_ok
+        data = {"led_no": led_no, "led_temp": led_temp, "board_temp": board_temp, "read_ok": read_ok}
+        return message, data
+
 class RequestSeqFileErrorLog(Record):
-    def __init__(self):
-        super().__init__(4, 307)
+    __slots__ = ()
+    REC_ID, REPLY_FORMAT = 307, ""
 
-    def reply(self, response: bytes) -> str:
-        data_size = response[:2]
-        error = response[2:].decode()
-        return data_size, error
+    def __init__(self):
+        self._pack()
 
-        
+    @classmethod
+    def parse(cls, response: bytes) -> tuple[str, object]:
+        '''The reply is the error log text after the header.'''
+        error = response[HEADER.size:].decode(errors='replace')
+        return error, error
@@ -16,6 +16,8 @@ import struct
 from typing import List, Tuple, Union
 from PIL import Image
 import numpy as np
+from metrics import REGISTRY
+from tracing import TRACER
 
 
 class RLEDescriptor:
@@ -94,7 +96,7 @@ def encode_rle_row_type5(line_data: bytes, width: int) -> bytes:
     
     i = 0
     while i < len(bit_array):
-        current_bit = bit_array[i]
+        current_bit = int(bit_array[i]) # a numpy uint8 would overflow in RLEDescriptor.to_bytes
         
         # Count consecutive bits of same value
         run_length_bits = 1
@@ -127,6 +129,8 @@ def encode_rle_row_type5(line_data: bytes, width: int) -> bytes:
     return bytes(encoded)
 
 
+@REGISTRY.timed("rle_encode")
+@TRACER.traced("rle_encode")
 def encode_rle_image_type5(image_data: Union[Image.Image, np.ndarray], 
                            width: int, height: int) -> List[bytes]:
     """
@@ -167,6 +171,11 @@ def encode_rle_image_type5(image_data: Union[Image.Image, np.ndarray],
         # Encode this row
         encoded_row = encode_rle_row_type5(row_bytes, width)
         encoded_rows.append(encoded_row)
+
+    encoded_bytes = sum(len(row) for row in encoded_rows)
+    REGISTRY.counter("rle_input_bytes_total").inc(bytes_per_row * height)
+    REGISTRY.counter("rle_output_bytes_total").inc(encoded_bytes)
+    REGISTRY.counter("rle_bytes_saved_total").inc(bytes_per_row * height - encoded_bytes)
     
     return encoded_rows
 
@@ -0,0 +1,164 @@
+import asyncio
+import contextlib
+import logging
+import time
+from metrics import REGISTRY
+from tracing import TRACER
+
+#
+# Pipelined layer loop.
+# The stages of a layer run as soon as their dependencies are met instead of one after the other:
+#
+#   prepare(i)  preprocessing, up to lookahead layers ahead of the exposure
+#   recoat(i)   Z move, after exposure i-1                      } concurrently
+#   upload(i)   after prepare(i) and exposure i-1               }
+#   load(i)     sequencer and LED, after upload(i)              }
+#   expose(i)   after recoat(i) and load(i): Z settled and data resident
+#
+# The blocking Projector and axes calls run in worker threads. Projector calls never overlap: upload and load
+# wait for the previous exposure, which uses the sequencer and image memory they change.
+#
+
+logger = logging.getLogger("lux4600.scheduler")
+
+STAGES = ("prepare", "recoat", "upload", "load", "expose")
+
+
+class Layer:
+    '''The stages of one layer. Every stage is optional.'''
+
+    def __init__(self, prepare=None, upload=None, load=None, expose=None, name:str=None):
+        """
+        Args:
+            prepare (callable): prepare() -> data, e.g. the preprocessed strips. Must not use the projector or axes.
+            upload (callable): upload(projector, data), e.g. projector.send_strip.
+            load (callable): load(projector, data), e.g. send the sequencer and set the LED amplitude.
+            expose (callable): expose(projector, axes, data), e.g. start the sequencer and scroll.
+            name (str): Shown in the logs and traces.
+        """
+        self.prepare = prepare
+        self.upload = upload
+        self.load = load
+        self.expose = expose
+        self.name = name
+
+
+class LayerTiming:
+    '''Start and end times (time.perf_counter, or the simulated time of LayerScheduler.clock) of the stages of a layer.'''
+
+    def __init__(self, index:int):
+        self.index = index
+        self.stages:dict[str, tuple[float, float]] = {}
+
+    def duration(self, stage:str) -> float:
+        start, end = self.stages.get(stage, (0.0, 0.0))
+        return end - start
+
+    def __repr__(self):
+        return f"LayerTiming({self.index}, " + ", ".join(f"{stage}={self.duration(stage):.2f} s" for stage in self.stages) + ")"
+
+
+class LayerScheduler:
+    '''Runs the layers of a print with their stages overlapped, see the module comment.'''
+
+    def __init__(self, projector, axes, layer_height:float, lookahead:int=1, recoat=None, metrics=REGISTRY):
+        """
+        Args:
+            projector (Projector): The projector, passed to the upload, load and expose stages.
+            axes: The axes, e.g. axes.ZaberAxes, passed to the expose stage.
+            layer_height (float): The Z increment between layers in mm.
+            lookahead (int): The number of layers prepared ahead of the layer being exposed.
+            recoat (callable): recoat(axes, layer_height), defaults to axes.increment_layer.
+            metrics (Registry): Holds the layer_gap_seconds histogram, the time between two exposures.
+
+        Attributes:
+            timings (list): The LayerTiming of each layer of the last run.
+            clock: The clock of simulated axes (axes.VirtualAxes), None for real ones. The stages are its
+                participants and their timings are in its simulated time, so a run predicts the print time.
+        """
+        self.projector = projector
+        self.axes = axes
+        self.clock = getattr(axes, "clock", None)
+        self.layer_height = layer_height
+        self.lookahead = lookahead
+        self.recoat = recoat or (lambda axes, layer_height: axes.increment_layer(layer_height))
+        self.metrics = metrics
+        self.timings = []
+
+    async def _stage(self, index:int, stage:str, function, *args):
+        '''Run a blocking stage in a worker thread and record its timing.'''
+
+        if function is None:
+            return None
+
+        def call():
+            with TRACER.span(f"layer.{stage}", layer=index):
+                return function(*args)
+
+        now = self.clock.now if self.clock else time.perf_counter
+
+        with self.clock.participant() if self.clock else contextlib.nullcontext():
+            start = now()
+            try:
+                return await asyncio.to_thread(call)
+            finally:
+                self.timings[index].stages[stage] = (start, now())
+
+    async def _prepare(self, index:int, layer:Layer, exposed:list[asyncio.Event]):
+        if index > self.lookahead:
+            await exposed[index - self.lookahead - 1].wait()
+        return await self._stage(index, "prepare", layer.prepare)
+
+    async def _layer(self, index:int, layer:Layer, prepared:asyncio.Task, exposed:list[asyncio.Event]):
+        recoat = None
+
+        if index:
+            await exposed[index - 1].wait()
+            recoat = asyncio.create_task(self._stage(index, "recoat", self.recoat, self.axes, self.layer_height))
+
+        data = await prepared
+        await self._stage(index, "upload", layer.upload, self.projector, data)
+        await self._stage(index, "load", layer.load, self.projector, data)
+
+        if recoat is not None:
+            await recoat # Z settled
+
+        logger.info(f"Layer {index + 1}{f' ({layer.name})' if layer.name else ''}")
+        await self._stage(index, "expose", layer.expose, self.projector, self.axes, data)
+        exposed[index].set()
+
+    async def run(self, layers:list[Layer]) -> list[LayerTiming]:
+        '''Run every layer. The first error cancels the stages not yet started and is raised.'''
+
+        self.timings = [LayerTiming(i) for i in range(len(layers))]
+        exposed = [asyncio.Event() for _ in layers]
+
+        prepared = [asyncio.create_task(self._prepare(i, layer, exposed)) for i, layer in enumerate(layers)]
+        tasks = prepared + [asyncio.create_task(self._layer(i, layer, prepared[i], exposed)) for i, layer in enumerate(layers)]
+
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+        for previous, timing in zip(self.timings, self.timings[1:]):
+            if "expose" in previous.stages and "expose" in timing.stages:
+                self.metrics.histogram("layer_gap_seconds").observe(timing.stages["expose"][0] - previous.stages["expose"][1])
+
+        return self.timings
+
+    def run_sync(self, layers:list[Layer]) -> list[LayerTiming]:
+        '''Run every layer from synchronous code, see run.'''
+        return asyncio.run(self.run(layers))
+
+    def serial_seconds(self) -> float:
+        '''The time the last run would have taken with its stages one after the other.'''
+        return sum(timing.duration(stage) for timing in self.timings for stage in timing.stages)
+
+    def wall_seconds(self) -> float:
+        '''The time the last run took.'''
+        times = [t for timing in self.timings for stage in timing.stages.values() for t in stage]
+        return max(times) - min(times) if times else 0.0
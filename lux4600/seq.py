@@ -1,4 +1,9 @@
 from typing import BinaryIO, Iterator
+from functools import lru_cache
+from img import SPAN_INUM_ROWS
+import heapq
+import math
+import re
 #
 # Base code for handling .seq files. 
 # Short scripts removed from classes to improve readability and clarity.# 
@@ -6,18 +11,66 @@ from typing import BinaryIO, Iterator
 class Sequencer:
 	'''A class for handling .seq files.'''
 
-	def __init__(self, file_path:str, chunk_size:int=1440):
+	def __init__(self, file_path:str, chunk_size:int=1440, variables:dict=None, registers:dict=None, compact:bool=True,
+				 start_trigger:int=None):
 		'''Initialize a Sequencer object with a file path.
 
+		The file is validated locally (see Program.validate), so mistakes fail before anything is uploaded.
+
 		Args:
 		    file_path (str): The path to the sequence file to open.
+		    variables (dict): Initial values replacing the first «AssignVar» of each named variable,
+		        e.g. {"TotalRows": 2160} for an image cropped to 2160 rows.
+		    registers (dict): Variables read from sequencer registers instead, e.g. {"Inum": 0}.
+		        The first «AssignVar» of each variable is replaced by «AssignVarReg», so its value
+		        can be changed with Projector.set_sequencer_registers without uploading the file again.
+		    compact (bool): Upload the program without comments and padding, see Program.compact.
+		    start_trigger (int): Trig source mask the program waits for once before its first loop,
+		        e.g. TRIG_SOURCES["software"], so it can be started in sync with the motion. See add_start_trigger.
 		'''
 		self.file_path = file_path
+		self.start_trigger = start_trigger
 		self.chunk_size = chunk_size
+		self.registers = registers or {}
+		self.compact = compact
 
 		self.file = self.open().read()
 
-		self.packets = self.to_packets(self.file)
+		if variables:
+			self.file = assign_variables(self.file, variables)
+
+		if registers:
+			self.file = assign_registers(self.file, registers)
+
+		if start_trigger is not None:
+			self.file = add_start_trigger(self.file, start_trigger)
+
+		self.packets = self.compile()
+
+	@classmethod
+	def from_text(cls, text:str, chunk_size:int=1440, compact:bool=True) -> 'Sequencer':
+		'''Initialize a Sequencer object from the contents of a sequence file, e.g. a generated program.'''
+
+		sequencer = cls.__new__(cls)
+		sequencer.file_path = None
+		sequencer.chunk_size = chunk_size
+		sequencer.registers = {}
+		sequencer.start_trigger = None
+		sequencer.compact = compact
+		sequencer.file = text.encode()
+		sequencer.packets = sequencer.compile()
+
+		return sequencer
+
+	def compile(self) -> list[bytes]:
+		'''Validate the file and split it into packets. Compiled packets are cached by file contents.'''
+
+		return list(_compile(self.file, self.chunk_size, self.compact))
+
+	def register_values(self, variables:dict) -> dict:
+		'''Map values of register variables to their register numbers, e.g. {"Inum": 1} -> {0: 1}.'''
+
+		return {self.registers[name]: value for name, value in variables.items()}
 
 	def open(self) -> BinaryIO:
 		'''Open a sequence file and return the file object.'''
@@ -29,7 +82,8 @@ class Sequencer:
 
 		return self.file.read(self.chunk_size)
 
-	def to_packets(self, data:bytes, chunk_size=1440) -> bytes:
+	@staticmethod
+	def to_packets(data:bytes, chunk_size=1440) -> list[bytes]:
 		"""Splits a sequence file into packets for transmission."""
 		
 		SequencerValueError.check_chunk_size(chunk_size)
@@ -50,6 +104,854 @@ class Sequencer:
 		return packets
 
 
+@lru_cache(maxsize=64)
+def _compile(data:bytes, chunk_size:int, compact:bool) -> tuple[bytes, ...]:
+	'''Validate and packetize a sequence file. The cache is keyed by the contents and settings.'''
+
+	program = Program.from_text(data.decode())
+	program.validate()
+
+	if compact:
+		data = program.compact().encode()
+
+	packets = tuple(Sequencer.to_packets(data, chunk_size))
+	SequencerValueError.check_packets(len(packets), chunk_size)
+
+	return packets
+
+
+def assign_variables(data:bytes, variables:dict) -> bytes:
+	"""Replace the value of the first «AssignVar» line of each variable in a sequence file.
+
+	Args:
+	    data (bytes): The sequence file contents.
+	    variables (dict): Variable names mapped to their new initial values.
+
+	Raises:
+	    SequencerValueError: If a variable is never assigned in the sequence file.
+	"""
+	text = data.decode()
+
+	for name, value in variables.items():
+		pattern = re.compile(r'^(\s*AssignVar\s+' + re.escape(name) + r'\s+)(\S+)', re.MULTILINE)
+		text, count = pattern.subn(lambda m: m.group(1) + str(value), text, count=1)
+
+		if count == 0:
+			raise SequencerValueError(f"Variable {name} is not assigned in the sequence file.")
+
+	return text.encode()
+
+
+def assign_registers(data:bytes, registers:dict) -> bytes:
+	"""Replace the first «AssignVar» line of each variable in a sequence file by an «AssignVarReg».
+
+	Args:
+	    data (bytes): The sequence file contents.
+	    registers (dict): Variable names mapped to the sequencer register (0-11) they are read from.
+
+	Raises:
+	    SequencerValueError: If a variable is never assigned in the sequence file or a register is invalid.
+	"""
+	text = data.decode()
+
+	for name, reg_no in registers.items():
+		SequencerValueError.check_register(reg_no)
+
+		pattern = re.compile(r'^(\s*)AssignVar(\s+' + re.escape(name) + r'\s+)(\S+)', re.MULTILINE)
+		text, count = pattern.subn(lambda m: m.group(1) + "AssignVarReg" + m.group(2) + str(reg_no), text, count=1)
+
+		if count == 0:
+			raise SequencerValueError(f"Variable {name} is not assigned in the sequence file.")
+
+	return text.encode()
+
+
+def add_start_trigger(data:bytes, source:int) -> bytes:
+	"""Insert a «Trig» waiting for source before the first loop of a sequence file.
+
+	The program runs its variable assignments, then waits for one trigger from source (e.g. a software
+	sync edge or a pulse from the motion controller) before it starts scrolling. Its own «Trig» commands
+	are unchanged. The line goes before the first «Trig» and before every label jumped to ahead of it, so
+	no jump leads back to it and it waits only once.
+
+	Args:
+	    data (bytes): The sequence file contents.
+	    source (int): The Trig source bitmask, see TRIG_SOURCES.
+
+	Raises:
+	    SequencerValueError: If the sequence file has no «Trig».
+	"""
+	lines = data.decode().splitlines(keepends=True)
+	commands = [(i, line.split()) for i, line in enumerate(lines) if line.split() and not line.lstrip().startswith("#")]
+
+	trig = next((i for i, tokens in commands if tokens[0] == "Trig"), None)
+
+	if trig is None:
+		raise SequencerValueError("The sequence file has no Trig to start in sync with.")
+
+	labels = {tokens[1]: i for i, tokens in commands if tokens[0] == "Label" and len(tokens) > 1}
+	targets = {tokens[1] for _, tokens in commands if tokens[0] == "Jump" and len(tokens) > 1}
+	targets |= {tokens[4] for _, tokens in commands if tokens[0] == "JumpIf" and len(tokens) > 4}
+
+	# Before the earliest label jumped back to, e.g. the start of an outer loop, and the labels leading to it
+	first = min([trig] + [labels[label] for label in targets if label in labels and labels[label] < trig])
+	for i, tokens in reversed([command for command in commands if command[0] < first]):
+		if tokens[0] not in ("Label", "DeclareLabel"):
+			break
+		first = i
+
+	lines.insert(first, f"Trig            0 {source}                                     0\n")
+
+	return "".join(lines).encode()
+
+
+def split_rows(mem_row:int, rows:int, inum:int, inum_size:int) -> list[tuple[int, int, int, int]]:
+	"""Split a load of rows from an image spanning consecutive inums into loads within single inums.
+
+	Args:
+	    mem_row (int): The first row to load, counted from the start of the image.
+	    rows (int): The number of rows to load.
+	    inum (int): The first inum of the image.
+	    inum_size (int): The number of rows per inum.
+
+	Returns:
+	    list: (dmd_start_row, rows, inum, mem_start_row) for each LoadRow.
+	"""
+	loads = []
+	dmd_row = 0
+
+	while rows > 0:
+		inum_offset, row = divmod(mem_row, inum_size)
+		load = min(rows, inum_size - row)
+
+		loads.append((dmd_row, load, inum + inum_offset, row))
+
+		dmd_row += load
+		mem_row += load
+		rows -= load
+
+	return loads
+
+
+#
+# Sequence program generator.
+# Builds scroll, static and grayscale programs from parameters with the smallest WAITFOR
+# values allowed by the timing constraints of the sequencer (LAMA Standard, 6.4 Timing Constraints).
+#
+TICK_NS = 250 # duration of one sequencer tick
+ROW_LOAD_NS = 40 # time to load one row to the DMD
+MASK_ROW_LOAD_NS = 46.3 # average time to load one row with a mask image enabled
+RESET_TICKS = 50 # reset (4.5 us) plus mirror settling (8 us) before the next load or reset
+
+LOAD_COMMANDS = ("LoadRow", "LoadGlobal")
+RESET_COMMANDS = ("ResetGlobal",)
+
+# Parameters of each command, not counting WAITFOR (LAMA Standard, 6.3 Command Description):
+#   V variable, N number or alias, X number, alias or variable, L label, O operator,
+#   D label definition, A variable definition, a alias definition
+SIGNATURES = {
+	"LoadGlobal": "V", "LoadSingle": "NV", "LoadDual": "NV", "LoadRow": "VVVV", "ClearSingle": "N", "ClearGlobal": "",
+	"ResetGlobal": "", "ResetSingle": "N", "ResetDual": "N",
+	"DeclareLabel": "D", "Label": "D", "AssignVar": "AX", "AssignVarReg": "AN", "Alias": "aN",
+	"Add": "VX", "Mult": "VVV", "And": "VVV", "Or": "VVV", "Xor": "VVV", "Not": "VV", "ShiftLeft": "VN", "ShiftRight": "VN",
+	"JumpIf": "VOVL", "Jump": "L", "Trig": "NN", "Wait": "X",
+	"LightSetWord": "N", "LightPulseWord": "N", "OutputSetBit": "N", "OutputClearBit": "N", "OutputSetWord": "N",
+	"SetMaskImage": "N",
+}
+COMMANDS = {name: len(signature) for name, signature in SIGNATURES.items()} # number of parameters
+NO_WAITFOR = ("DeclareLabel", "Alias")
+# Trig source bits
+TRIG_SOURCES = {"electrical": 1, "optical": 2, "internal": 4, "software": 8, "delayed": 16}
+
+MIN_WAITFOR = {"ClearGlobal": 6, "SetMaskImage": 76, "Label": 0, "Trig": 0} # Trig: TIMEOUT, 0 = none
+
+MAX_LABELS = 32
+MAX_VARIABLES = 32
+MAX_ALIASES = 64
+MAX_NAME_LENGTH = 20
+MAX_PACKETS = 20 # the projector rejects sequence files of more packets
+NAME = re.compile(r'[A-Za-z][A-Za-z0-9]*$')
+
+
+class Command:
+	'''One line of a sequence program.'''
+
+	def __init__(self, name:str, *params, waitfor:int=1, rows:int=None):
+		"""
+		Args:
+		    name (str): The command, e.g. "LoadRow".
+		    params: The parameters of the command, except WAITFOR.
+		    waitfor (int): The number of ticks until the next command. None for commands without
+		        WAITFOR (DeclareLabel, Alias). For Trig this is the TIMEOUT parameter.
+		    rows (int): The (maximum) number of rows loaded by a load command, for the timing constraints.
+		"""
+		self.name = name
+		self.params = [str(p) for p in params]
+		self.waitfor = waitfor
+		self.rows = rows
+		self.line = None # line number in the source file, see Program.from_text
+
+	@property
+	def ticks(self) -> int:
+		'''The minimum number of ticks the command takes.'''
+
+		if self.waitfor is None:
+			return 0 # Declarations only
+
+		if self.name == "Trig":
+			return 1 # At least one tick, more while waiting for the trigger
+
+		return self.waitfor
+
+	@property
+	def timed(self) -> bool:
+		'''True for commands with timing constraints (loads and resets).'''
+
+		return self.name in LOAD_COMMANDS or self.name in RESET_COMMANDS
+
+	def text(self) -> str:
+		waitfor = "" if self.waitfor is None else self.waitfor
+		return _line(self.name, " ".join(self.params), waitfor)
+
+
+def _line(command:str, params:str='', waitfor='') -> str:
+	'''Format one line of a sequence file in the column layout of the files in test/test-seq.'''
+
+	return f"{command:<16}{params:<40}{waitfor}".rstrip()
+
+
+class Program:
+	'''A sequence program built from Commands, with timing-aware WAITFOR values.'''
+
+	def __init__(self, mask:bool=False, registers:dict=None):
+		"""
+		Args:
+		    mask (bool): A mask image is enabled, which slows down row loads.
+		    registers (dict): Variables read from sequencer registers, mapped to their register number.
+		        These are assigned with «AssignVarReg», see Projector.set_sequencer_registers.
+		"""
+		self.mask = mask
+		self.registers = registers or {}
+		self.lines:list[Command | str] = []
+
+	@classmethod
+	def from_text(cls, text:str, mask:bool=False) -> 'Program':
+		"""Parse the contents of a sequence file.
+
+		Comments are kept, so text() reproduces the program in the generator's column layout.
+
+		Args:
+		    text (str): The contents of a sequence file.
+		    mask (bool): A mask image is enabled, which slows down row loads.
+
+		Returns:
+		    Program: The program, with Command.line set to the line number of each command.
+		"""
+		program = cls(mask)
+
+		for number, line in enumerate(text.splitlines(), start=1):
+			code, _, comment = line.partition("#")
+			tokens = code.split()
+
+			if not tokens:
+				if comment.strip():
+					program.comment(comment.strip())
+				continue
+
+			name = tokens[0]
+			SequencerValueError.check_command(name, tokens, number)
+			num_params = COMMANDS[name]
+			params, rest = tokens[1:num_params + 1], tokens[num_params + 1:]
+
+			if name in NO_WAITFOR:
+				waitfor = None
+			else:
+				waitfor = parse_number(rest[0], number) if rest else 1
+
+			program.add(name, *params, waitfor=waitfor).line = number
+
+		return program
+
+	@property
+	def commands(self) -> list[Command]:
+		return [line for line in self.lines if isinstance(line, Command)]
+
+	def add(self, name:str, *params, waitfor:int=1, rows:int=None) -> Command:
+		'''Append a command to the program.'''
+
+		command = Command(name, *params, waitfor=waitfor, rows=rows)
+		self.lines.append(command)
+		return command
+
+	def comment(self, text:str=""):
+		'''Append a comment line to the program.'''
+
+		self.lines.append(f"# {text}".rstrip())
+
+	def assign(self, name:str, value:int):
+		'''Define a variable, read from a sequencer register if it is in self.registers.'''
+
+		if name in self.registers:
+			SequencerValueError.check_register(self.registers[name])
+			self.add("AssignVarReg", name, self.registers[name])
+		elif value < 0:
+			# Negative numbers are only valid for the «Add»-command
+			self.add("AssignVar", name, 0)
+			self.add("Add", name, value)
+		else:
+			self.add("AssignVar", name, value)
+
+	def _successors(self, commands:list[Command], labels:dict, i:int) -> list[int]:
+		'''Indices of the commands that can execute after command i.'''
+
+		command = commands[i]
+
+		if command.name == "Jump":
+			return [labels[command.params[0]]]
+
+		if command.name == "JumpIf":
+			return [i + 1, labels[command.params[3]]]
+
+		return [i + 1] if i + 1 < len(commands) else []
+
+	def _graph(self) -> tuple[list[Command], dict]:
+		commands = self.commands
+		labels = {c.params[0]: i for i, c in enumerate(commands) if c.name == "Label"}
+		return commands, labels
+
+	def required_ticks(self, first:Command, second:Command) -> int:
+		'''The minimum number of ticks from the start of first to the start of second.'''
+
+		if first.name in LOAD_COMMANDS:
+			row_ns = MASK_ROW_LOAD_NS if self.mask else ROW_LOAD_NS
+			return math.ceil(first.rows * row_ns / TICK_NS - 1e-9)
+
+		return RESET_TICKS
+
+	def optimize(self) -> 'Program':
+		"""
+		Set the WAITFOR of every load and reset to the smallest legal value.
+
+		For each load or reset, the shortest path (in ticks) to every load or reset that can follow
+		it is found, and the WAITFOR is raised just enough to satisfy the constraint:
+		    load -> load/reset: rows * 40 ns (46.3 ns with a mask image)
+		    reset -> load/reset: 50 ticks (12.5 us)
+		Commands in between count with their own WAITFOR.
+
+		Returns:
+		    Program: self
+		"""
+		commands, labels = self._graph()
+
+		for i, command in enumerate(commands):
+			if not command.timed:
+				continue
+
+			waitfor = 1
+
+			for j, distance in self._next_timed(commands, labels, i).items():
+				waitfor = max(waitfor, self.required_ticks(command, commands[j]) - distance)
+
+			command.waitfor = waitfor
+
+		return self
+
+	def _next_timed(self, commands:list[Command], labels:dict, start:int) -> dict:
+		'''Shortest distance (ticks of the commands in between) from start to each following load or reset.'''
+
+		distances = {}
+		queue = [(0, s) for s in self._successors(commands, labels, start)]
+		visited = set()
+
+		while queue:
+			distance, i = heapq.heappop(queue)
+
+			if i in visited:
+				continue
+			visited.add(i)
+
+			if commands[i].timed:
+				distances[i] = distance
+				continue
+
+			for s in self._successors(commands, labels, i):
+				heapq.heappush(queue, (distance + commands[i].ticks, s))
+
+		return distances
+
+	def frame_ticks(self) -> int:
+		'''The longest path in ticks from a Trig to the next Trig, i.e. the shortest trigger period the program keeps up with.'''
+
+		commands, labels = self._graph()
+		longest = {}
+
+		def walk(i:int, visiting:set) -> int:
+			if i in longest:
+				return longest[i]
+			if i in visiting:
+				raise SequencerValueError(f"Loop without Trig at line {i}: {commands[i].text()}")
+
+			visiting.add(i)
+			following = [0 if commands[s].name == "Trig" else walk(s, visiting) for s in self._successors(commands, labels, i)]
+			visiting.discard(i)
+
+			longest[i] = commands[i].ticks + max(following, default=0)
+			return longest[i]
+
+		return max((walk(i, set()) for i, c in enumerate(commands) if c.name == "Trig"), default=0)
+
+	def max_trigger_rate(self) -> float:
+		'''The highest trigger frequency (Hz) the program keeps up with.'''
+
+		return 1e9 / (self.frame_ticks() * TICK_NS)
+
+	def validate(self) -> 'Program':
+		"""
+		Check the program against the rules of the sequencer language (LAMA Standard, 6.1 and 6.3).
+
+		Checks commands and their parameters, that variables are assigned and labels defined (or declared,
+		for forward jumps) before use, the limits on labels, variables and aliases, WAITFOR values and
+		that the last command is a jump.
+
+		Returns:
+		    Program: self
+
+		Raises:
+		    SequencerValueError: Listing every problem found, with its line number.
+		"""
+		errors = []
+		labels, declared, variables, aliases = {}, {}, set(), set()
+		commands = self.commands
+
+		for index, command in enumerate(commands):
+			line = command.line or index + 1
+			name, params = command.name, command.params
+
+			def error(message:str):
+				errors.append(f"Line {line}: {message}")
+
+			if name not in SIGNATURES:
+				error(f"unknown command {name!r}.")
+				continue
+
+			signature = SIGNATURES[name]
+			if len(params) != len(signature):
+				error(f"{name} takes {len(signature)} parameters, got {len(params)}.")
+				continue
+
+			# Check the parameters before the names the command defines, so «AssignVar A A» fails
+			for kind, param in zip(signature, params):
+				if kind == "V" and param not in variables:
+					error(f"variable {param!r} is used before it is assigned.")
+				elif kind == "N" and param not in aliases and not _is_number(param):
+					error(f"expected a number or alias, got {param!r}.")
+				elif kind == "X" and param not in variables and param not in aliases and not _is_number(param):
+					error(f"{param!r} is not a number, alias or assigned variable.")
+				elif kind == "L" and param not in labels and param not in declared:
+					error(f"label {param!r} is not defined. Forward jumps need a «DeclareLabel» first.")
+				elif kind == "O" and param not in ("<", ">"):
+					error(f"operator must be < or >, got {param!r}.")
+
+				if kind in "NX" and param.startswith("-") and name != "Add":
+					error(f"negative numbers are only valid for «Add», got {param}.")
+
+			for kind, param in zip(signature, params):
+				if kind in "DAa" and (not NAME.match(param) or len(param) > MAX_NAME_LENGTH):
+					error(f"{param!r} is not a valid name (a letter followed by up to {MAX_NAME_LENGTH - 1} letters or digits).")
+				if kind == "D" and name == "Label":
+					if param in labels:
+						error(f"label {param!r} is already defined on line {labels[param]}.")
+					labels[param] = line
+				elif kind == "D":
+					declared[param] = line
+				elif kind == "A":
+					variables.add(param)
+				elif kind == "a":
+					aliases.add(param)
+
+			if name == "AssignVarReg" and _is_number(params[1]) and not 0 <= parse_number(params[1]) <= 11:
+				error(f"register must be 0-11, got {params[1]}.")
+
+			if name == "Trig" and _is_number(params[0]) and not 0 <= parse_number(params[0]) <= 3:
+				error(f"Trig mode must be 0-3, got {params[0]}.")
+
+			if name == "Trig" and _is_number(params[1]) and not 0 <= parse_number(params[1]) <= 31:
+				error(f"Trig source must be a 5-bit mask, got {params[1]}.")
+
+			if name not in NO_WAITFOR:
+				minimum = MIN_WAITFOR.get(name, 1)
+				if command.waitfor is None or command.waitfor < minimum:
+					error(f"{name} needs a WAITFOR of at least {minimum}, got {command.waitfor}.")
+
+		for label, line in declared.items():
+			if label not in labels:
+				errors.append(f"Line {line}: label {label!r} is declared but never defined.")
+
+		if len(set(labels) | set(declared)) > MAX_LABELS:
+			errors.append(f"{len(set(labels) | set(declared))} labels, at most {MAX_LABELS} are allowed.")
+
+		if len(variables) > MAX_VARIABLES:
+			errors.append(f"{len(variables)} variables, at most {MAX_VARIABLES} are allowed.")
+
+		if len(aliases) > MAX_ALIASES:
+			errors.append(f"{len(aliases)} aliases, at most {MAX_ALIASES} are allowed.")
+
+		if not commands or commands[-1].name not in ("Jump", "JumpIf"):
+			errors.append("The last line must be a «Jump» or «JumpIf» command.")
+
+		if errors:
+			raise SequencerValueError("Invalid sequence program:\n  " + "\n  ".join(errors))
+
+		return self
+
+	def compact(self) -> str:
+		'''Return the program in a minimal canonical form: no comments, single spaces and decimal numbers.'''
+
+		lines = []
+
+		for command in self.commands:
+			tokens = [command.name] + [str(parse_number(p)) if _is_number(p) else p for p in command.params]
+			if command.waitfor is not None:
+				tokens.append(str(command.waitfor))
+			lines.append(" ".join(tokens))
+
+		return "\n".join(lines) + "\n"
+
+	def text(self) -> str:
+		'''Return the program as the contents of a sequence file.'''
+
+		header = [
+			"#--------------------------------------------------------------",
+			"#Command        Parameters\t\t\t\t\tWaitfor",
+			"#--------------------------------------------------------------",
+		]
+		lines = [line.text() if isinstance(line, Command) else line for line in self.lines]
+		return "\n".join(header + lines) + "\n"
+
+	def sequencer(self, chunk_size:int=1440) -> 'Sequencer':
+		'''Return a Sequencer for the program, ready for Projector.send_sequencer.'''
+
+		sequencer = Sequencer.from_text(self.text(), chunk_size)
+		sequencer.registers = dict(self.registers)
+		return sequencer
+
+
+def parse_number(token:str, line:int=None) -> int:
+	'''Parse a number of a sequence file, written in decimal or as hex with «0x».'''
+
+	try:
+		return int(token, 16) if token.lower().startswith("0x") else int(token)
+	except ValueError:
+		raise SequencerValueError(f"Line {line}: expected a number, got {token!r}.") from None
+
+
+def _is_number(token:str) -> bool:
+	return re.fullmatch(r'-?(0[xX][0-9a-fA-F]+|[0-9]+)', token) is not None
+
+
+def _frame(program:Program, trig_source:int, light:int):
+	'''Wait for a trigger, display the loaded rows and pulse the light.'''
+
+	program.add("Trig", 0, trig_source, waitfor=0)
+	program.add("ResetGlobal")
+	program.add("LightPulseWord", light)
+
+
+def scroll_program(rows:int, factor:int=1, inum:int=0, row_step:int=1, direction:str="both", mem_start_row:int=0,
+				   inum_size:int=None, dmd_rows:int=1080, trig_source:int=4, light:int=15, mask:bool=False,
+				   registers:dict=None) -> Program:
+	"""Generate a scroll program, like the hand-written scroll files in test/test-seq.
+
+	Every scroll position shows all grayscale planes (one frame per plane, one Trig per frame).
+	Plane i of the strip starts at row mem_start_row + i * rows of inum.
+
+	Args:
+	    rows (int): The number of rows of each grayscale plane.
+	    factor (int): The number of grayscale planes.
+	    inum (int): The inum of the strip.
+	    row_step (int): The number of rows scrolled per position.
+	    direction (str): "forward", "back" or "both" (forward then back, repeated).
+	    mem_start_row (int): The row of the strip within inum, e.g. Layout.variables(strip)["MemStartRow"].
+	    inum_size (int): The number of rows per inum. If the strip does not fit in one inum, the program
+	        carries the scroll position into the following inums (see Strip.inum_size).
+	    dmd_rows (int): The number of rows on the DMD.
+	    trig_source (int): The Trig source bitmask, 4 = internal sync.
+	    light (int): The LightPulseWord value.
+	    mask (bool): A mask image is enabled, which slows down row loads.
+	    registers (dict): Variables read from sequencer registers, e.g. {"Inum": 0}.
+
+	Returns:
+	    Program: The program with optimized WAITFOR values.
+	"""
+	SequencerValueError.check_scroll(rows, factor, row_step, direction, dmd_rows)
+
+	program = Program(mask, registers)
+	positions = (rows - dmd_rows) // row_step + 1
+	if direction == "both" and positions <= 2:
+		direction = "forward" # Nothing to show on the way back
+	program.comment(f"Generated by lux4600.seq.scroll_program: {factor} plane(s) of {rows} rows, "
+					f"{positions} positions, step {row_step}, direction {direction}")
+
+	if inum_size is not None and mem_start_row + rows * factor > inum_size:
+		_spanning_scroll(program, rows, factor, inum, row_step, direction, mem_start_row, inum_size, dmd_rows, trig_source, light)
+	else:
+		_single_inum_scroll(program, rows, factor, inum, row_step, direction, mem_start_row, dmd_rows, trig_source, light)
+
+	return program.optimize()
+
+
+def _single_inum_scroll(program:Program, rows, factor, inum, row_step, direction, mem_start_row, dmd_rows, trig_source, light):
+	'''Scroll a strip stored in a single inum. MemStartRow = LoopCount * TotalRows + ScrollRow + BaseRow.'''
+
+	end_row = ((rows - dmd_rows) // row_step + 1) * row_step # one step past the last position
+	# Scrolling back decrements before loading. When scrolling both ways, the turning points are not repeated.
+	back_row, stop_row = (end_row, 0) if direction == "back" else (end_row - row_step, row_step)
+
+	program.assign("TotalRows", rows)
+	program.assign("ScrollRow", 0)
+	program.assign("EndRow", end_row)
+	program.assign("BackRow", back_row)
+	program.assign("StopRow", stop_row)
+	program.assign("LoopCount", 0)
+	program.assign("MemStartRow", 0)
+	program.assign("BaseRow", mem_start_row)
+	program.assign("Factor", factor)
+	program.assign("Inum", inum)
+	program.assign("DmdStartRow", 0)
+	program.assign("LoadRows", dmd_rows - 1)
+
+	def planes(suffix:str):
+		program.add("AssignVar", "LoopCount", 0)
+		program.add("Label", f"grayloop{suffix}")
+		_frame(program, trig_source, light)
+		program.add("Mult", "MemStartRow", "LoopCount", "TotalRows")
+		program.add("Add", "MemStartRow", "ScrollRow")
+		program.add("Add", "MemStartRow", "BaseRow")
+		program.add("LoadRow", "DmdStartRow", "LoadRows", "Inum", "MemStartRow", rows=dmd_rows)
+		program.add("Add", "LoopCount", 1)
+		program.add("JumpIf", "LoopCount", "<", "Factor", f"grayloop{suffix}")
+
+	if direction in ("forward", "both"):
+		program.comment()
+		program.comment("Scroll forward")
+		program.add("Label", "forward")
+		program.add("AssignVar", "ScrollRow", 0)
+		program.add("Label", "scrollforward")
+		planes("A")
+		program.add("Add", "ScrollRow", row_step)
+		program.add("JumpIf", "ScrollRow", "<", "EndRow", "scrollforward")
+
+	if direction == "forward":
+		program.add("Jump", "forward")
+		return
+
+	program.comment()
+	program.comment("Scroll back")
+	program.add("Label", "back")
+	program.add("AssignVar", "ScrollRow", "BackRow")
+	program.add("Label", "scrollback")
+	program.add("Add", "ScrollRow", -row_step)
+	planes("B")
+	program.add("JumpIf", "ScrollRow", ">", "StopRow", "scrollback")
+	program.add("Jump", "forward" if direction == "both" else "back")
+
+
+def _spanning_load(program:Program, suffix:str, dmd_rows:int, trig_source:int, light:int):
+	'''Load every grayscale plane of the current scroll position, splitting loads that cross an inum.'''
+
+	program.add("AssignVar", "PInum", "Inum")
+	program.add("AssignVar", "PRow", "MemStartRow")
+	program.add("AssignVar", "LoopCount", 0)
+	program.add("Label", f"grayloop{suffix}")
+	_frame(program, trig_source, light)
+	program.comment("Rows left in the inum of this plane: Rows1 = InumSize - PRow")
+	program.add("Mult", "Neg", "PRow", "MinusOne")
+	program.add("AssignVar", "Rows1", "InumSize")
+	program.add("Add", "Rows1", "Neg")
+	program.add("JumpIf", "Rows1", "<", "DmdRows", f"split{suffix}")
+	program.add("LoadRow", "DmdStartRow", "LoadRows", "PInum", "PRow", rows=dmd_rows)
+	program.add("Jump", f"loaded{suffix}")
+	program.comment("The load crosses into the next inum, load it in two parts")
+	program.add("Label", f"split{suffix}")
+	program.add("AssignVar", "LoadA", "Rows1")
+	program.add("Add", "LoadA", -1)
+	program.add("LoadRow", "DmdStartRow", "LoadA", "PInum", "PRow", rows=dmd_rows - 1)
+	program.add("AssignVar", "InumB", "PInum")
+	program.add("Add", "InumB", 1)
+	program.add("AssignVar", "DmdRowB", "Rows1")
+	program.add("Mult", "Neg", "Rows1", "MinusOne")
+	program.add("AssignVar", "LoadB", "LoadRows")
+	program.add("Add", "LoadB", "Neg")
+	program.add("LoadRow", "DmdRowB", "LoadB", "InumB", "Zero", rows=dmd_rows - 1)
+	program.add("Label", f"loaded{suffix}")
+	program.comment("Move to the next plane, carrying into the next inum if PlaneRow >= Rows1.")
+	program.comment("(PRow + PlaneRow itself could overflow the 16-bit variables)")
+	program.add("Add", "PInum", "PlaneInum")
+	program.add("AssignVar", "Step", "PlaneRow")
+	program.add("JumpIf", "PlaneRow", "<", "Rows1", f"planecarry{suffix}")
+	program.add("Add", "PInum", 1)
+	program.add("Add", "Step", "NegInumSize")
+	program.add("Label", f"planecarry{suffix}")
+	program.add("Add", "PRow", "Step")
+	program.add("Add", "LoopCount", 1)
+	program.add("JumpIf", "LoopCount", "<", "Factor", f"grayloop{suffix}")
+
+
+def _spanning_scroll(program:Program, rows, factor, inum, row_step, direction, mem_start_row, inum_size, dmd_rows, trig_source, light):
+	'''Scroll a strip stored across consecutive inums. The scroll position is kept as (Inum, MemStartRow).'''
+
+	SequencerValueError.check_spanning(rows, inum_size, dmd_rows)
+	SequencerValueError.check_row_step(row_step, inum_size)
+
+	positions = (rows - dmd_rows) // row_step + 1
+	first_inum, first_row = divmod(mem_start_row, inum_size)
+	end = mem_start_row + positions * row_step # one step past the last position
+	end_inum, end_row = divmod(end, inum_size)
+	# Scrolling back decrements before loading. When scrolling both ways, the turning points are not repeated.
+	back, stop = (end, mem_start_row) if direction == "back" else (end - row_step, mem_start_row + row_step)
+	back_inum, back_row = divmod(back, inum_size)
+	stop_inum, stop_row = divmod(stop, inum_size)
+	plane_inum, plane_row = divmod(rows, inum_size) # offset between grayscale planes
+
+	program.comment(f"{inum_size} rows per inum, starting at inum {inum}")
+	program.assign("InumSize", inum_size)
+	program.assign("NegInumSize", -inum_size)
+	program.assign("FirstInum", inum + first_inum)
+	program.assign("FirstRow", first_row)
+	program.assign("EndInum", inum + end_inum)
+	program.assign("EndRow", end_row)
+	program.assign("BackInum", inum + back_inum)
+	program.assign("BackRow", back_row)
+	program.assign("StopInum", inum + stop_inum)
+	program.assign("StopRow", stop_row)
+	program.assign("Inum", inum + first_inum)
+	program.assign("MemStartRow", first_row)
+	program.assign("PlaneInum", plane_inum)
+	program.assign("PlaneRow", plane_row)
+	program.assign("Factor", factor)
+	program.assign("LoopCount", 0)
+	program.assign("DmdStartRow", 0)
+	program.assign("DmdRows", dmd_rows)
+	program.assign("LoadRows", dmd_rows - 1)
+	program.assign("MinusOne", -1)
+	program.assign("Zero", 0)
+	for name in ("PInum", "PRow", "Neg", "Step", "Rows1", "LoadA", "LoadB", "InumB", "DmdRowB"):
+		program.assign(name, 0)
+
+	for suffix in ("A", "B"):
+		for label in ("split", "loaded", "planecarry", "carry"):
+			program.add("DeclareLabel", f"{label}{suffix}", waitfor=None)
+
+	if direction in ("forward", "both"):
+		program.comment()
+		program.comment("Scroll forward")
+		program.add("Label", "forward")
+		program.add("AssignVar", "Inum", "FirstInum")
+		program.add("AssignVar", "MemStartRow", "FirstRow")
+		program.add("Label", "scrollforward")
+		_spanning_load(program, "A", dmd_rows, trig_source, light)
+		program.add("Add", "MemStartRow", row_step)
+		program.add("JumpIf", "MemStartRow", "<", "InumSize", "carryA")
+		program.add("Add", "MemStartRow", "NegInumSize")
+		program.add("Add", "Inum", 1)
+		program.add("Label", "carryA")
+		program.add("JumpIf", "Inum", "<", "EndInum", "scrollforward")
+		program.add("JumpIf", "MemStartRow", "<", "EndRow", "scrollforward")
+
+	if direction == "forward":
+		program.add("Jump", "forward")
+		return
+
+	program.comment()
+	program.comment("Scroll back")
+	program.add("Label", "back")
+	program.add("AssignVar", "Inum", "BackInum")
+	program.add("AssignVar", "MemStartRow", "BackRow")
+	program.add("Label", "scrollback")
+	program.add("Add", "MemStartRow", -row_step)
+	program.add("JumpIf", "MemStartRow", ">", "MinusOne", "carryB")
+	program.add("Add", "MemStartRow", "InumSize")
+	program.add("Add", "Inum", -1)
+	program.add("Label", "carryB")
+	_spanning_load(program, "B", dmd_rows, trig_source, light)
+	program.add("JumpIf", "Inum", ">", "StopInum", "scrollback")
+	program.add("JumpIf", "MemStartRow", ">", "StopRow", "scrollback")
+
+	program.add("Jump", "forward" if direction == "both" else "back")
+
+
+def static_program(inum:int=0, mem_start_row:int=0, dmd_rows:int=1080, trig_source:int=4, light:int=15,
+				   mask:bool=False, registers:dict=None) -> Program:
+	"""Generate a program showing a single image, like test/test-seq/1bit-static.txt.
+
+	Args:
+	    inum (int): The inum of the image.
+	    mem_start_row (int): The first row of the image within inum.
+	    See scroll_program for the other arguments.
+
+	Returns:
+	    Program: The program with optimized WAITFOR values.
+	"""
+	program = Program(mask, registers)
+	program.comment("Generated by lux4600.seq.static_program")
+	program.assign("MemStartRow", mem_start_row)
+	program.assign("Inum", inum)
+	program.assign("DmdStartRow", 0)
+	program.assign("LoadRows", dmd_rows - 1)
+	program.add("Label", "resetAll")
+	_frame(program, trig_source, light)
+	program.add("LoadRow", "DmdStartRow", "LoadRows", "Inum", "MemStartRow", rows=dmd_rows)
+	program.add("Jump", "resetAll")
+
+	return program.optimize()
+
+
+def grayscale_program(factor:int, inum:int=0, mem_start_row:int=0, rows:int=1080, dmd_rows:int=1080, trig_source:int=4,
+					  light:int=15, mask:bool=False, registers:dict=None) -> Program:
+	"""Generate a program cycling through the grayscale planes of a static image, like test/test-seq/8bit-1080.txt.
+
+	Args:
+	    factor (int): The number of grayscale planes. Plane i starts at row mem_start_row + i * rows.
+	    inum (int): The inum of the image.
+	    mem_start_row (int): The first row of the image within inum.
+	    rows (int): The number of rows of each grayscale plane.
+	    See scroll_program for the other arguments.
+
+	Returns:
+	    Program: The program with optimized WAITFOR values.
+	"""
+	program = Program(mask, registers)
+	program.comment(f"Generated by lux4600.seq.grayscale_program: {factor} plane(s) of {rows} rows")
+	program.assign("TotalRows", rows)
+	program.assign("LoopCount", 0)
+	program.assign("MemStartRow", 0)
+	program.assign("BaseRow", mem_start_row)
+	program.assign("Factor", factor)
+	program.assign("Inum", inum)
+	program.assign("DmdStartRow", 0)
+	program.assign("LoadRows", dmd_rows - 1)
+	program.add("Label", "restart")
+	program.add("AssignVar", "LoopCount", 0)
+	program.add("Label", "grayloop")
+	_frame(program, trig_source, light)
+	program.add("Mult", "MemStartRow", "LoopCount", "TotalRows")
+	program.add("Add", "MemStartRow", "BaseRow")
+	program.add("LoadRow", "DmdStartRow", "LoadRows", "Inum", "MemStartRow", rows=dmd_rows)
+	program.add("Add", "LoopCount", 1)
+	program.add("JumpIf", "LoopCount", "<", "Factor", "grayloop")
+	program.add("Jump", "restart")
+
+	return program.optimize()
+
+
+def spanning_scroll_program(rows:int, factor:int=1, inum:int=0, inum_size:int=SPAN_INUM_ROWS, dmd_rows:int=1080) -> str:
+	"""Write a scroll forward/back sequence for a strip stored across consecutive inums.
+
+	Shorthand for scroll_program(..., inum_size=inum_size).text(), see scroll_program.
+	"""
+	return scroll_program(rows, factor, inum, inum_size=inum_size, dmd_rows=dmd_rows).text()
+
+
 class SequencerValueError(ValueError):
 	'''Custom exception for Sequencer class.'''
 
@@ -68,3 +970,66 @@ class SequencerValueError(ValueError):
 		
 		if chunk_size % 8 != 0:
 			raise ValueError("Chunk size must be a multiple of 8.")
+
+	@staticmethod
+	def check_register(reg_no:int):
+		'''Check if a sequencer register number is valid (0-11).'''
+
+		if reg_no < 0 or reg_no > 11:
+			raise SequencerValueError(f"Sequencer register must be between 0 and 11, got {reg_no}.")
+
+	@staticmethod
+	def check_packets(num_packets:int, chunk_size:int):
+		'''Check that a sequence file fits in the number of packets the projector accepts.'''
+
+		if num_packets > MAX_PACKETS:
+			raise SequencerValueError(f"Sequence file needs {num_packets} packets of {chunk_size} bytes, "
+									  f"the projector accepts at most {MAX_PACKETS}.")
+
+	@staticmethod
+	def check_command(name:str, tokens:list, line:int):
+		'''Check that a line of a sequence file is a known command with all its parameters.'''
+
+		if name not in COMMANDS:
+			raise SequencerValueError(f"Line {line}: unknown command {name!r}.")
+
+		if len(tokens) - 1 < COMMANDS[name]:
+			raise SequencerValueError(f"Line {line}: {name} takes {COMMANDS[name]} parameters, got {len(tokens) - 1}.")
+
+	@staticmethod
+	def check_scroll(rows:int, factor:int, row_step:int, direction:str, dmd_rows:int):
+		'''Check the parameters of a scroll program.'''
+
+		if rows < dmd_rows:
+			raise SequencerValueError(f"Strip must have at least {dmd_rows} rows, got {rows}.")
+
+		if factor < 1:
+			raise SequencerValueError(f"Factor must be at least 1, got {factor}.")
+
+		if row_step < 1:
+			raise SequencerValueError(f"Row step must be at least 1, got {row_step}.")
+
+		if direction not in ("forward", "back", "both"):
+			raise SequencerValueError(f"Direction must be 'forward', 'back' or 'both', got {direction!r}.")
+
+	@staticmethod
+	def check_row_step(row_step:int, inum_size:int):
+		'''Check that a scroll step carries into at most the next inum.'''
+
+		if row_step >= inum_size:
+			raise SequencerValueError(f"Row step must be smaller than the inum size, got {row_step}.")
+
+	@staticmethod
+	def check_spanning(rows:int, inum_size:int, dmd_rows:int):
+		'''Check the parameters of a spanning scroll program.
+
+		Raises:
+		    SequencerValueError: If the strip is shorter than the DMD, an inum is shorter than the DMD
+		        (a load would cross more than one inum boundary) or the inum size exceeds the signed
+		        16-bit range of the sequencer.'''
+
+		if rows < dmd_rows:
+			raise SequencerValueError(f"Strip must have at least {dmd_rows} rows, got {rows}.")
+
+		if inum_size < dmd_rows or inum_size > 32767:
+			raise SequencerValueError(f"Inum size must be between {dmd_rows} and 32767 rows, got {inum_size}.")
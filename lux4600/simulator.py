@@ -0,0 +1,378 @@
+import logging
+import select
+import socket
+import struct
+import threading
+from PIL import Image
+import records
+from seq import Program, SequencerValueError
+
+#
+# Local simulator of the LUX4600 control and image data ports.
+# Decodes the records in records, keeps the projector state and the uploaded image rows,
+# and replies like the projector, so the Projector class can be run end to end without hardware.
+#
+
+logger = logging.getLogger("lux4600.simulator")
+
+LOAD_SEQUENCE_FILE = 105 # rec_id of the sequence file packets, see Sequencer.to_packets
+MAX_SEQUENCE_PACKAGES = 20
+IMAGE_TYPES = (4, 5) # 4 = 1-bit, 5 = RLE type 5
+RLE_IMAGE_TYPE = 5
+NUM_REGISTERS = 12
+
+# Image data headers: tot_size, rec_id, seq_no, inum, offset
+STRIP_HEADER = 14 # 6-byte offset, as sent by Strip.get_packet
+RLE_HEADER = 12 # 4-byte offset, as sent by Projector.send_image_rle
+
+# ReplyAck codes, see records.ACK_MESSAGES
+OK = 0x0000
+INVALID_INUM_SIZE = 0x2710
+INVALID_IMAGE_TYPE = 0x2711
+SEQUENCE_PACKAGE_ORDER = 0x2712
+SEQUENCE_FILE_ERROR = 0x2713
+TOO_MANY_PACKAGES = 0x2714
+UNKNOWN_REC_ID = 0x2715
+INVALID_REGISTER = 0x271C
+INVALID_AMPLITUDE = 0x2725
+
+
+def ack(code:int) -> bytes:
+    '''Return the ReplyAck record with code.'''
+    return struct.pack(">HHH", 6, records.REPLY_ACK_ID, code)
+
+
+def reply(request, *values) -> bytes:
+    '''Return the reply record to a request class, encoded with its REPLY_FORMAT.'''
+    return request.REPLY_STRUCT.pack(request.REPLY_STRUCT.size, request.REC_ID + records.REPLY_OFFSET, *values)
+
+
+class ProjectorSimulator:
+    '''Simulated projector listening on local UDP ports.'''
+
+    def __init__(self, host:str="127.0.0.1", port:int=0, image_data_port:int=0, width:int=1920, rcvbuf:int=8 << 20):
+        """
+        Args:
+            host (str): The address to listen on.
+            port (int): The control port, 0 for a free port.
+            image_data_port (int): The image data port, 0 for a free port.
+            width (int): The width of the DMD in pixels.
+            rcvbuf (int): The requested receive buffer of the image data port. Image data sent faster
+                than the simulator stores it is lost when the buffer is full, like on the projector.
+
+        Attributes:
+            port, image_data_port (int): The ports listened on.
+            inum_size, image_type (int): The values set by SetInumSize and SetImageType.
+            running, reset (bool): The sequencer run and reset flags, see records.SetSequencerState.
+            registers (list): The sequencer registers.
+            amplitude (dict): The LED driver amplitude by LED number.
+            rows (dict): Uploaded 1-bit rows by memory row, inum * inum_size + offset.
+            rle_rows (dict): Uploaded RLE rows by (inum, offset), stored encoded.
+            sequence_file (str): The last sequence file loaded without errors.
+            received (dict): The number of records received by rec_id.
+        """
+        self.width = width
+        self.control = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.control.bind((host, port))
+        self.image_data = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.image_data.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        self.image_data.bind((host, image_data_port))
+        self.image_data.setblocking(False) # serve drains it until empty, MSG_DONTWAIT does not exist on Windows
+
+        self.port = self.control.getsockname()[1]
+        self.image_data_port = self.image_data.getsockname()[1]
+
+        self.handlers = {
+            records.SetInumSize.REC_ID: self.set_inum_size,
+            records.RequestInumSize.REC_ID: lambda values: reply(records.RequestInumSize, self.inum_size),
+            records.SetImageType.REC_ID: self.set_image_type,
+            records.RequestImageType.REC_ID: lambda values: reply(records.RequestImageType, self.image_type),
+            records.ResetSeqNo.REC_ID: self.reset_seq_no,
+            records.RequestSeqNoError.REC_ID: lambda values: reply(records.RequestSeqNoError, int(self.seq_error), self.last_seq_no),
+            records.SetSequencerState.REC_ID: self.set_sequencer_state,
+            records.RequestSequencerState.REC_ID: self.request_sequencer_state,
+            records.SetSequencerRegister.REC_ID: self.set_register,
+            records.RequestSequencerRegister.REC_ID: self.request_register,
+            records.SetFlatnessMaskOn.REC_ID: self.set_flatness_mask,
+            records.RequestFlatnessMaskOn.REC_ID: lambda values: reply(records.RequestFlatnessMaskOn, int(self.flatness_mask)),
+            records.SetLoadInternalImage.REC_ID: self.set_internal_image,
+            records.RequestLoadInternalImage.REC_ID: lambda values: reply(records.RequestLoadInternalImage, self.internal_image),
+            records.SetSoftwareSync.REC_ID: self.set_software_sync,
+            records.SetLedDriverAmplitude.REC_ID: self.set_amplitude,
+            records.RequestLedAmplitude.REC_ID: lambda values: reply(records.RequestLedAmplitude, values[0], self.amplitude.get(values[0], 0), 1),
+            records.RequestLedStatus.REC_ID: lambda values: reply(records.RequestLedStatus, values[0], 0, 1),
+            records.RequestLedTemperature.REC_ID: self.request_temperature,
+            records.RequestSeqFileErrorLog.REC_ID: lambda values: records.HEADER.pack(4 + len(self.error_log), 507) + self.error_log.encode(),
+        }
+
+        self.power_cycle()
+
+        self.received = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def power_cycle(self):
+        '''Reset the state and memory to the power-on defaults.'''
+
+        self.inum_size = 1080
+        self.image_type = 4
+        self.running = False
+        self.reset = False
+        self.registers = [0] * NUM_REGISTERS
+        self.amplitude = {}
+        self.flatness_mask = False
+        self.internal_image = 0
+        self.software_sync = 0
+
+        self.expected_seq_no = None # None after ResetSeqNo, the first packet sets the sequence
+        self.last_seq_no = 0
+        self.seq_error = False
+
+        self.rows = {}
+        self.rle_rows = {}
+
+        self.packages = []
+        self.sequence_file = None
+        self.error_log = ""
+
+    # Control records
+
+    def set_inum_size(self, values):
+        if not 1 <= values[0] <= 65535:
+            return ack(INVALID_INUM_SIZE)
+        self.inum_size = values[0]
+        return ack(OK)
+
+    def set_image_type(self, values):
+        if values[0] not in IMAGE_TYPES:
+            return ack(INVALID_IMAGE_TYPE)
+        self.image_type = values[0]
+        return ack(OK)
+
+    def reset_seq_no(self, values):
+        self.expected_seq_no = None
+        self.last_seq_no = 0
+        self.seq_error = False
+        return ack(OK)
+
+    def set_sequencer_state(self, values):
+        seq_cmd, enable = values
+        if seq_cmd == 1:
+            self.running = bool(enable)
+        elif seq_cmd == 2:
+            self.reset = bool(enable)
+            if enable:
+                self.registers = [0] * NUM_REGISTERS # The reset clears the registers
+        else:
+            return ack(UNKNOWN_REC_ID)
+        return ack(OK)
+
+    def request_sequencer_state(self, values):
+        seq_cmd = values[0]
+        enable = {1: self.running, 2: self.reset}.get(seq_cmd)
+        return reply(records.RequestSequencerState, seq_cmd, int(bool(enable)), int(enable is not None))
+
+    def set_register(self, values):
+        reg_no, value = values
+        if reg_no >= NUM_REGISTERS:
+            return ack(INVALID_REGISTER)
+        self.registers[reg_no] = value
+        return ack(OK)
+
+    def request_register(self, values):
+        reg_no = values[0]
+        if reg_no >= NUM_REGISTERS:
+            return ack(INVALID_REGISTER)
+        return reply(records.RequestSequencerRegister, reg_no, self.registers[reg_no])
+
+    def set_flatness_mask(self, values):
+        self.flatness_mask = bool(values[0])
+        return ack(OK)
+
+    def set_internal_image(self, values):
+        self.internal_image = values[0]
+        return ack(OK)
+
+    def set_software_sync(self, values):
+        self.software_sync = values[0]
+        return ack(OK)
+
+    def set_amplitude(self, values):
+        led_no, amplitude = values
+        if amplitude > 4095:
+            return ack(INVALID_AMPLITUDE)
+        self.amplitude[led_no] = amplitude
+        return ack(OK)
+
+    def request_temperature(self, values):
+        led_no = values[0]
+        led_temp = 250 + self.amplitude.get(led_no, 0) // 20 # 0.1 °C, warmer at higher amplitude
+        return reply(records.RequestLedTemperature, led_no, led_temp, 60, 1) # board 30 °C in 0.5 °C
+
+    def load_sequence_file(self, data:bytes) -> bytes:
+        pkg_no, tot_pkg, size = struct.unpack_from(">HHH", data, 4)
+
+        if tot_pkg > MAX_SEQUENCE_PACKAGES:
+            return ack(TOO_MANY_PACKAGES)
+
+        if pkg_no != len(self.packages) + 1:
+            self.packages = []
+            if pkg_no != 1:
+                return ack(SEQUENCE_PACKAGE_ORDER)
+
+        self.packages.append(data[10:10 + size])
+
+        if pkg_no < tot_pkg:
+            return ack(OK)
+
+        text = b"".join(self.packages).decode(errors="replace")
+        self.packages = []
+
+        try:
+            Program.from_text(text).validate()
+        except (SequencerValueError, ValueError) as e:
+            self.error_log = str(e)
+            return ack(SEQUENCE_FILE_ERROR)
+
+        self.error_log = ""
+        self.sequence_file = text
+        return ack(OK)
+
+    def handle(self, data:bytes) -> bytes:
+        '''Return the reply to a record received on the control port.'''
+
+        if len(data) < records.HEADER.size:
+            return ack(UNKNOWN_REC_ID)
+
+        _, rec_id = records.HEADER.unpack_from(data)
+        self.received[rec_id] = self.received.get(rec_id, 0) + 1
+
+        if rec_id == LOAD_SEQUENCE_FILE:
+            return self.load_sequence_file(data)
+
+        handler = self.handlers.get(rec_id)
+        record = records.RECORDS.get(rec_id)
+
+        if handler is None or len(data) < record.STRUCT.size:
+            return ack(UNKNOWN_REC_ID)
+
+        return handler(record.STRUCT.unpack_from(data)[2:])
+
+    # Image data
+
+    def load_image_data(self, data:bytes):
+        '''Store a LoadImageData packet received on the image data port.'''
+
+        _, rec_id, seq_no, inum = struct.unpack_from(">HHHH", data)
+        self.received[rec_id] = self.received.get(rec_id, 0) + 1
+
+        if rec_id != records.LoadImageData.REC_ID:
+            return
+
+        if self.expected_seq_no is not None and seq_no != self.expected_seq_no and not self.seq_error:
+            self.seq_error = True # last_seq_no keeps the last packet received in order
+
+        if not self.seq_error:
+            self.last_seq_no = seq_no
+        self.expected_seq_no = (seq_no + 1) % 65536
+
+        if self.image_type == RLE_IMAGE_TYPE:
+            offset = int.from_bytes(data[8:RLE_HEADER], byteorder='big')
+            self.rle_rows[(inum, offset)] = data[RLE_HEADER:]
+            return
+
+        offset = int.from_bytes(data[8:STRIP_HEADER], byteorder='big')
+        bytes_per_row = self.width // 8
+        payload = data[STRIP_HEADER:]
+        first_row = inum * self.inum_size + offset
+
+        for i in range(len(payload) // bytes_per_row):
+            self.rows[first_row + i] = payload[i * bytes_per_row:(i + 1) * bytes_per_row]
+
+    def image(self, inum:int=0, rows:int=None) -> Image.Image:
+        """
+        Return the 1-bit rows stored from inum on as an image. Rows never written are black.
+
+        Args:
+            inum (int): The first inum.
+            rows (int): The number of rows, defaults to the inum size.
+        """
+        rows = self.inum_size if rows is None else rows
+        first_row = inum * self.inum_size
+        bytes_per_row = self.width // 8
+        blank = bytes(bytes_per_row)
+
+        data = b"".join(self.rows.get(first_row + i, blank) for i in range(rows))
+        return Image.frombytes("1", (self.width, rows), data)
+
+    # Server
+
+    def serve(self, timeout:float=0.05):
+        '''Handle the records received until stop is called.'''
+
+        while not self._stop.is_set():
+            readable, _, _ = select.select([self.image_data, self.control], [], [], timeout)
+
+            # Drain the image data first, the control port is only used after the data was sent
+            if self.image_data in readable:
+                while True:
+                    try:
+                        data, _ = self.image_data.recvfrom(65536)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    self.load_image_data(data)
+
+            if self.control in readable:
+                data, address = self.control.recvfrom(65536)
+                try:
+                    response = self.handle(data)
+                except Exception as e: # A malformed record must not stop the simulator
+                    logger.error(f"Error handling {data[:16].hex()}: {e}")
+                    response = ack(UNKNOWN_REC_ID)
+                self.control.sendto(response, address)
+
+    def start(self):
+        '''Serve in a daemon thread.'''
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.serve, name="ProjectorSimulator", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        self.stop()
+        self.control.close()
+        self.image_data.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == '__main__':
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Simulate a LUX4600 projector on local UDP ports.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=52985)
+    parser.add_argument("--image-data-port", type=int, default=52986)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    simulator = ProjectorSimulator(args.host, args.port, args.image_data_port)
+    logger.info(f"Simulating a projector on {args.host}, ports {simulator.port} and {simulator.image_data_port}")
+
+    try:
+        simulator.serve()
+    except KeyboardInterrupt:
+        simulator.close()
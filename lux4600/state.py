@@ -0,0 +1,116 @@
+import records
+
+#
+# Mirror of the projector control state.
+# Remembers the values set by acknowledged setter records, so a setter whose value is
+# already in effect can be skipped instead of costing a round trip.
+#
+
+# Setter records mirrored: rec_id -> number of leading fields that select what is set
+SETTERS = {
+    records.SetImageType.REC_ID: 0,
+    records.SetInumSize.REC_ID: 0,
+    records.SetSequencerState.REC_ID: 1, # seq_cmd, 1 = run, 2 = reset
+    records.SetFlatnessMaskOn.REC_ID: 0,
+    records.SetLedDriverAmplitude.REC_ID: 1, # led_no
+}
+
+def state_key(record:records.Record) -> tuple[tuple, tuple] | None:
+    '''Return (key, value) of a setter record, or None if the record is not mirrored.'''
+
+    fields = SETTERS.get(record.REC_ID)
+    if fields is None:
+        return None
+
+    values = record.STRUCT.unpack_from(record.bytes())[2:]
+    return (record.REC_ID, *values[:fields]), tuple(values[fields:])
+
+
+def queries(led_numbers=(0,)) -> list[tuple[records.Record, callable]]:
+    """
+    Return the requests reading back the mirrored state.
+
+    Returns:
+        list: (request, convert) pairs. convert(data) returns the (key, value) of the reply data.
+    """
+    checks = [
+        (records.RequestImageType(), lambda data: ((records.SetImageType.REC_ID,), (data,))),
+        (records.RequestInumSize(), lambda data: ((records.SetInumSize.REC_ID,), (data,))),
+        (records.RequestFlatnessMaskOn(), lambda data: ((records.SetFlatnessMaskOn.REC_ID,), (int(data),))),
+    ]
+
+    for seq_cmd in (1, 2):
+        checks.append((records.RequestSequencerState(seq_cmd),
+                       lambda data: ((records.SetSequencerState.REC_ID, data[0]), (data[1],))))
+
+    for led_no in led_numbers:
+        checks.append((records.RequestLedAmplitude(led_no),
+                       lambda data: ((records.SetLedDriverAmplitude.REC_ID, data[0]), (data[1],))))
+
+    return checks
+
+
+class ProjectorState:
+    '''Known projector state. Values not in the mirror are unknown and are always sent.'''
+
+    def __init__(self):
+        """
+        Attributes:
+            values (dict): Mirrored values, (rec_id, *selector) -> value fields of the setter.
+            resyncs (int): The number of times the mirror was found out of date.
+            skipped (int): The number of setter records skipped.
+        """
+        self.values = {}
+        self.resyncs = 0
+        self.skipped = 0
+
+    def needed(self, record:records.Record, pending:dict=None) -> bool:
+        """
+        Return True unless the record sets a value that is already in effect.
+
+        Args:
+            record (Record): The record to send.
+            pending (dict): Values set by records sent but not yet acknowledged, e.g. earlier in a batch.
+                They take precedence over the mirror, and the value of the record is added if it is needed.
+        """
+        entry = state_key(record)
+        if entry is None:
+            return True
+
+        key, value = entry
+        known = pending[key] if pending is not None and key in pending else self.values.get(key)
+
+        if known == value:
+            self.skipped += 1
+            return False
+
+        if pending is not None:
+            pending[key] = value
+        return True
+
+    def apply(self, record:records.Record):
+        '''Update the mirror after the projector acknowledged a record.'''
+
+        entry = state_key(record)
+        if entry is not None:
+            key, value = entry
+            self.values[key] = value
+
+    def invalidate(self):
+        '''Forget the mirror, e.g. after a lost reply left the result of a record unknown.'''
+
+        self.values.clear()
+
+    def observe(self, key:tuple, value:tuple) -> bool:
+        """
+        Record a value read back from the projector.
+
+        Returns:
+            bool: False if the mirror held a different value, i.e. the projector changed behind our back.
+        """
+        known = self.values.get(key)
+        self.values[key] = value
+        return known is None or known == value
+
+    def __repr__(self):
+        return f"ProjectorState({self.values})"
@@ -0,0 +1,158 @@
+import threading
+import time
+import numpy as np
+import records
+
+#
+# Background telemetry of the LED driver and sequencer.
+# A thread polls the projector between uploads, sharing the control socket through Projector.lock,
+# and keeps the samples in fixed-size ring buffers.
+#
+
+# Sampled channels, in the order of the columns of the history
+CHANNELS = ("led_temp", "board_temp", "led_status", "amplitude", "sequencer_running")
+
+
+class RingBuffer:
+    '''Fixed-size history of samples, the oldest samples are overwritten.'''
+
+    def __init__(self, size:int, channels:tuple=CHANNELS):
+        """
+        Args:
+            size (int): The number of samples kept.
+            channels (tuple): The names of the channels sampled.
+        """
+        self.channels = channels
+        self.time = np.full(size, np.nan)
+        self.values = np.full((size, len(channels)), np.nan)
+        self.count = 0 # The number of samples ever written
+        self.lock = threading.Lock()
+
+    def append(self, t:float, values:list):
+        with self.lock:
+            index = self.count % len(self.time)
+            self.time[index] = t
+            self.values[index] = values
+            self.count += 1
+
+    def history(self) -> dict[str, np.ndarray]:
+        '''Return a copy of the samples, oldest first, as arrays by channel name with the sample times under "time".'''
+
+        with self.lock:
+            size = len(self.time)
+            order = np.arange(self.count - min(self.count, size), self.count) % size
+            time_, values = self.time[order], self.values[order]
+
+        history = {"time": time_}
+        history.update({channel: values[:, i] for i, channel in enumerate(self.channels)})
+        return history
+
+
+class TelemetryPoller:
+    '''Polls the LED driver and sequencer state of a projector in a background thread.'''
+
+    def __init__(self, projector, period:float=1.0, size:int=3600, led_no:int=0, callback=None):
+        """
+        Args:
+            projector (Projector): The projector to poll. The control socket is shared through projector.lock.
+            period (float): Seconds between samples.
+            size (int): The number of samples kept, e.g. 3600 = one hour at one sample per second.
+            led_no (int): The LED driver polled.
+            callback (callable): Called with the latest values after each sample, e.g. to stop a print on overheating.
+
+        Attributes:
+            latest (dict): The latest sample by channel name, with its time under "time". Replaced as a whole
+                on every sample, so reading it needs no lock.
+            errors (int): The number of failed samples.
+        """
+        self.projector = projector
+        self.period = period
+        self.buffer = RingBuffer(size)
+        self.callback = callback
+        self.requests = [
+            records.RequestLedTemperature(led_no),
+            records.RequestLedStatus(led_no),
+            records.RequestLedAmplitude(led_no),
+            records.RequestSequencerState(1),
+        ]
+
+        self.latest = {}
+        self.errors = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self) -> dict:
+        '''Poll the projector once and store the sample. Failed requests are stored as NaN.'''
+
+        try:
+            replies = self.projector.send_batch(self.requests, check=False)
+        except Exception as e: # The poller must outlive a lost reply or a busy socket
+            self.errors += 1
+            replies = [(str(e), -1)] * len(self.requests)
+
+        temperature, status, amplitude, sequencer = (data for _, data in replies)
+        values = [np.nan] * len(CHANNELS)
+
+        if isinstance(temperature, dict):
+            values[0], values[1] = temperature["led_temp"], temperature["board_temp"]
+        if isinstance(status, tuple):
+            values[2] = int(status[1], 2)
+        if isinstance(amplitude, tuple):
+            values[3] = amplitude[1]
+        if isinstance(sequencer, tuple):
+            values[4] = sequencer[1]
+
+        t = time.time()
+        self.buffer.append(t, values)
+
+        latest = dict(zip(CHANNELS, values))
+        latest["time"] = t
+        self.latest = latest
+
+        if self.callback is not None:
+            self.callback(latest)
+
+        return latest
+
+    def run(self):
+        next_sample = time.monotonic()
+
+        while not self._stop.is_set():
+            self.sample()
+            next_sample += self.period
+            self._stop.wait(max(0.0, next_sample - time.monotonic()))
+
+    def start(self):
+        '''Start polling in a daemon thread.'''
+
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="TelemetryPoller", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        '''Stop polling and wait for the thread to finish.'''
+
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def history(self) -> dict[str, np.ndarray]:
+        '''Return the samples kept, oldest first, see RingBuffer.history.'''
+        return self.buffer.history()
+
+    def dump(self, path:str):
+        '''Save the samples kept as CSV.'''
+
+        history = self.history()
+        np.savetxt(path, np.column_stack(list(history.values())), delimiter=",", header=",".join(history), comments="")
@@ -0,0 +1,189 @@
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+from metrics import shared_default
+
+#
+# Stage spans of a print, exported as Chrome trace events (chrome://tracing, ui.perfetto.dev).
+# Spans are recorded only while the tracer is enabled. Disabled, a span is one attribute check,
+# so the stages of lux4600 and axes.ZaberAxes stay instrumented in production.
+#
+
+
+class _Disabled:
+    '''The span returned while tracing is disabled.'''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+DISABLED = _Disabled()
+
+
+class Span:
+    '''A running span, recorded as a Chrome "complete" event when it ends.'''
+
+    __slots__ = ("tracer", "name", "category", "args", "start", "profile")
+
+    def __init__(self, tracer:'Tracer', name:str, category:str, args:dict):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.profile = None
+
+    def __enter__(self):
+        self.profile = self.tracer._start_profile()
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        self.tracer._end(self, end)
+        return False
+
+
+class Tracer:
+    '''Records spans of the stages of a print.'''
+
+    def __init__(self):
+        """
+        Attributes:
+            enabled (bool): Spans are only recorded while True, see enable.
+            events (list): The Chrome trace events recorded.
+            profiles (list): (span name, cProfile.Profile) of the profiled spans.
+        """
+        self.enabled = False
+        self.profile = False
+        self.events = []
+        self.profiles = []
+        self.origin = time.perf_counter_ns()
+        self._profiling = False # Only one cProfile.Profile can run at a time, so only outermost spans are profiled
+        self._lock = threading.Lock()
+
+    def enable(self, profile:bool=False):
+        '''Start recording spans. With profile, the outermost spans are also profiled with cProfile.'''
+        self.profile = profile
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        with self._lock:
+            self.events = []
+            self.profiles = []
+            self.origin = time.perf_counter_ns()
+
+    def span(self, name:str, category:str="lux4600", **args):
+        '''
+        Return a context manager recording the block as a span, e.g.
+
+            with TRACER.span("layer", layer=i):
+                ...
+
+        args are shown with the span in the trace viewer.
+        '''
+        if not self.enabled:
+            return DISABLED
+        return Span(self, name, category, args)
+
+    def traced(self, name:str=None, category:str="lux4600"):
+        '''Decorator recording every call as a span, named after the function by default.'''
+
+        def decorator(function):
+            span_name = name or function.__qualname__
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with Span(self, span_name, category, {}):
+                    return function(*args, **kwargs)
+            return wrapper
+
+        return decorator
+
+    def _start_profile(self) -> cProfile.Profile | None:
+        if not self.profile:
+            return None
+
+        with self._lock:
+            if self._profiling:
+                return None
+            self._profiling = True
+
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def _end(self, span:Span, end:int):
+        if span.profile is not None:
+            span.profile.disable()
+            self._profiling = False
+
+        event = {"name": span.name, "cat": span.category, "ph": "X",
+                 "ts": (span.start - self.origin) / 1e3, "dur": (end - span.start) / 1e3, # µs
+                 "pid": os.getpid(), "tid": threading.get_ident()}
+        if span.args:
+            event["args"] = {key: str(value) for key, value in span.args.items()}
+
+        with self._lock:
+            self.events.append(event)
+            if span.profile is not None:
+                self.profiles.append((span.name, span.profile))
+
+    def chrome_trace(self) -> dict:
+        '''Return the spans recorded in the Chrome trace event format, with thread names.'''
+
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+        with self._lock:
+            events = list(self.events)
+
+        metadata = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid,
+                     "args": {"name": names.get(tid, str(tid))}} for tid in {event["tid"] for event in events}]
+
+        return {"traceEvents": metadata + events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, path:str):
+        '''Write the spans recorded to path, to be opened in chrome://tracing or ui.perfetto.dev.'''
+
+        with open(path, "w") as file:
+            json.dump(self.chrome_trace(), file)
+
+    def write_profiles(self, directory:str) -> list[str]:
+        '''Write the cProfile data of the profiled spans to directory, one .prof file per span (see pstats, snakeviz).'''
+
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+
+        with self._lock:
+            profiles = list(self.profiles)
+
+        for i, (name, profile) in enumerate(profiles):
+            path = os.path.join(directory, f"{i:04d}_{name.replace('/', '_')}.prof")
+            profile.dump_stats(path)
+            paths.append(path)
+
+        return paths
+
+    def totals(self) -> dict[str, float]:
+        '''Total seconds spent in the spans of each name, slowest first.'''
+
+        totals = {}
+
+        with self._lock:
+            for event in self.events:
+                totals[event["name"]] = totals.get(event["name"], 0.0) + event["dur"] / 1e6
+
+        return dict(sorted(totals.items(), key=lambda item: -item[1]))
+
+
+TRACER = shared_default(__name__, "TRACER", Tracer) # Default tracer
@@ -1,10 +1,22 @@
 from lux4600 import *
-from lux4600.projector import Projector
+from lux4600.projector import Projector, ProjectorError
 from lux4600.img import Strip
 from lux4600.seq import Sequencer
-from lux4600.grayscale import split_image, multiply_image, stitch_images
+from lux4600.grayscale import split_image, multiply_image, stitch_images, blend_overlap
+from lux4600.grayscale import get_content_rows, get_scroll_parameters, scale_scroll_distance
+from lux4600.layout import plan_layout
+from lux4600.coordinator import StartCoordinator, SOFTWARE_SYNC
 from PIL import Image
 import time, sys
+import logging
+
+logging.basicConfig(level=logging.INFO, format="%(message)s") # Upload progress, see lux4600.projector
+
+import argparse
+parser = argparse.ArgumentParser(description="Print the layers of a grayscale image.")
+parser.add_argument("--virtual", action="store_true",
+                    help="Print on simulated axes and a projector simulator (axes.VirtualAxes, lux4600.simulator), no hardware needed")
+args = parser.parse_args()
 
 '''
 Author: David Alexander
@@ -32,7 +44,7 @@ The overall process is as follows:
     3. The strips are then multiplied by 6 to create 6 grayscale images.
         - FACTOR = 6
 
-    4. The grayscale images are stitched together to create a single image.
+    4. The grayscale images are packed into projector memory with lux4600.layout.plan_layout.
     5. The stitched image is then uploaded to the projector.
     6. The sequencer is then created and uploaded to the projector.
     TODO
@@ -43,10 +55,13 @@ The overall process is as follows:
     --> Repeat steps 6 and 7 for some number of layers.
         - LAYERS = 5
 '''
-def preprocess_grayscale_image():
+IMAGE_PATH = r"test\test-dogbone\2880x3240_dogbone_VERT.bmp"
+
+def preprocess_grayscale_image(row_range):
     # Constants
     FULL_WIDTH = 2880 # width of pre-processed grayscale image
-    FULL_HEIGHT = 3240 # height of pre-processed grayscale image
+    top, bottom = row_range
+    FULL_HEIGHT = bottom - top # height of pre-processed grayscale image, cropped to the part
 
     GS_STRIP_WIDTH = 1920 # width of each strip
     # OVERLAP = 960 # overlap between the two strips
@@ -56,8 +71,8 @@ def preprocess_grayscale_image():
 
     FACTOR = 6 # grayscale multiplication factor
 
-    # Step 0: Load the grayscale image
-    full_grayscale_image = Image.open(r"test\test-dogbone\2880x3240_dogbone_VERT.bmp")
+    # Step 0: Load the grayscale image, keeping only the rows occupied by the part
+    full_grayscale_image = Image.open(IMAGE_PATH).crop((0, top, FULL_WIDTH, bottom))
 
     # Step 1: Split the image into strips
     left_strip = Image.new('L', (GS_STRIP_WIDTH, FULL_HEIGHT), 0)  # 'L' mode ensures 8-bit grayscale
@@ -67,70 +82,75 @@ def preprocess_grayscale_image():
     right_strip.paste(full_grayscale_image.crop((GS_STRIP_WIDTH//2, 0, FULL_WIDTH, FULL_HEIGHT)), (0, 0))
 
     # Step 2: Scale the strips over the overlap
-
-    def scale_overlap(strip:Image.Image, side:str) -> Image.Image:
-        for y in range(0, FULL_HEIGHT):
-
-            # Note: this indexing only works because the overlap is 960 pixels wide
-            # and the strips are 1920 pixels wide. If the overlap is changed, this
-            # indexing will need to be changed as well.
-            for x in range(0, OVERLAP):
-                
-                # Linear overlap scaling functions
-                if side == 'L':
-                    func = lambda x, current: int((current / OVERLAP) * (OVERLAP - x))
-                    pixel_x = x + OVERLAP
-                elif side == 'R':
-                    func = lambda x, current: int((current / OVERLAP) * x)
-                    pixel_x = x
-                else:
-                    raise ValueError("Invalid side. Use 'L' or 'R'.")
-
-                pixel_y = y # for clarity
-
-                val = strip.getpixel((pixel_x, pixel_y)) # New grayscale value for left strip
-                
-                if val > 0:
-                    strip.putpixel((pixel_x, pixel_y), func(x, val))
-        return strip
-
-    left_strip = scale_overlap(left_strip, 'L')
-    right_strip = scale_overlap(right_strip, 'R')
+    left_strip = blend_overlap(left_strip, OVERLAP, 'L')
+    right_strip = blend_overlap(right_strip, OVERLAP, 'R')
 
     # Step 3: Multiply the strips by the factor
-    left_strip_images = multiply_image(left_strip, FACTOR)
-    grayscale_strip = Strip(stitch_images(left_strip_images, FULL_HEIGHT * FACTOR * 2), 0)
-
-    right_strip_images = multiply_image(right_strip, FACTOR)
-    right_strip_images = stitch_images(right_strip_images, FULL_HEIGHT * FACTOR)
-
-    # Step 4: Stitch the images together
-    grayscale_strip.image.paste(right_strip_images, (0, FULL_HEIGHT * FACTOR))
-
-    return grayscale_strip
+    # Step 4: Pack the grayscale images of both strips into projector memory.
+    # Each strip gets its own inum (L in inum 0, R in inum 1), so one sequence file
+    # can scroll either strip by changing only its Inum register.
+    return plan_layout({
+        'L': multiply_image(left_strip, FACTOR),
+        'R': multiply_image(right_strip, FACTOR)
+    }, max_inum_rows=FULL_HEIGHT * FACTOR, row_align=6)
 
 # Step 5: Upload the stitched image to the projector
-projector = Projector(IP, DATA_PORT, IMAGE_DATA_PORT)
+if args.virtual:
+    from lux4600.simulator import ProjectorSimulator
+    simulator = ProjectorSimulator().start()
+    projector = Projector("127.0.0.1", simulator.port, simulator.image_data_port)
+else:
+    projector = Projector(IP, DATA_PORT, IMAGE_DATA_PORT)
 
 projector.check_connection()
 
+# Only the rows occupied by the part are uploaded and scrolled
+ROW_RANGE = get_content_rows(Image.open(IMAGE_PATH))
+ROWS = ROW_RANGE[1] - ROW_RANGE[0]
+
 # # Comment this out if image has already been uploaded since 
 # # the projector was last powered on to save time.
-# grayscale_strip = preprocess_grayscale_image()
-# projector.send_strip(grayscale_strip)
-
-# Step 6: Create the sequencer files for left and right strips
-sequencers = [
-        seq.Sequencer(r"test\test-seq\2880x3240_gs6_R.txt", 1440),
-        seq.Sequencer(r"test\test-seq\2880x3240_gs6_L.txt", 1440)
-]
-
-# TODO: Step 7: Start the projector and axes simultaneously for a single layer
+# grayscale_layout = preprocess_grayscale_image(ROW_RANGE)
+# projector.send_layout(grayscale_layout)
+
+# Step 6: Create and upload one sequencer file for both strips.
+# Inum is read from sequencer register 0, so switching strips is a register write.
+# The sequencer waits for a software sync edge before scrolling, so it starts together with the motion.
+sequencer = seq.Sequencer(r"test\test-seq\2880x3240_gs6_R.txt", 1440, get_scroll_parameters(ROWS), registers={"Inum": 0},
+                          start_trigger=seq.TRIG_SOURCES["software"])
+projector.send_sequencer(sequencer)
+
+STRIP_INUMS = {'L': 0, 'R': 1} # see preprocess_grayscale_image
+
+# The rec_ids of the register records are unverified (see records.SetSequencerRegister).
+# If the register does not read back, fall back to one sequence file per strip with its Inum,
+# uploaded before each pass.
+try:
+    projector.set_sequencer_registers(sequencer.register_values({"Inum": STRIP_INUMS['L']}))
+    strip_sequencers = None
+except ProjectorError as e:
+    logging.warning(f"Sequencer registers unavailable, uploading a sequence file per strip: {e}")
+    strip_sequencers = {strip: seq.Sequencer(r"test\test-seq\2880x3240_gs6_R.txt", 1440, {**get_scroll_parameters(ROWS), "Inum": inum},
+                                             start_trigger=seq.TRIG_SOURCES["software"])
+                        for strip, inum in STRIP_INUMS.items()}
+
+def prepare_strip(strip):
+    '''Get the sequencer ready to scroll a strip, see StartCoordinator.prepare.'''
+    if strip_sequencers is None:
+        coordinator.prepare(registers=sequencer.register_values({"Inum": STRIP_INUMS[strip]}))
+    else:
+        coordinator.prepare(sequencer=strip_sequencers[strip])
+
+# Step 7: Start the projector and axes simultaneously for each pass, see lux4600.coordinator
 import axes
 from zaber_motion import Units, wait_all
 
-input("Press Enter to start the projector and axes...")
-zaber_axes = axes.ZaberAxes("COM3")
+if args.virtual:
+    zaber_axes = axes.VirtualAxes() # Moves take no time, zaber_axes.clock.now() is the simulated time
+else:
+    input("Press Enter to start the projector and axes...")
+    zaber_axes = axes.ZaberAxes("COM3")
+coordinator = StartCoordinator(projector, zaber_axes, SOFTWARE_SYNC)
 # zaber_axes.home()
 
 Z_START = 150 # mm, initial z position
@@ -153,7 +173,7 @@ projector.send(records.SetLedDriverAmplitude(0, 1500).bytes())
 # TODO: verify with celestron handheld microscope from the natural resources library
 #
 SCROLLING_VELOCITY = 1.8 # mm/s
-SCROLLING_DIST = 23.2 # mm
+SCROLLING_DIST = scale_scroll_distance(23.2, 3240, ROWS) # mm, calibrated as 23.2 mm for the full 3240 rows
 LATERAL_INCREMENT = 10 # mm
 #
 for i in range(LAYERS):
@@ -162,22 +182,24 @@ for i in range(LAYERS):
 
     zaber_axes.XAxis.move_absolute(X_START, Units.LENGTH_MILLIMETRES)
 
-    projector.send_sequencer(sequencers[0])  # Alternate between left and right sequencers
-    projector.start_sequencer()
+    prepare_strip('L')  # Alternate between left and right strips
 
-    zaber_axes.scroll(SCROLLING_DIST, SCROLLING_VELOCITY)
+    coordinator.scroll(SCROLLING_DIST, SCROLLING_VELOCITY) # Starts the sequencer with the move
     zaber_axes.scroll(-SCROLLING_DIST, SCROLLING_VELOCITY)
 
     projector.stop_sequencer()
     zaber_axes.increment_lateral(LATERAL_INCREMENT)
-    projector.send_sequencer(sequencers[1])
-    projector.start_sequencer()
+    prepare_strip('R')
 
-    zaber_axes.scroll(SCROLLING_DIST, SCROLLING_VELOCITY)
+    coordinator.scroll(SCROLLING_DIST, SCROLLING_VELOCITY)
     zaber_axes.scroll(-SCROLLING_DIST, SCROLLING_VELOCITY)
     projector.stop_sequencer()
 
     zaber_axes.increment_layer(LAYER_HEIGHT)
 
 zaber_axes.ZAxis.move_absolute(30, Units.LENGTH_MILLIMETRES)
-projector.send(records.SetLedDriverAmplitude(0, 100).bytes()) # Set LED amplitude back to 100
\ No newline at end of file
+projector.send(records.SetLedDriverAmplitude(0, 100).bytes()) # Set LED amplitude back to 100
+
+if args.virtual:
+    logging.info(f"Simulated motion time: {zaber_axes.clock.now():.1f} s")
+    simulator.close()
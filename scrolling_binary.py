@@ -3,6 +3,9 @@ from lux4600.projector import Projector
 from lux4600.records import *
 from lux4600.img import Strip
 from PIL import Image
+import logging
+
+logging.basicConfig(level=logging.INFO, format="%(message)s") # Upload progress, see lux4600.projector
 
 # Load the scrolling binary (1080x1920) image.
 img = Image.open(r"test\test-binary\1920x20000_binary_scroll.bmp")
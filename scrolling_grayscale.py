@@ -4,6 +4,9 @@ from lux4600.records import *
 from lux4600.img import Strip
 from PIL import Image
 import time
+import logging
+
+logging.basicConfig(level=logging.INFO, format="%(message)s") # Upload progress, see lux4600.projector
 
 # Load the stitched (1-bit) image.
 # --
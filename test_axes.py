@@ -0,0 +1,121 @@
+"""
+Tests for the layer path planning and the mock and virtual axes.
+"""
+
+import time
+import pytest
+from PIL import Image
+from axes import serpentine_path, MockAxes, Kinematics, VirtualAxes, TRAVEL_VELOCITY
+from lux4600.img import Strip
+from lux4600.projector import Projector
+from lux4600.simulator import ProjectorSimulator
+
+
+def test_serpentine_path():
+    path = serpentine_path(23.2, 1.8, 10, strips=2, return_velocity=5)
+
+    assert path == [(0, 23.2, 1.8), (0, -23.2, 5), (10, 0, None), (0, 23.2, 1.8), (0, -23.2, 5), (-10, 0, None)]
+    assert serpentine_path(5, 1, 10, strips=1) == [(0, 5, 1), (0, -5, 1)]
+
+
+def test_streamed_layer_is_one_command():
+    blocking, streamed = MockAxes(positions={"X": 60, "Y": 50}), MockAxes(positions={"X": 60, "Y": 50})
+
+    # The print loop of working_file.py, one blocking move per segment
+    for distance in (23.2, -23.2):
+        blocking.scroll(distance, 1.8)
+    blocking.increment_lateral(10)
+    for distance in (23.2, -23.2):
+        blocking.scroll(distance, 1.8)
+    blocking.increment_lateral(-10)
+
+    streamed.stream_path(serpentine_path(23.2, 1.8, 10))
+
+    assert streamed.getPositions() == blocking.getPositions()
+    assert streamed.get_position("X") == 60 and abs(streamed.get_position("Y") - 50) < 1e-9
+    assert len(streamed.commands) == 1 and len(blocking.commands) == 6
+
+
+def test_trapezoidal_profile():
+    kinematics = Kinematics(10, 100)
+
+    # Reaches 10 mm/s in 0.1 s over 0.5 mm, cruises 9 mm, decelerates
+    assert kinematics.duration(10) == pytest.approx(1.1)
+    assert kinematics.duration(-10, 5) == pytest.approx(2.05)
+    assert kinematics.travelled(10, None, 0.1) == pytest.approx(0.5)
+    assert kinematics.travelled(10, None, 0.6) == pytest.approx(5.5)
+    assert kinematics.travelled(10, None, 2) == 10
+
+    # Too short to reach the velocity: triangular
+    assert kinematics.duration(0.25) == pytest.approx(0.1)
+
+    assert Kinematics.lockstep(Kinematics(40, 200), Kinematics(30, 300)).__dict__ == {"max_velocity": 30, "acceleration": 200}
+
+
+def test_virtual_layer_timing():
+    axes = VirtualAxes(positions={"X": 60, "Y": 50, "Z": 150}, kinematics={"Y": Kinematics(40, 200)})
+    start = time.perf_counter()
+
+    axes.scroll(23.2, 1.8)
+    axes.scroll(-23.2, 1.8)
+    axes.increment_layer(0.4)
+
+    scroll = 23.2 / 1.8 + 1.8 / 200
+    assert axes.clock.now() == pytest.approx(2 * scroll + 0.4 / 0.5 + 0.5 / 50, abs=0.01)
+    assert time.perf_counter() - start < 0.1
+    assert axes.getPositions() == pytest.approx({"X": 60, "Y": 50, "Z": 149.6, "M": 0})
+
+    # Positions follow the profile while a move runs
+    axes.scroll(23.2, 1.8, wait=False)
+    axes.clock.wait_until(axes.clock.now() + 5)
+    assert axes.get_position("Y") == pytest.approx(50 + 1.8 * 5, abs=0.05)
+    axes.wait_scroll()
+    assert axes.get_position("Y") == pytest.approx(73.2)
+
+
+def test_virtual_stream_path_matches_moves():
+    path = serpentine_path(23.2, 1.8, 10)
+    blocking, streamed = VirtualAxes(), VirtualAxes()
+
+    for x, y, velocity in path:
+        if x:
+            blocking.XAxis.move_relative(x, velocity=TRAVEL_VELOCITY)
+        else:
+            blocking.scroll(y, velocity)
+
+    streamed.stream_path(path)
+
+    assert streamed.getPositions() == pytest.approx(blocking.getPositions())
+    assert streamed.clock.now() == pytest.approx(blocking.clock.now(), abs=0.01)
+
+
+def test_virtual_axes_accelerated():
+    axes = VirtualAxes(speed=20)
+    start = time.perf_counter()
+
+    axes.ZAxis.move_absolute(1, velocity=1) # 1 s simulated
+
+    assert 0.04 < time.perf_counter() - start < 0.5
+    assert axes.clock.now() == pytest.approx(1.02, abs=0.02)
+
+
+def test_virtual_print_with_projector_simulator():
+    with ProjectorSimulator() as simulator:
+        projector = Projector('127.0.0.1', simulator.port, simulator.image_data_port)
+        axes = VirtualAxes(positions={"X": 60, "Y": 50, "Z": 150})
+        strip = Strip(Image.new('1', (1920, 1080)), 0)
+
+        for _ in range(2):
+            upload = time.perf_counter()
+            projector.send_strip(strip)
+            upload = time.perf_counter() - upload
+
+            before = axes.clock.now()
+            axes.stream_path(serpentine_path(23.2, 1.8, 10))
+            axes.increment_layer(0.4)
+            assert axes.clock.now() - before > 4 * 23.2 / 1.8 # The motion dominates the predicted layer time
+
+        projector.client_socket.close()
+
+    assert axes.clock.now() > 2 * 4 * 23.2 / 1.8 + upload
+    assert axes.get_position("Z") == pytest.approx(149.2)
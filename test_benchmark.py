@@ -0,0 +1,19 @@
+"""
+Tests for the benchmark runner and the baseline comparison.
+"""
+
+from benchmark import run, compare
+
+
+def test_run_small_sizes():
+    results = run(rows=(12,), factors=(4,), repeat=1, select="/12")
+
+    assert set(results) == {"blend_overlap/12", "encode_rle_image_type5/12", "multiply_stitch/12x4", "strip_to_packets/12x4"}
+    assert all(result["best"] > 0 and result["runs"] == 1 for result in results.values())
+
+
+def test_compare_flags_regressions():
+    baseline = {"fast": {"best": 1.0}, "slow": {"best": 1.0}}
+    results = {"fast": {"best": 0.5}, "slow": {"best": 1.5}, "new": {"best": 1.0}}
+
+    assert compare(results, baseline, tolerance=0.1) == ["slow"]
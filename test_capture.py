@@ -0,0 +1,68 @@
+"""
+Tests for session capture and replay against the projector simulator.
+"""
+
+import pytest
+from PIL import Image, ImageDraw
+from lux4600 import records
+from lux4600.img import Strip
+from lux4600.projector import Projector
+from lux4600.simulator import ProjectorSimulator
+from lux4600.capture import read, summary, replay, CaptureError, CONTROL, IMAGE_DATA, REPLY
+
+
+def session(path):
+    '''Capture a connection check and a strip upload to a fresh simulator. Returns the image uploaded.'''
+
+    image = Image.new('1', (1920, 120))
+    ImageDraw.Draw(image).rectangle((100, 10, 900, 100), fill=1)
+
+    with ProjectorSimulator() as simulator:
+        projector = Projector('127.0.0.1', simulator.port, simulator.image_data_port, capture=path)
+        projector.check_connection()
+        projector.send_strip(Strip(image, 0), lines_per_packet=6)
+        projector.stop_capture()
+        projector.send_record(records.RequestInumSize()) # Not captured
+        projector.client_socket.close()
+
+    return image
+
+
+def test_capture(tmp_path):
+    path = tmp_path / "session.cap"
+    session(path)
+
+    entries = list(read(path))
+    kinds = [kind for _, kind, _ in entries]
+    times = [t for t, _, _ in entries]
+
+    assert kinds.count(IMAGE_DATA) == 20
+    assert kinds.count(CONTROL) == kinds.count(REPLY)
+    assert times == sorted(times)
+
+    info = summary(path)
+    assert info["kinds"]["image_data"] == 20
+    assert info["records"]["RequestSeqNoError"] == 1
+
+    # A log cut short ends at the last complete entry
+    data = path.read_bytes()
+    path.write_bytes(data[:-3])
+    assert len(list(read(path))) == len(entries) - 1
+
+
+def test_replay(tmp_path):
+    path = tmp_path / "session.cap"
+    image = session(path)
+
+    with ProjectorSimulator() as simulator:
+        result = replay(path, '127.0.0.1', simulator.port, simulator.image_data_port, speed=0)
+        assert simulator.image(0, 120).tobytes() == image.tobytes()
+
+    assert result["replies"] == result["expected"]
+    assert result["mismatches"] == []
+
+
+def test_not_a_capture(tmp_path):
+    (tmp_path / "other").write_bytes(b"hello")
+    with pytest.raises(CaptureError):
+        list(read(tmp_path / "other"))
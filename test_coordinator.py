@@ -0,0 +1,110 @@
+"""
+Tests for the synchronous start of the sequencer and the motion, against the projector simulator.
+"""
+
+import glob
+import time
+import pytest
+from lux4600.projector import Projector
+from lux4600.seq import Sequencer, TRIG_SOURCES, SequencerValueError, add_start_trigger
+from lux4600.metrics import Registry
+from lux4600.coordinator import StartCoordinator, CoordinatorValueError, SOFTWARE, SOFTWARE_SYNC, HARDWARE
+
+SEQUENCE_FILE = r"test/test-seq/2880x3240_gs6_L.txt"
+
+
+class Axes:
+    '''Axes recording the moves started, with a short move duration.'''
+
+    def __init__(self):
+        self.moves = []
+        self.armed = False
+
+    def scroll(self, distance, velocity, wait=True):
+        self.moves.append((time.perf_counter(), distance, velocity, wait))
+
+    def wait_scroll(self):
+        time.sleep(0.01)
+
+    def arm_start_trigger(self):
+        self.armed = True
+
+    def disarm_start_trigger(self):
+        self.armed = False
+
+
+@pytest.fixture
+def projector(simulator):
+    projector = Projector('127.0.0.1', simulator.port, simulator.image_data_port)
+    yield projector
+    projector.client_socket.close()
+
+
+def test_start_trigger_inserted_once():
+    text = add_start_trigger(open(SEQUENCE_FILE, "rb").read(), TRIG_SOURCES["software"]).decode()
+    lines = [line.split() for line in text.splitlines() if line.strip() and not line.startswith("#")]
+    first = next(i for i, line in enumerate(lines) if line[0] == "Trig")
+
+    assert lines[first][:3] == ["Trig", "0", "8"]
+    assert lines[first + 1][0] == "Label" # Before the loop labels, so the loops skip it
+
+    with pytest.raises(SequencerValueError):
+        add_start_trigger(b"AssignVar Zero 0 1\n", 8)
+
+
+@pytest.mark.parametrize("path", sorted(glob.glob("test/test-seq/*")))
+def test_start_trigger_never_jumped_back_to(path):
+    text = add_start_trigger(open(path, "rb").read(), TRIG_SOURCES["software"]).decode()
+    lines = [line.split() for line in text.splitlines() if line.strip() and not line.lstrip().startswith("#")]
+    start = next(i for i, line in enumerate(lines) if line[0] == "Trig")
+
+    labels = {line[1]: i for i, line in enumerate(lines) if line[0] == "Label"}
+    targets = [line[1] for line in lines if line[0] == "Jump"] + [line[4] for line in lines if line[0] == "JumpIf"]
+
+    assert lines[start][:3] == ["Trig", "0", "8"]
+    assert all(labels[label] > start for label in targets) # Waits for the start trigger only once
+
+
+def test_software_sync_start(simulator, projector):
+    axes = Axes()
+    metrics = Registry()
+    coordinator = StartCoordinator(projector, axes, SOFTWARE_SYNC, metrics=metrics)
+
+    coordinator.prepare(Sequencer(SEQUENCE_FILE, start_trigger=TRIG_SOURCES["software"]), registers={0: 1})
+    assert simulator.running and simulator.software_sync == 0 and simulator.registers[0] == 1
+
+    timing = coordinator.scroll(23.2, 1.8)
+
+    assert simulator.software_sync == 1
+    assert axes.moves[0][1:] == (23.2, 1.8, False)
+    assert 0 <= timing.skew < 0.05 and timing.uncertainty >= 0
+    assert metrics.histogram("start_skew_seconds", mode=SOFTWARE_SYNC).count == 1
+
+    with pytest.raises(CoordinatorValueError):
+        coordinator.fire(23.2, 1.8) # Not prepared again
+
+
+def test_software_start_sequencer_first(simulator, projector):
+    axes = Axes()
+    coordinator = StartCoordinator(projector, axes, SOFTWARE, delay=-0.005)
+
+    coordinator.prepare(Sequencer(SEQUENCE_FILE))
+    assert not simulator.running
+
+    timing = coordinator.scroll(10, 1)
+    assert simulator.running
+    assert timing.skew < -0.004
+
+
+def test_hardware_start(simulator, projector):
+    axes = Axes()
+    coordinator = StartCoordinator(projector, axes, HARDWARE)
+
+    with pytest.raises(CoordinatorValueError):
+        coordinator.prepare(Sequencer(SEQUENCE_FILE)) # No start trigger
+
+    coordinator.prepare(Sequencer(SEQUENCE_FILE, start_trigger=TRIG_SOURCES["electrical"]))
+    assert axes.armed
+
+    timing = coordinator.scroll(10, 1)
+    assert timing.skew is None and not axes.armed
@@ -0,0 +1,46 @@
+"""
+Tests for the exposure dose simulator.
+"""
+
+import numpy as np
+from PIL import Image
+from lux4600.img import Strip
+from lux4600.seq import scroll_program, static_program
+from lux4600.dose import simulate_dose, accumulate
+
+
+def test_accumulate_difference_array():
+    memory = np.ones((10, 2), dtype=np.float32)
+    shift, start, rows, weight = (np.array(a) for a in ([0, 0, 3], [0, 2, 0], [4, 4, 2], [1.0, 1.0, 0.5]))
+
+    dose = accumulate(memory, shift, start, rows, weight)
+
+    assert dose.origin == 0
+    assert dose.dose[:, 0].tolist() == [1, 1, 2, 2.5, 1.5, 1]
+
+
+def test_synchronized_scroll_is_uniform():
+    strip = Strip(Image.new('1', (64, 3240), 1), 0)
+
+    # One scroll row per trigger, stage moving one row per trigger
+    dose = simulate_dose(strip, scroll_program(3240, direction="forward"), 10000.0, frequency=10000, frames=2161)
+
+    assert dose.dose.shape == (3240, 64)
+    assert np.all(dose.dose[1080:2160] == 1080)
+
+
+def test_grayscale_levels():
+    image = Image.new('1', (64, 4 * 3240), 0)
+    for plane in range(4):
+        image.paste(1, (0, plane * 3240, 16 * (plane + 1), (plane + 1) * 3240))
+
+    dose = simulate_dose(Strip(image, 0), scroll_program(3240, factor=4, direction="forward"), 2500.0,
+                         frequency=10000, frames=4 * 2161, mirror=True)
+
+    assert dose.dose[2000, ::16].tolist() == [1080, 2160, 3240, 4320]
+
+
+def test_static_image_smears():
+    dose = simulate_dose(Image.new('1', (8, 1080), 1), static_program(), 3000.0, frequency=10000, frames=2000)
+
+    assert abs(dose.dose.shape[0] - (1080 + 600)) <= 1 # 600 rows travelled in 0.2 s
@@ -0,0 +1,62 @@
+"""
+Tests for the grayscale preprocessing helpers (cropping, buffering and scroll parameters).
+"""
+
+from PIL import Image
+from lux4600.grayscale import (add_buffer, get_content_bbox, get_content_rows, crop_to_content,
+                               get_scroll_parameters, scale_scroll_distance, blend_overlap)
+
+
+def make_part(width=2880, height=3240, box=(100, 500, 1100, 2000)):
+    """Create a black image with a white rectangle (the part) inside box."""
+    img = Image.new('L', (width, height), 0)
+    img.paste(255, box)
+    return img
+
+
+def test_content_bbox():
+    assert get_content_bbox(make_part()) == (100, 500, 1100, 2000)
+    assert get_content_bbox(Image.new('L', (64, 64), 0)) is None
+
+
+def test_content_rows_min_rows():
+    # Part shorter than the DMD height is grown to 1080 rows
+    assert get_content_rows(make_part(box=(0, 100, 10, 200))) == (100, 1180)
+    # ...and shifted up at the bottom edge of the image
+    assert get_content_rows(make_part(box=(0, 3000, 10, 3100))) == (2160, 3240)
+
+
+def test_crop_to_content():
+    cropped, box = crop_to_content(make_part())
+    assert box == (100, 500, 1100, 2000)
+    assert cropped.size == (1000, 1500)
+
+    # A 1000 pixel wide part fits in a single 1920 strip
+    assert add_buffer(cropped, 1920).size == (1920, 1500)
+
+
+def test_add_buffer_exact_multiple():
+    assert add_buffer(Image.new('L', (3840, 10)), 1920).size == (3840, 10)
+
+
+def test_scroll_parameters():
+    assert get_scroll_parameters(1500) == {"TotalRows": 1500, "MemStartRow": 0}
+    assert scale_scroll_distance(23.2, 3240, 3240) == 23.2
+    assert abs(scale_scroll_distance(23.2, 3240, 2160) - 11.6) < 1e-9
+
+
+def test_blend_overlap_matches_pixel_loop():
+    overlap = 96
+    strip = Image.frombytes('L', (192, 4), bytes(range(256)) * 3)
+
+    left = blend_overlap(strip, overlap, 'L')
+    right = blend_overlap(strip, overlap, 'R')
+
+    for y in range(4):
+        for x in range(overlap):
+            assert left.getpixel((x + overlap, y)) == int((strip.getpixel((x + overlap, y)) / overlap) * (overlap - x))
+            assert right.getpixel((x, y)) == int((strip.getpixel((x, y)) / overlap) * x)
+
+    # Columns outside the overlap are untouched
+    assert left.crop((0, 0, overlap, 4)).tobytes() == strip.crop((0, 0, overlap, 4)).tobytes()
+    assert right.crop((overlap, 0, 192, 4)).tobytes() == strip.crop((overlap, 0, 192, 4)).tobytes()
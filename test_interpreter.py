@@ -0,0 +1,47 @@
+"""
+Tests for the offline sequencer interpreter.
+"""
+
+import pytest
+from lux4600.seq import static_program, scroll_program
+from lux4600.interpreter import simulate, scroll_velocity, InterpreterValueError
+
+
+def test_free_running_frame_timing():
+    result = simulate(static_program(), frames=10)
+
+    assert result.frame_ticks() == (223, 223)
+    assert result.rows_loaded == 10 * 1080
+    assert result.violations == []
+
+
+def test_missed_triggers():
+    assert simulate(static_program(), frequency=10000, frames=10).missed_triggers == 0
+
+    # 200 ticks per trigger is shorter than the 223 ticks the program needs
+    result = simulate(static_program(), frequency=20000, frames=10)
+    assert result.missed_triggers == 9
+    assert result.frame_ticks() == (400, 400)
+
+
+def test_scroll_rate():
+    result = simulate(scroll_program(3240, factor=6, direction="forward"), frequency=10000, frames=6 * 100)
+
+    assert result.scroll_rows == 99
+    assert result.frame_rate == pytest.approx(10000, rel=1e-2)
+    assert scroll_velocity(result, 23.2, 3240) == pytest.approx(99 / 0.06 * 23.2 / 2160, rel=1e-2)
+
+
+def test_violations():
+    with open("test/test-seq/1bit-static.txt") as file:
+        result = simulate(file.read(), frequency=5000, frames=3)
+
+    # ResetGlobal 40 leaves too little settling time before the next LoadRow
+    assert len(result.violations) == 3
+    assert "settled" in result.violations[0].message
+
+    result = simulate("AssignVar A 32767 1\nLabel loop 1\nTrig 0 4 0\nAdd A 1 1\nJump loop 1\n", frames=2)
+    assert "overflows" in result.violations[0].message
+
+    with pytest.raises(InterpreterValueError):
+        simulate("Label loop 1\nTrig 0 4 0\nAdd B 1 1\nJump loop 1\n", frames=2)
@@ -0,0 +1,51 @@
+"""
+Tests for the stitched-inum layout planner.
+"""
+
+import pytest
+from PIL import Image
+from lux4600.layout import plan_layout, LayoutValueError
+
+
+def planes(rows, factor, width=1920):
+    return [Image.new('L', (width, rows), 255 * (i % 2)) for i in range(factor)]
+
+
+def test_two_strips_one_inum():
+    # The reduced area printing layout: L at row 0, R at FULL_HEIGHT * FACTOR
+    layout = plan_layout({'L': planes(3240, 6), 'R': planes(3240, 6)})
+
+    assert layout.inum_size == 3240 * 6 * 2
+    assert layout.inums == [0]
+    assert layout.manifest[('L', 0)] == (0, 0)
+    assert layout.manifest[('L', 5)] == (0, 3240 * 5)
+    assert layout.manifest[('R', 0)] == (0, 3240 * 6)
+    assert layout.variables('R') == {"Inum": 0, "MemStartRow": 19440, "TotalRows": 3240, "Factor": 6}
+
+
+def test_packing_over_inum_limit():
+    layout = plan_layout({'A': planes(4320, 10), 'B': planes(4320, 10), 'C': planes(1080, 4)}, base_inum=2)
+
+    # A and B do not fit together in 65535 rows, C is packed behind one of them
+    assert layout.inums == [2, 3]
+    assert layout.inum_size == 4320 * 10 + 1080 * 4
+    assert layout['C', 0].inum == 2
+    assert layout['C', 0].row_offset == 43200
+
+
+def test_to_strips():
+    layout = plan_layout({'A': planes(1080, 2, width=64)}, row_align=6)
+    strips = list(layout.to_strips())
+
+    assert len(strips) == 1
+    assert strips[0].image.size == (64, 2160)
+    assert strips[0].image.getpixel((0, 0)) == 0
+    assert strips[0].image.getpixel((0, 1080)) == 255
+
+
+def test_invalid_layouts():
+    with pytest.raises(LayoutValueError):
+        plan_layout({'A': planes(100, 1, width=64), 'B': planes(100, 1, width=128)})
+
+    with pytest.raises(LayoutValueError):
+        plan_layout({'A': planes(20000, 4)})
@@ -0,0 +1,61 @@
+"""
+Tests for the projector image-memory manager.
+"""
+
+import pytest
+from PIL import Image
+from lux4600.memory import ImageMemory, MemoryValueError
+
+
+def image(rows, value=255):
+    return Image.new('L', (64, rows), value)
+
+
+def test_resident_images_are_not_reuploaded():
+    memory = ImageMemory(capacity_rows=4 * 1080, inum_size=1080)
+
+    residency, upload = memory.ensure("grid", image(1080))
+    assert upload and residency.inum == 0
+
+    residency, upload = memory.ensure("grid", image(1080))
+    assert not upload and residency.inum == 0
+
+    # Changed content under the same name is uploaded again
+    residency, upload = memory.ensure("grid", image(1080, 0))
+    assert upload
+
+
+def test_lru_eviction():
+    memory = ImageMemory(capacity_rows=3 * 1080, inum_size=1080)
+
+    for name in ("a", "b", "c"):
+        memory.ensure(name, image(1080))
+
+    memory.ensure("a", image(1080)) # "b" is now the least recently used
+    residency, upload = memory.ensure("d", image(1080))
+
+    assert upload
+    assert residency.inum == 1
+    assert list(memory.residents) == ["c", "a", "d"]
+    assert memory.free_inums == 0
+
+
+def test_spanning_images():
+    memory = ImageMemory(capacity_rows=3 * 1080, inum_size=1080)
+
+    memory.ensure("a", image(1080))
+    residency, _ = memory.ensure("tall", image(2 * 1080 + 1))
+
+    # Three consecutive inums, evicting "a" to make room
+    assert (residency.inum, residency.num_inums) == (0, 3)
+    assert list(memory.residents) == ["tall"]
+
+
+def test_invalid_sizes():
+    memory = ImageMemory(capacity_rows=2 * 1080, inum_size=1080)
+
+    with pytest.raises(MemoryValueError):
+        memory.ensure("tall", image(2 * 1080 + 1))
+
+    with pytest.raises(MemoryValueError):
+        ImageMemory(capacity_rows=100000, inum_size=70000)
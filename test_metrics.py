@@ -0,0 +1,80 @@
+"""
+Tests for the latency metrics.
+"""
+
+import json
+import math
+from lux4600.metrics import Histogram, Registry, shared_default
+
+
+def test_histogram():
+    histogram = Histogram("test")
+    assert math.isnan(histogram.quantile(0.5))
+
+    for value in [0.001] * 99 + [0.5]:
+        histogram.observe(value)
+
+    assert histogram.count == 100
+    assert 0.001 <= histogram.quantile(0.5) < 0.002
+    assert histogram.quantile(1.0) == 0.5
+    assert histogram.max == 0.5
+    assert abs(histogram.mean - (0.099 + 0.5) / 100) < 1e-12
+
+
+def test_registry():
+    registry = Registry()
+    assert registry.histogram("a") is registry.histogram("a")
+    registry.histogram("a").observe(0.01)
+    assert registry.report().startswith("a: n=1")
+
+
+def test_labels():
+    registry = Registry()
+    registry.counter("packets_sent_total", port="image").inc(10)
+    registry.counter("packets_sent_total", port="image").inc(5)
+    registry.counter("packets_sent_total", port="control").inc()
+
+    assert registry.counter("packets_sent_total", port="image").value == 15
+    assert registry.counter("packets_sent_total", port="control").value == 1
+
+
+def test_timer():
+    registry = Registry()
+
+    @registry.timed("square")
+    def square(x):
+        return x * x
+
+    assert square(3) == 9
+    with registry.timer("square"):
+        pass
+    assert registry.histogram("stage_seconds", stage="square").count == 2
+
+
+def test_export(tmp_path):
+    registry = Registry()
+    registry.gauge("upload_megabytes_per_second").set(12.5)
+    registry.histogram("control_rtt_seconds", record="SetInumSize").observe(0.002)
+
+    text = registry.prometheus()
+    assert "# TYPE lux4600_upload_megabytes_per_second gauge" in text
+    assert "lux4600_upload_megabytes_per_second 12.5" in text
+    assert 'lux4600_control_rtt_seconds_bucket{record="SetInumSize",le="+Inf"} 1' in text
+    assert 'lux4600_control_rtt_seconds_count{record="SetInumSize"} 1' in text
+
+    registry.write_prometheus(str(tmp_path / "metrics.prom"))
+    assert (tmp_path / "metrics.prom").read_text() == text
+
+    registry.write_json_lines(str(tmp_path / "metrics.jsonl"))
+    registry.write_json_lines(str(tmp_path / "metrics.jsonl"))
+    lines = [json.loads(line) for line in (tmp_path / "metrics.jsonl").read_text().splitlines()]
+    assert len(lines) == 4
+    assert lines[0]["value"] == 12.5 and lines[1]["labels"] == {"record": "SetInumSize"}
+
+
+def test_default_registry_shared_by_both_module_names():
+    import metrics, tracing, lux4600.metrics, lux4600.tracing
+
+    assert metrics.REGISTRY is lux4600.metrics.REGISTRY
+    assert tracing.TRACER is lux4600.tracing.TRACER
+    assert shared_default("lux4600.metrics", "REGISTRY", Registry) is metrics.REGISTRY
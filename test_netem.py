@@ -0,0 +1,66 @@
+"""
+Tests for the network impairment relay.
+"""
+
+import random
+import pytest
+from PIL import Image
+from lux4600 import records
+from lux4600.img import Strip
+from lux4600.netem import Impairment, Link, Relay, PRESETS
+from lux4600.projector import Projector
+
+
+def schedule(impairment, seed, count=1000):
+    link = Link("test", impairment, random.Random(seed))
+    return [link.schedule(1000, i * 1e-3) for i in range(count)], link.stats
+
+
+def test_schedule_is_reproducible():
+    impairment = Impairment.preset("congested")
+    assert schedule(impairment, 1) == schedule(impairment, 1)
+    assert schedule(impairment, 1) != schedule(impairment, 2)
+
+
+def test_impairments():
+    times, stats = schedule(Impairment(loss=0.1, duplicate=0.1), 0)
+    assert 50 < stats["dropped"] < 150
+    assert stats["duplicated"] == sum(len(t) == 2 for t in times)
+
+    # 1000 bytes every 1 ms through a 500 kB/s link: the queue grows by 1 ms per datagram until it is full
+    times, stats = schedule(Impairment(bandwidth=500e3, queue=0.1), 0, count=200)
+    assert times[1][0] - times[0][0] == pytest.approx(0.002)
+    assert stats["queue_dropped"] > 0
+
+    times, stats = schedule(Impairment(latency=0.01, reorder=1.0, reorder_delay=0.005), 0, count=1)
+    assert times == [[0.015]]
+
+
+def test_presets():
+    for name in PRESETS:
+        Impairment.preset(name)
+    assert Impairment.preset("lossy", loss=0.5).loss == 0.5
+
+
+def test_retries_through_lossy_relay(simulator):
+    with Relay("127.0.0.1", simulator.port, simulator.image_data_port, Impairment(loss=0.3), seed=3) as relay:
+        projector = Projector("127.0.0.1", relay.port, relay.image_data_port, timeout=0.02, retries=8)
+
+        for size in range(1000, 1020):
+            projector.send_record(records.SetInumSize(size))
+            assert simulator.inum_size == size
+
+        assert relay.stats()["control"]["dropped"] + relay.stats()["reply"]["dropped"] > 0
+        projector.client_socket.close()
+
+
+def test_image_data_loss_is_detected(simulator):
+    with Relay("127.0.0.1", simulator.port, simulator.image_data_port, "clean",
+               image_data_impairment=Impairment(loss=0.2), seed=1) as relay:
+        projector = Projector("127.0.0.1", relay.port, relay.image_data_port)
+
+        with pytest.raises(RuntimeError):
+            projector.send_strip(Strip(Image.new('1', (1920, 120)), 0), lines_per_packet=6)
+
+        assert relay.stats()["image_data"]["dropped"] > 0
+        projector.client_socket.close()
@@ -0,0 +1,181 @@
+"""
+Tests for the projector control channel against a local UDP responder.
+"""
+
+import socket
+import threading
+import time
+import pytest
+from lux4600 import records
+from lux4600.projector import Projector, BARRIER, ProjectorTimeout, ProjectorReplyError
+from lux4600.metrics import Registry
+
+ACK_OK = b'\x00\x06\x01\xf5\x00\x00'
+
+
+class Responder:
+    '''Acknowledges every record on a local UDP port, answers RequestInumSize with 1080.'''
+
+    def __init__(self, drop=(), errors=None):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(('127.0.0.1', 0))
+        self.port = self.socket.getsockname()[1]
+        self.received = []
+        self.drop = set(drop) # indices of records left unanswered
+        self.errors = errors or {} # indices of records answered with an error code
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            try:
+                data, address = self.socket.recvfrom(65536)
+            except OSError:
+                return
+            self.received.append(data)
+            index = len(self.received) - 1
+            if index in self.drop:
+                continue
+            if index in self.errors:
+                self.socket.sendto(b'\x00\x06\x01\xf5' + self.errors[index].to_bytes(2, 'big'), address)
+                continue
+            if data == records.RequestInumSize().bytes():
+                self.socket.sendto(b'\x00\x06\x01\xf6\x04\x38', address)
+            else:
+                self.socket.sendto(ACK_OK, address)
+
+    def close(self):
+        self.socket.close()
+
+
+@pytest.fixture
+def responder():
+    responder = Responder()
+    yield responder
+    responder.close()
+
+
+def test_batch_replies_in_order(responder):
+    projector = Projector('127.0.0.1', responder.port, responder.port, timeout=1)
+
+    replies = projector.send_batch([
+        records.SetSequencerState(1, False),
+        records.RequestInumSize(),
+        BARRIER,
+        b'\x00\x06\x00\x6e\x00\x01',
+        records.SetSequencerState(1, False), # already in effect
+    ], window=2)
+
+    assert replies == [("OK", -1), ("Inum size: 1080", 1080), ACK_OK, ("Already in effect", -1)]
+    assert len(responder.received) == 3
+    projector.client_socket.close()
+
+
+def test_projector_elides_setters(responder):
+    projector = Projector('127.0.0.1', responder.port, responder.port, timeout=1)
+
+    projector.set_led_amplitude(1500)
+    assert projector.set_led_amplitude(1500) == ("Already in effect", -1)
+    projector.start_sequencer()
+    projector.start_sequencer()
+    projector.set_led_amplitude(100)
+
+    assert len(responder.received) == 4
+
+    # Actions are never elided, an upload cut short must not leave the sequence numbers unreset
+    projector.send_batch([records.ResetSeqNo()])
+    projector.send_batch([records.ResetSeqNo()])
+
+    assert len(responder.received) == 6
+    projector.client_socket.close()
+
+
+def test_batch_resends_after_lost_reply():
+    responder = Responder(drop={1})
+    projector = Projector('127.0.0.1', responder.port, responder.port, timeout=0.05, metrics=Registry())
+
+    replies = projector.send_batch([records.SetInumSize(1080), records.SetImageType(4)])
+
+    # Both idempotent records are sent again, the replies can not be told apart after a loss
+    assert replies == [("OK", -1), ("OK", -1)]
+    assert len(responder.received) == 4
+    assert not projector.stale
+    assert projector.unanswered == 1 # The reply to the lost record may still arrive, drained before the next send
+    projector.client_socket.close()
+    responder.close()
+
+
+def test_drain_keeps_the_socket_blocking(responder):
+    projector = Projector('127.0.0.1', responder.port, responder.port, timeout=1)
+    timeout = projector.client_socket.gettimeout()
+
+    # A late reply waiting on the socket
+    projector.client_socket.sendto(records.RequestInumSize().bytes(), ('127.0.0.1', responder.port))
+    projector.unanswered = 1
+    time.sleep(0.05)
+    projector.drain()
+
+    # The image data loops share the socket, a non-blocking sendto could fail mid-upload
+    assert projector.client_socket.gettimeout() == timeout
+
+    # Nothing waiting: no wait for the socket timeout
+    projector.unanswered = 1
+    start = time.perf_counter()
+    projector.drain()
+    assert time.perf_counter() - start < 0.01
+    assert projector.send_record(records.RequestInumSize()) == ("Inum size: 1080", 1080)
+    projector.client_socket.close()
+
+
+def test_replies_to_other_records_are_discarded(responder):
+    metrics = Registry()
+    projector = Projector('127.0.0.1', responder.port, responder.port, timeout=1, metrics=metrics)
+    projector.send(records.SetInumSize(1080).bytes())
+
+    # A late reply to a RequestImageType that timed out, waiting on the socket
+    late = records.RequestImageType.REPLY_STRUCT.pack(records.RequestImageType.REPLY_STRUCT.size,
+                                                      records.RequestImageType.REC_ID + records.REPLY_OFFSET, 4)
+    responder.socket.sendto(late, projector.client_socket.getsockname())
+    time.sleep(0.05)
+
+    assert projector.send_record(records.RequestInumSize()) == ("Inum size: 1080", 1080)
+    assert metrics.counter("replies_discarded_total", record="RequestImageType").value == 1
+    projector.client_socket.close()
+
+
+def test_send_retries_idempotent_records():
+    responder = Responder(drop={0, 1})
+    metrics = Registry()
+    projector = Projector('127.0.0.1', responder.port, responder.port, timeout=0.02, metrics=metrics)
+
+    assert projector.send_record(records.RequestInumSize()) == ("Inum size: 1080", 1080)
+    assert len(responder.received) == 3
+    assert metrics.histogram("control_rtt_seconds", record="RequestInumSize").count == 1
+    assert metrics.counter("retransmits_total", record="RequestInumSize").value == 2
+
+    # Image data is never sent twice
+    with pytest.raises(ProjectorTimeout):
+        responder.drop.add(3)
+        projector.send(records.LoadImageData(1, 0, 0, b'\x00' * 4).bytes())
+    assert len(responder.received) == 4
+    assert projector.stale
+
+    projector.client_socket.close()
+    responder.close()
+
+
+def test_reply_errors():
+    responder = Responder(errors={0: 0x2710, 2: 0x2716})
+    projector = Projector('127.0.0.1', responder.port, responder.port, timeout=1)
+
+    with pytest.raises(ProjectorReplyError) as error:
+        projector.send_record(records.SetInumSize(0))
+    assert error.value.code == 0x2710
+
+    # A batch is completed before the error is raised
+    with pytest.raises(ProjectorReplyError):
+        projector.send_batch([records.SetImageType(4), b'\x00\x06\x00\x69\x00\x01', records.SetImageType(5)])
+    assert len(responder.received) == 4
+
+    projector.client_socket.close()
+    responder.close()
@@ -0,0 +1,54 @@
+"""
+Tests for the record codec.
+"""
+
+import pytest
+from lux4600 import records
+
+
+def test_encode():
+    assert records.SetSequencerRegister(0, 19440).bytes() == b'\x00\x08\x00\x6e\x00\x00\x4b\xf0'
+    assert records.SetSequencerRegister(1, -1).bytes() == b'\x00\x08\x00\x6e\x00\x01\xff\xff'
+    assert records.SetSequencerState(2, True).bytes() == b'\x00\x06\x00\x6a\x02\x01'
+    assert records.RequestInumSize().bytes() == b'\x00\x04\x01\x2e'
+
+    record = records.LoadImageData(1, 2, 3, b'\xaa\xbb\xcc\xdd')
+    assert record.bytes() == b'\x00\x0e\x00\x68\x00\x01\x00\x02\x00\x03\xaa\xbb\xcc\xdd'
+    assert record.tot_size == 14 and record.rec_id == 104
+
+    buffer = bytearray(20)
+    assert record.pack_into(buffer, 2) == 14
+    assert buffer[2:16] == record.bytes()
+
+    with pytest.raises(ValueError):
+        records.LoadImageData(0, 0, 0, b'\x00')
+    with pytest.raises(ValueError):
+        records.SetLedDriverAmplitude(0, 4096)
+
+
+def test_records_have_no_dict():
+    assert not hasattr(records.SetInumSize(1080), '__dict__')
+    assert records.RECORDS[102] is records.SetInumSize
+
+
+def test_reply():
+    assert records.SetInumSize(1080).reply(b'\x00\x06\x01\xf5\x00\x00') == ("OK", -1)
+    assert records.SetInumSize(0).reply(b'\x00\x06\x01\xf5\x27\x10') == ("Invalid inum size", -1)
+    assert records.RequestInumSize().reply(b'\x00\x06\x01\xf6\x04\x38') == ("Inum size: 1080", 1080)
+    assert records.RequestFlatnessMaskOn().reply(b'\x00\x05\x02\x24\x01') == ("Flatness mask is on", True)
+
+    # A reply to another request is rejected
+    assert records.RequestImageType().reply(b'\x00\x06\x01\xf6\x04\x38')[1] == -1
+
+    message, data = records.RequestLedTemperature(0).reply(b'\x00\x0b\x02\x17\x00\x00\x01\x90\x00\x50\x01')
+    assert data == {"led_no": 0, "led_temp": 40.0, "board_temp": 40.0, "read_ok": "1"}
+
+
+def test_decode():
+    assert records.decode(b'\x00\x06\x01\xf5\x00\x00') == ("OK", 0)
+    assert records.decode(b'\x00\x06\x01\xf5\x27\x15') == ("Unknown record id (rec_id) received", 0x2715)
+    assert records.decode(b'\x00\x07\x01\xff\x00\x00\x05') == ("No sequence number error since last request", None)
+    assert records.decode(b'\x00\x07\x01\xff\x01\x00\x05')[1] == 5
+    assert records.decode(b'\x00\x08\x01\xfe\x00\x03\x00\x10') == ("Sequencer register: 3, value: 16", (3, 16))
+    assert records.decode(b'\x00\x06\x7f\xff\x00\x00')[1] == -1
+    assert records.decode(b'\x00')[1] == -1
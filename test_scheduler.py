@@ -0,0 +1,83 @@
+"""
+Tests for the pipelined layer scheduler.
+"""
+
+import time
+import pytest
+from axes import MockAxes, VirtualAxes, KINEMATICS
+from lux4600.metrics import Registry
+from lux4600.scheduler import Layer, LayerScheduler
+
+
+def sleeper(seconds, result=None):
+    def stage(*args):
+        time.sleep(seconds)
+        return result
+    return stage
+
+
+def test_stages_overlap_and_respect_dependencies():
+    axes = MockAxes()
+    exposed = []
+
+    def recoat(axes, height):
+        time.sleep(0.1)
+        axes.increment_layer(height)
+
+    def expose(index):
+        def stage(projector, axes, data):
+            assert data == index
+            exposed.append(axes.get_position("Z"))
+            time.sleep(0.05)
+        return stage
+
+    layers = [Layer(prepare=sleeper(0.05, i), upload=sleeper(0.05), load=sleeper(0.05), expose=expose(i)) for i in range(4)]
+    scheduler = LayerScheduler(None, axes, 0.4, recoat=recoat, metrics=Registry())
+    timings = scheduler.run_sync(layers)
+
+    assert exposed == pytest.approx([0, -0.4, -0.8, -1.2])
+
+    for previous, timing in zip(timings, timings[1:]):
+        expose_start = timing.stages["expose"][0]
+        assert expose_start >= timing.stages["recoat"][1] and expose_start >= timing.stages["load"][1]
+        assert timing.stages["upload"][0] >= previous.stages["expose"][1]
+        assert timing.stages["recoat"][0] >= previous.stages["expose"][1]
+
+    # Recoat runs alongside upload and load, and preprocessing ahead of the exposure
+    assert scheduler.wall_seconds() < 0.75 * scheduler.serial_seconds()
+    assert scheduler.metrics.histogram("layer_gap_seconds").count == 3
+
+
+def test_error_cancels_remaining_layers():
+    def fail(projector, data):
+        raise RuntimeError("Out of sequence packet")
+
+    exposed = []
+    layers = [Layer(expose=lambda projector, axes, data: exposed.append(1)), Layer(upload=fail), Layer(expose=lambda *args: exposed.append(3))]
+
+    with pytest.raises(RuntimeError):
+        LayerScheduler(None, MockAxes(), 0.4).run_sync(layers)
+
+    assert exposed == [1]
+
+
+def test_predicts_overlap_with_virtual_axes():
+    axes = VirtualAxes()
+
+    def expose(projector, axes, data):
+        axes.scroll(1.8, 1.8) # 1 s each way
+        axes.scroll(-1.8, 1.8)
+
+    layers = [Layer(upload=sleeper(0.3), expose=expose) for _ in range(4)]
+    scheduler = LayerScheduler(None, axes, 0.4, metrics=Registry())
+    timings = scheduler.run_sync(layers)
+
+    scroll = 2 * KINEMATICS["Y"].duration(1.8, 1.8)
+    recoat = KINEMATICS["Z"].duration(0.4, 0.5)
+    pipelined = 0.3 + scroll + 3 * (max(recoat, 0.3) + scroll)
+
+    # The upload of each layer overlaps the recoat, which is only skipped once the upload is done
+    assert axes.clock.now() == pytest.approx(pipelined, abs=0.1)
+    assert scheduler.wall_seconds() == pytest.approx(pipelined, abs=0.1)
+    assert scheduler.serial_seconds() > pipelined + 0.8
+    assert all(timing.duration("recoat") == pytest.approx(recoat, abs=0.05) for timing in timings[1:])
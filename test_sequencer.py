@@ -0,0 +1,99 @@
+"""
+Tests for loading and parametrizing sequence files.
+"""
+
+import pytest
+from lux4600.seq import Sequencer, SequencerValueError, Program, scroll_program, static_program
+from lux4600.records import SetSequencerRegister
+
+
+def test_variables():
+    sequencer = Sequencer("test/test-seq/2880x3240_gs6_R.txt", 1440, variables={"TotalRows": 2160})
+    assert b"AssignVar       TotalRows   2160" in sequencer.file
+
+
+def test_registers():
+    sequencer = Sequencer("test/test-seq/2880x3240_gs6_R.txt", 1440, registers={"Inum": 0})
+
+    assert b"AssignVarReg       Inum        0" in sequencer.file
+    assert b"AssignVar       Inum" not in sequencer.file
+    assert sequencer.register_values({"Inum": 1}) == {0: 1}
+
+    with pytest.raises(SequencerValueError):
+        Sequencer("test/test-seq/2880x3240_gs6_R.txt", 1440, registers={"Missing": 0})
+
+
+def test_set_sequencer_register_record():
+    assert SetSequencerRegister(0, 19440).bytes() == b'\x00\x08\x00\x6e\x00\x00\x4b\xf0'
+    assert SetSequencerRegister(11, -1).bytes()[-2:] == b'\xff\xff'
+    assert SetSequencerRegister(1, 32767).bytes()[-2:] == b'\x7f\xff'
+
+    with pytest.raises(ValueError):
+        SetSequencerRegister(12, 0)
+
+    with pytest.raises(ValueError):
+        SetSequencerRegister(0, 32768) # Signed 16-bit registers, would become negative
+
+
+def test_optimize_waitfor():
+    program = static_program()
+    reset, load = [c for c in program.commands if c.timed]
+
+    # Reset -> load: 50 ticks, load -> reset: 1080 rows * 40 ns = 173 ticks (LoadRow, Jump, Label, Trig)
+    assert reset.waitfor + 1 == 50
+    assert load.waitfor + 3 == 173
+    assert program.frame_ticks() == 223
+
+    masked = static_program(mask=True)
+    assert [c for c in masked.commands if c.timed][1].waitfor + 3 == 201
+
+
+def test_optimize_shortest_path():
+    program = Program()
+    program.add("Label", "start")
+    load = program.add("LoadRow", "A", "B", "C", "D", rows=1080)
+    program.add("JumpIf", "A", "<", "B", "start") # 1 tick back to the load
+    program.add("AssignVar", "A", 0, waitfor=100)
+    program.add("ResetGlobal")
+    program.add("Jump", "start")
+    program.optimize()
+
+    assert load.waitfor == 173 - 2
+
+
+def test_scroll_program():
+    program = scroll_program(4320, factor=4, registers={"Inum": 0})
+    text = program.text()
+
+    assert "AssignVarReg    Inum 0" in text
+    assert "AssignVar       EndRow 3241" in text
+    assert len(program.sequencer().packets) <= 20
+
+    with pytest.raises(SequencerValueError):
+        scroll_program(1000)
+    with pytest.raises(SequencerValueError):
+        scroll_program(4320, direction="sideways")
+
+
+def test_validate():
+    with pytest.raises(SequencerValueError, match="Line 2: variable 'X'"):
+        Sequencer.from_text("Label start 1\nAdd X 1 1\nJump start 1\n")
+
+    with pytest.raises(SequencerValueError, match="DeclareLabel"):
+        Sequencer.from_text("AssignVar A 0 1\nJumpIf A < A later 1\nLabel later 1\nJump later 1\n")
+
+    with pytest.raises(SequencerValueError, match="last line"):
+        Sequencer.from_text("AssignVar A 0 1\n")
+
+
+def test_compact_packets():
+    sequencer = Sequencer("test/test-seq/Frame_Display_8bit.seq", 1440)
+    loose = Sequencer("test/test-seq/Frame_Display_8bit.seq", 1440, compact=False)
+
+    assert len(sequencer.packets) < len(loose.packets)
+    assert b"#" not in b"".join(sequencer.packets)
+
+    # Packets honour the chunk size and are cached by content
+    small = Sequencer("test/test-seq/Frame_Display_8bit.seq", 512)
+    assert max(len(p) for p in small.packets) == 512 + 10
+    assert Sequencer("test/test-seq/Frame_Display_8bit.seq", 512).packets == small.packets
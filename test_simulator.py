@@ -0,0 +1,102 @@
+"""
+End-to-end tests of the Projector class against the projector simulator.
+"""
+
+import pytest
+from PIL import Image, ImageDraw
+from lux4600 import records
+from lux4600.img import Strip
+import time
+from lux4600.projector import Projector, ProjectorReplyError, ProjectorRegisterError
+from lux4600.simulator import ack, OK
+from lux4600.seq import Sequencer, scroll_program
+
+
+@pytest.fixture
+def projector(simulator):
+    projector = Projector('127.0.0.1', simulator.port, simulator.image_data_port)
+    yield projector
+    projector.client_socket.close()
+
+
+def pattern(rows):
+    image = Image.new('1', (1920, rows))
+    draw = ImageDraw.Draw(image)
+    for y in range(0, rows, 10):
+        draw.line((0, y, 1919, y), fill=1)
+    draw.rectangle((100, 5, 400, rows - 5), fill=1)
+    return image
+
+
+def test_check_connection(simulator, projector):
+    assert projector.check_connection()
+    assert projector.state.values[(records.SetInumSize.REC_ID,)] == (1080,)
+
+
+def test_send_strip(simulator, projector):
+    strip = Strip(pattern(120), 2)
+    projector.send_strip(strip, lines_per_packet=6)
+
+    assert simulator.inum_size == 120 and simulator.image_type == 4
+    assert not simulator.reset
+    assert simulator.image(2).tobytes() == strip.image.tobytes()
+
+
+def test_send_spanning_strip(simulator, projector):
+    strip = Strip(pattern(100), 0, inum_size=30)
+    projector.send_strip(strip, lines_per_packet=5)
+
+    assert simulator.image(0, 100).tobytes() == strip.image.tobytes()
+
+
+def test_sequencer(simulator, projector):
+    program = scroll_program(1200, direction="forward")
+    projector.send_sequencer(Sequencer.from_text(program.text()))
+    projector.restart_sequencer({0: 5})
+
+    assert simulator.sequence_file == program.compact()
+    assert simulator.running and not simulator.reset
+    assert simulator.registers[0] == 5
+
+
+def test_registers_are_read_back(simulator, projector):
+    projector.set_sequencer_registers({0: 1, 3: -2})
+    assert simulator.registers[:4] == [1, 0, 0, -2]
+
+    # A firmware that acknowledges the write without setting the register
+    simulator.handlers[records.SetSequencerRegister.REC_ID] = lambda values: ack(OK)
+
+    with pytest.raises(ProjectorRegisterError):
+        projector.restart_sequencer({0: 5})
+
+
+def test_reply_errors(simulator, projector):
+    with pytest.raises(ProjectorReplyError):
+        projector.send_record(records.SetImageType(9))
+
+    # The mirror is not updated by a failed record
+    projector.send_record(records.SetImageType(5))
+    assert simulator.image_type == 5
+
+
+def test_power_cycle_is_detected(simulator, projector):
+    projector.set_led_amplitude(1500)
+    assert projector.resync()
+
+    simulator.power_cycle()
+    assert not projector.resync()
+    projector.set_led_amplitude(1500)
+    assert simulator.amplitude[0] == 1500
+
+
+def test_paced_jumbo_upload(simulator):
+    projector = Projector('127.0.0.1', simulator.port, simulator.image_data_port, pacing=2e6, max_packet_size=8972)
+
+    start = time.perf_counter()
+    projector.send_strip(Strip(pattern(360), 0), lines_per_packet=36)
+
+    # 360 rows of 240 bytes at 2 MB/s
+    assert time.perf_counter() - start >= 360 * 240 / 2e6 * 0.9
+    assert simulator.received[records.LoadImageData.REC_ID] == 10
+    assert simulator.image(0, 360).tobytes() == pattern(360).tobytes()
+    projector.client_socket.close()
@@ -0,0 +1,47 @@
+"""
+Tests for images spanning consecutive inums.
+"""
+
+from PIL import Image
+from lux4600.img import Strip, SPAN_INUM_ROWS
+from lux4600.seq import split_rows, spanning_scroll_program, Sequencer
+
+
+def parse_packet(packet):
+    """Return (tot_size, seq_no, inum, offset, data) of an image data packet."""
+    return (int.from_bytes(packet[0:2], 'big'), int.from_bytes(packet[4:6], 'big'),
+            int.from_bytes(packet[6:8], 'big'), int.from_bytes(packet[8:14], 'big'), packet[14:])
+
+
+def test_default_inum_size():
+    assert Strip(Image.new('1', (64, 38880)), 0).num_inums == 1
+    assert Strip(Image.new('1', (64, 70000)), 0).inum_size == SPAN_INUM_ROWS
+    assert Strip(Image.new('1', (64, 70000)), 0).num_inums == 3
+
+
+def test_packets_split_at_inum_boundaries():
+    image = Image.new('1', (64, 50))
+    image.paste(1, (0, 30, 64, 50)) # rows 30-49 are white
+    strip = Strip(image, 4, inum_size=30)
+
+    packets = [parse_packet(p) for p in strip.to_packets(5)]
+
+    assert len(packets) == 10
+    assert [p[1] for p in packets] == list(range(10))
+    assert [(p[2], p[3]) for p in packets[5:7]] == [(4, 25), (5, 0)]
+    assert packets[5][4] == b'\x00' * 40 and packets[6][4] == b'\xff' * 40
+    assert all(p[0] == 14 + 40 for p in packets)
+
+
+def test_split_rows():
+    assert split_rows(100, 1080, 2, 32760) == [(0, 1080, 2, 100)]
+    assert split_rows(32000, 1080, 0, 32760) == [(0, 760, 0, 32000), (760, 320, 1, 0)]
+    assert split_rows(40000, 1080, 0, 32760) == [(0, 1080, 1, 7240)]
+
+
+def test_spanning_scroll_program():
+    text = spanning_scroll_program(20000 * 4, factor=1, inum=0)
+    sequencer = Sequencer.from_text(text)
+
+    assert "AssignVar       EndInum 2" in text
+    assert len(sequencer.packets) <= 20
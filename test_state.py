@@ -0,0 +1,58 @@
+"""
+Tests for the projector state mirror.
+"""
+
+from lux4600 import records
+from lux4600.state import ProjectorState, state_key
+
+
+def test_state_key():
+    assert state_key(records.SetInumSize(1080)) == ((102,), (1080,))
+    assert state_key(records.SetSequencerState(2, True)) == ((106, 2), (1,))
+    assert state_key(records.SetLedDriverAmplitude(0, 1500)) == ((133, 0), (1500,))
+    assert state_key(records.RequestInumSize()) is None
+
+
+def test_redundant_setters_are_skipped():
+    state = ProjectorState()
+
+    assert state.needed(records.SetImageType(4))
+    state.apply(records.SetImageType(4))
+    assert not state.needed(records.SetImageType(4))
+    assert state.needed(records.SetImageType(5))
+
+    # Sequencer run and reset flags are mirrored separately
+    state.apply(records.SetSequencerState(1, False))
+    assert state.needed(records.SetSequencerState(2, False))
+    assert not state.needed(records.SetSequencerState(1, False))
+
+    # Requests are always sent
+    assert state.needed(records.RequestImageType())
+
+    # Actions are always sent, e.g. the sequence number reset before every upload
+    state.apply(records.ResetSeqNo())
+    assert state.needed(records.ResetSeqNo())
+
+    state.invalidate()
+    assert state.needed(records.SetImageType(4))
+
+
+def test_observe_detects_changes():
+    state = ProjectorState()
+
+    assert state.observe((102,), (1080,))
+    assert state.observe((102,), (1080,))
+    assert not state.observe((102,), (3240,))
+    assert not state.needed(records.SetInumSize(3240))
+
+
+
+def test_pending_values_of_a_batch():
+    state = ProjectorState()
+    state.apply(records.SetSequencerState(2, False))
+
+    # Reset and release in one batch: the release is needed although the mirror shows it in effect
+    pending = {}
+    assert state.needed(records.SetSequencerState(2, True), pending)
+    assert state.needed(records.SetSequencerState(2, False), pending)
+    assert not state.needed(records.SetSequencerState(2, False), pending)
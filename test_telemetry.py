@@ -0,0 +1,63 @@
+"""
+Tests for the telemetry poller.
+"""
+
+import time
+import numpy as np
+from lux4600.telemetry import RingBuffer, TelemetryPoller, CHANNELS
+
+
+class Replies:
+    '''Answers the telemetry requests like a projector at 40 °C.'''
+
+    def __init__(self):
+        self.calls = 0
+
+    def send_batch(self, requests, check=True):
+        self.calls += 1
+        return [
+            ("", {"led_no": 0, "led_temp": 40.0, "board_temp": 30.0, "read_ok": "1"}),
+            ("", (0, "00000011", "1")),
+            ("", (0, 1500, "1")),
+            ("OK", -1), # e.g. a ReplyAck error
+        ]
+
+
+def test_ring_buffer_wraps():
+    buffer = RingBuffer(4, channels=("a",))
+
+    for i in range(6):
+        buffer.append(i, [i * 10])
+
+    history = buffer.history()
+    assert history["time"].tolist() == [2, 3, 4, 5]
+    assert history["a"].tolist() == [20, 30, 40, 50]
+
+
+def test_sample():
+    poller = TelemetryPoller(Replies(), size=8)
+    latest = poller.sample()
+
+    assert latest["led_temp"] == 40.0 and latest["board_temp"] == 30.0
+    assert latest["led_status"] == 3 and latest["amplitude"] == 1500
+    assert np.isnan(latest["sequencer_running"])
+    assert poller.history()["led_temp"].tolist() == [40.0]
+
+
+def test_background_polling(tmp_path):
+    projector = Replies()
+
+    with TelemetryPoller(projector, period=0.01, size=4) as poller:
+        time.sleep(0.1)
+
+    assert projector.calls >= 4
+    assert len(poller.history()["time"]) == 4
+
+    poller.dump(tmp_path / "telemetry.csv")
+    header = (tmp_path / "telemetry.csv").read_text().splitlines()[0]
+    assert header == ",".join(("time",) + CHANNELS)
+
+    rows = np.loadtxt(tmp_path / "telemetry.csv", delimiter=",", skiprows=1)
+    assert rows.shape == (4, len(CHANNELS) + 1)
+    assert (rows[:, 1 + CHANNELS.index("led_temp")] == 40.0).all()
+    assert np.allclose(rows[:, 0], poller.history()["time"])
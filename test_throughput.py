@@ -0,0 +1,32 @@
+"""
+Tests for the upload throughput sweep against the projector simulator.
+"""
+
+from throughput import synthetic_strip, configurations, sweep, best
+
+
+def test_configurations_fit_mtu():
+    configs = list(configurations([6, 36], [1500, 9000], [0], ["raw", "rle"]))
+
+    assert [(c["encoding"], c["mtu"], c["lines_per_packet"]) for c in configs] == [
+        ("raw", 1500, 6), ("raw", 9000, 6), ("raw", 9000, 36), ("rle", None, 1)]
+
+
+def test_synthetic_strip_density():
+    image = synthetic_strip(1080, density=0.25, feature=8)
+    white = sum(image.convert('L').histogram()[255:])
+
+    assert image.mode == '1' and image.size == (1920, 1080)
+    assert 0.2 < white / (1920 * 1080) < 0.3
+
+
+def test_sweep_simulator(simulator):
+    results = sweep(("127.0.0.1", simulator.port, simulator.image_data_port), synthetic_strip(120),
+                    configurations([4, 6], [1500], [0], ["raw"]), simulator=simulator)
+
+    results += sweep(("127.0.0.1", simulator.port, simulator.image_data_port), synthetic_strip(120),
+                     configurations([4], [1500], [0], ["rle"]), simulator=simulator)
+
+    assert [result["packets"] for result in results] == [30, 20, 120]
+    assert all(result["error"] is None and result["loss"] == 0 for result in results)
+    assert best(results) in results
@@ -0,0 +1,73 @@
+"""
+Tests for the stage span tracer.
+"""
+
+import json
+import pstats
+from PIL import Image
+from lux4600.tracing import Tracer, TRACER, DISABLED
+from lux4600.img import Strip
+from lux4600.projector import Projector
+from lux4600.simulator import ProjectorSimulator
+
+
+def test_disabled_records_nothing():
+    tracer = Tracer()
+
+    @tracer.traced()
+    def stage():
+        return 1
+
+    assert tracer.span("layer") is DISABLED
+    assert stage() == 1
+    assert tracer.events == []
+
+
+def test_nested_spans(tmp_path):
+    tracer = Tracer()
+    tracer.enable()
+
+    @tracer.traced("encode")
+    def encode():
+        return 1
+
+    with tracer.span("layer", layer=3):
+        encode()
+        encode()
+
+    encode_event, _, layer = tracer.events
+    assert layer["name"] == "layer" and layer["args"] == {"layer": "3"} and layer["ph"] == "X"
+    assert layer["ts"] <= encode_event["ts"] and encode_event["ts"] + encode_event["dur"] <= layer["ts"] + layer["dur"]
+    assert list(tracer.totals()) == ["layer", "encode"]
+
+    tracer.write_chrome_trace(tmp_path / "trace.json")
+    trace = json.loads((tmp_path / "trace.json").read_text())
+    assert [event["ph"] for event in trace["traceEvents"]] == ["M", "X", "X", "X"]
+
+
+def test_profile_outermost_spans(tmp_path):
+    tracer = Tracer()
+    tracer.enable(profile=True)
+
+    with tracer.span("outer"):
+        with tracer.span("inner"):
+            sum(range(1000))
+
+    assert [name for name, _ in tracer.profiles] == ["outer"]
+    path, = tracer.write_profiles(tmp_path)
+    assert pstats.Stats(path).total_calls > 0
+
+
+def test_upload_stages():
+    TRACER.enable()
+    try:
+        with ProjectorSimulator() as simulator:
+            projector = Projector('127.0.0.1', simulator.port, simulator.image_data_port)
+            projector.send_strip(Strip(Image.new('1', (1920, 60)), 0))
+            projector.client_socket.close()
+
+        names = [event["name"] for event in TRACER.events]
+        assert names == ["strip_init", "strip_data", "strip_verify", "projector.send_strip"]
+    finally:
+        TRACER.disable()
+        TRACER.clear()
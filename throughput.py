@@ -0,0 +1,185 @@
+import argparse
+import itertools
+import json
+import logging
+import time
+import numpy as np
+from PIL import Image
+from lux4600.projector import Projector, ProjectorError
+from lux4600.img import Strip, MAX_PACKET_SIZE
+from lux4600.metrics import Registry
+from lux4600.simulator import ProjectorSimulator
+from lux4600.netem import Relay, PRESETS
+
+#
+# End-to-end upload throughput sweep.
+# Uploads synthetic strips through Projector for every combination of lines per packet, MTU, pacing rate
+# and raw or RLE encoding, and reports the throughput, loss and wall time of each, e.g.
+#
+#   python throughput.py                                    (local simulator)
+#   python throughput.py --impairment congested             (local simulator behind netem.Relay)
+#   python throughput.py --ip 192.168.0.10 --mtu 1500 9000  (projector)
+#
+
+IP_UDP_HEADER = 28 # bytes of IPv4 and UDP headers in every datagram
+BYTES_PER_LINE = 1920 // 8
+STRIP_HEADER = 14 # header of a 1-bit image data packet, see Strip.get_packet
+
+
+def synthetic_strip(rows:int, density:float=0.3, feature:int=16, seed:int=0, width:int=1920) -> Image.Image:
+    """
+    A 1-bit test strip of random square features.
+
+    Args:
+        rows (int): The height of the strip.
+        density (float): The fraction of white pixels.
+        feature (int): The size of the features in pixels. 1 is pixel noise, the worst case for RLE.
+        seed (int): Seed of the pattern.
+    """
+    rng = np.random.default_rng(seed)
+    blocks = rng.random((-(-rows // feature), -(-width // feature))) < density
+    pixels = np.kron(blocks, np.ones((feature, feature), dtype=bool))[:rows, :width]
+    return Image.fromarray(pixels.astype(np.uint8) * 255, 'L').convert('1')
+
+
+def configurations(lines_per_packet:list, mtus:list, rates:list, encodings:list):
+    '''
+    Yield the configurations swept. Lines per packet and MTU only apply to raw strips, lines must fit the MTU.
+    RLE uploads send one encoded row per packet whatever the MTU, so they are swept once per rate with mtu None.
+    '''
+
+    for encoding in encodings:
+
+        if encoding == "rle":
+            for rate in rates:
+                yield {"encoding": "rle", "mtu": None, "rate": rate, "lines_per_packet": 1}
+            continue
+
+        for mtu, rate, lines in itertools.product(mtus, rates, lines_per_packet):
+            if STRIP_HEADER + lines * BYTES_PER_LINE <= mtu - IP_UDP_HEADER:
+                yield {"encoding": "raw", "mtu": mtu, "rate": rate, "lines_per_packet": lines}
+
+
+def upload(projector:Projector, image:Image.Image, config:dict, simulator:ProjectorSimulator=None) -> dict:
+    '''Upload image in one configuration and return the measurements. Loss is only known with the simulator.'''
+
+    lines = config["lines_per_packet"]
+    rows = -(-image.height // lines) * lines # Pad to whole packets
+    if rows != image.height:
+        padded = Image.new('1', (image.width, rows))
+        padded.paste(image, (0, 0))
+        image = padded
+
+    received = simulator.received.get(104, 0) if simulator else None
+    error = None
+    start = time.perf_counter()
+
+    try:
+        if config["encoding"] == "rle":
+            projector.send_image_rle(image, image.width, image.height)
+        else:
+            projector.send_strip(Strip(image, 0), lines)
+    except (ProjectorError, RuntimeError) as e:
+        error = str(e)
+
+    wall = time.perf_counter() - start
+
+    metrics = projector.metrics
+    packets = metrics.counter("packets_sent_total", port="image").value
+    result = dict(config, wall_seconds=wall, packets=packets,
+                  bytes=metrics.counter("bytes_sent_total", port="image").value,
+                  megabytes_per_second=metrics.gauge("upload_megabytes_per_second").value,
+                  packets_per_second=metrics.gauge("upload_packets_per_second").value,
+                  loss=None, error=error)
+
+    if simulator is not None and packets:
+        time.sleep(0.05) # Let the simulator drain its receive buffer
+        result["loss"] = 1 - (simulator.received.get(104, 0) - received) / packets
+
+    return result
+
+
+def sweep(address:tuple, image:Image.Image, configs, repeat:int=1, simulator:ProjectorSimulator=None) -> list[dict]:
+    '''Upload image to the projector at address in every configuration, repeat times each.'''
+
+    results = []
+
+    for config in configs:
+        for _ in range(repeat):
+
+            max_packet_size = config["mtu"] - IP_UDP_HEADER if config["mtu"] else MAX_PACKET_SIZE
+            projector = Projector(*address, metrics=Registry(), max_packet_size=max_packet_size,
+                                  pacing=config["rate"] * 1e6 if config["rate"] else None)
+            try:
+                result = upload(projector, image, config, simulator)
+            finally:
+                projector.client_socket.close()
+
+            results.append(result)
+            loss = "-" if result["loss"] is None else f"{result['loss']:.2%}"
+            print(f"{result['encoding']:4} mtu={result['mtu'] or '-':>5} rate={result['rate'] or '-':>5} lines={result['lines_per_packet']:2} "
+                  f"{result['megabytes_per_second']:8.1f} MB/s {result['packets_per_second']:9.0f} packets/s "
+                  f"loss={loss:>6} wall={result['wall_seconds']:6.2f} s {result['error'] or ''}")
+
+    return results
+
+
+def best(results:list[dict]) -> dict | None:
+    '''Return the fastest upload without errors or loss, by wall time.'''
+
+    ok = [result for result in results if not result["error"] and not result["loss"]]
+    return min(ok, key=lambda result: result["wall_seconds"]) if ok else None
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Sweep the upload settings of a LUX4600 projector.")
+    parser.add_argument("--ip", help="Projector address. Without it, a local simulator is started")
+    parser.add_argument("--port", type=int, default=52985)
+    parser.add_argument("--image-data-port", type=int, default=52986)
+    parser.add_argument("--impairment", choices=PRESETS, help="Relay the simulator traffic through netem.Relay")
+    parser.add_argument("--rows", type=int, default=3240)
+    parser.add_argument("--density", type=float, default=0.3, help="Fraction of white pixels")
+    parser.add_argument("--feature", type=int, default=16, help="Feature size in pixels, 1 for noise")
+    parser.add_argument("--lines-per-packet", type=int, nargs="+", default=[1, 2, 3, 4, 5, 6])
+    parser.add_argument("--mtu", type=int, nargs="+", default=[1500])
+    parser.add_argument("--rate", type=float, nargs="+", default=[0], help="Pacing rates in MB/s, 0 for none")
+    parser.add_argument("--encoding", choices=("raw", "rle"), nargs="+", default=["raw", "rle"])
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--json", help="Write the results to this JSON file")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format="%(message)s")
+
+    image = synthetic_strip(args.rows, args.density, args.feature)
+    configs = list(configurations(args.lines_per_packet, args.mtu, args.rate, args.encoding))
+
+    simulator = relay = None
+
+    if args.ip:
+        address = (args.ip, args.port, args.image_data_port)
+    else:
+        simulator = ProjectorSimulator().start()
+        address = ("127.0.0.1", simulator.port, simulator.image_data_port)
+
+        if args.impairment:
+            relay = Relay(*address, impairment=args.impairment).start()
+            address = ("127.0.0.1", relay.port, relay.image_data_port)
+
+    try:
+        results = sweep(address, image, configs, args.repeat, simulator)
+    finally:
+        if relay is not None:
+            relay.close()
+        if simulator is not None:
+            simulator.close()
+
+    fastest = best(results)
+    if fastest:
+        print(f"\nFastest: {fastest['encoding']}, mtu={fastest['mtu'] or '-'}, rate={fastest['rate'] or 'unpaced'}, "
+              f"lines_per_packet={fastest['lines_per_packet']} ({fastest['wall_seconds']:.2f} s)")
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
@@ -5,6 +5,15 @@ from lux4600.seq import Sequencer
 from lux4600.grayscale import split_image, multiply_image, stitch_images
 from PIL import Image
 import time, sys
+import logging
+
+logging.basicConfig(level=logging.INFO, format="%(message)s") # Upload progress, see lux4600.projector
+
+import argparse
+parser = argparse.ArgumentParser(description="Print the layers of a grayscale image.")
+parser.add_argument("--virtual", action="store_true",
+                    help="Print on simulated axes and a projector simulator (axes.VirtualAxes, lux4600.simulator), no hardware needed")
+args = parser.parse_args()
 
 '''
 Author: David Alexander
@@ -110,13 +119,18 @@ def preprocess_grayscale_image(filepath):
     return grayscale_strip
 
 # Step 5: Upload the stitched image to the projector
-projector = Projector(IP, DATA_PORT, IMAGE_DATA_PORT)
+if args.virtual:
+    from lux4600.simulator import ProjectorSimulator
+    simulator = ProjectorSimulator().start()
+    projector = Projector("127.0.0.1", simulator.port, simulator.image_data_port)
+else:
+    projector = Projector(IP, DATA_PORT, IMAGE_DATA_PORT)
 
 projector.check_connection()
 
 # Comment this out if image has already been uploaded since 
 # the projector was last powered on to save time.
-grayscale_strip = preprocess_grayscale_image()
+grayscale_strip = preprocess_grayscale_image(r"test\test-dogbone\2880x3240_dogbone_VERT.bmp")
 projector.send_strip(grayscale_strip)
 
 # Step 6: Create the sequencer files for left and right strips
@@ -129,8 +143,11 @@ sequencers = [
 import axes
 from zaber_motion import Units, wait_all
 
-input("Press Enter to start the projector and axes...")
-zaber_axes = axes.ZaberAxes("COM3")
+if args.virtual:
+    zaber_axes = axes.VirtualAxes() # Moves take no time, zaber_axes.clock.now() is the simulated time
+else:
+    input("Press Enter to start the projector and axes...")
+    zaber_axes = axes.ZaberAxes("COM3")
 # zaber_axes.home()
 
 Z_START = 150 # mm, initial z position
@@ -146,7 +163,16 @@ LAYERS = 6
 
 # Set LED driver amplitude to 1500 (0 TO 4095)
 # Ensure water cooling system is functional if amplitude > 100
-projector.send(records.SetLedDriverAmplitude(0, 1500).bytes())
+projector.set_led_amplitude(1500)
+
+# Monitor the LED and board temperature during the print
+from lux4600.telemetry import TelemetryPoller
+telemetry = TelemetryPoller(projector, period=1.0)
+telemetry.start()
+
+# Record a timeline of the stages of each layer, open trace.json in chrome://tracing or ui.perfetto.dev
+from lux4600.tracing import TRACER
+TRACER.enable()
 
 #
 # THESE ARE CAREFULLY CALIBRATED VALUES
@@ -157,34 +183,48 @@ SCROLLING_DIST = 23.2 # mm
 LATERAL_INCREMENT = 10 # mm
 #
 
+# The forward and return scroll of a strip, streamed as one path on the controller (see axes.stream_path).
+# The strips are separate passes because the sequencer file changes between them.
+STRIP_PATH = axes.serpentine_path(SCROLLING_DIST, SCROLLING_VELOCITY, LATERAL_INCREMENT, strips=1)
 
-for i in range(LAYERS):
+# Run the layers through the scheduler, which preprocesses and uploads the next layer while the Z axis recoats,
+# see lux4600.scheduler
+from lux4600.scheduler import Layer, LayerScheduler
 
-    print(f"Layer {i+1} out of {LAYERS}")
-
-    grayscale_strip = preprocess_grayscale_image(r"test\test-dogbone\2880x3240_dogbone_VERT.bmp")
-    projector.send_strip(grayscale_strip)  # Re-send the image to ensure no data loss
-
-    projector.send(records.SetLedDriverAmplitude(0, 1500).bytes())  # Ensure LED amplitude is set
+def load(projector, strip):
+    projector.set_led_amplitude(1500)  # Ensure LED amplitude is set, skipped if already set
+    projector.send_sequencer(sequencers[0])  # Alternate between left and right sequencers
 
+def expose(projector, zaber_axes, strip):
     zaber_axes.XAxis.move_absolute(X_START, Units.LENGTH_MILLIMETRES)
 
-    projector.send_sequencer(sequencers[0])  # Alternate between left and right sequencers
     projector.start_sequencer()
-
-    zaber_axes.scroll(SCROLLING_DIST, SCROLLING_VELOCITY)
-    zaber_axes.scroll(-SCROLLING_DIST, SCROLLING_VELOCITY)
-
+    zaber_axes.stream_path(STRIP_PATH)
     projector.stop_sequencer()
+
     zaber_axes.increment_lateral(LATERAL_INCREMENT)
     projector.send_sequencer(sequencers[1])
     projector.start_sequencer()
 
-    zaber_axes.scroll(SCROLLING_DIST, SCROLLING_VELOCITY)
-    zaber_axes.scroll(-SCROLLING_DIST, SCROLLING_VELOCITY)
+    zaber_axes.stream_path(STRIP_PATH)
     projector.stop_sequencer()
 
-    zaber_axes.increment_layer(LAYER_HEIGHT)
+layers = [Layer(prepare=lambda: preprocess_grayscale_image(r"test\test-dogbone\2880x3240_dogbone_VERT.bmp"),
+                upload=lambda projector, strip: projector.send_strip(strip),  # Re-send the image to ensure no data loss
+                load=load, expose=expose, name=f"out of {LAYERS}") for _ in range(LAYERS)]
+
+scheduler = LayerScheduler(projector, zaber_axes, LAYER_HEIGHT)
+scheduler.run_sync(layers)
+logging.info(f"Print took {scheduler.wall_seconds():.1f} s, {scheduler.serial_seconds():.1f} s with its stages one after the other")
 
 zaber_axes.ZAxis.move_absolute(30, Units.LENGTH_MILLIMETRES)
-projector.send(records.SetLedDriverAmplitude(0, 100).bytes()) # Set LED amplitude back to 100
\ No newline at end of file
+projector.set_led_amplitude(100) # Set LED amplitude back to 100
+
+telemetry.stop()
+telemetry.dump("telemetry.csv")
+projector.metrics.write_json_lines("metrics.jsonl") # Upload timings, throughput and control latencies
+TRACER.write_chrome_trace("trace.json")
+
+if args.virtual:
+    logging.info(f"Simulated motion time: {zaber_axes.clock.now():.1f} s")
+    simulator.close()